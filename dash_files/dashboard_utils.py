@@ -7,10 +7,14 @@ import pandas as pd
 from datetime import datetime
 
 
+def first_dropdown_year():
+    return datetime.now().year - 4
+
+
 def year_dropdown():
     return dcc.Dropdown(
         id="year_dropdown",
-        options=list(range(datetime.now().year - 4, datetime.now().year + 1)),
+        options=list(range(first_dropdown_year(), datetime.now().year + 1)),
         value=datetime.now().year,
         clearable=False,
     )
@@ -64,3 +68,15 @@ def aggregate_monthly_df(
         select_df = df[(df["year"] == year) & (df["quarter"] == select_quarter)]
 
     return select_df
+
+
+def period_end(month: int, year: int, agg_str: str) -> pd.Timestamp:
+    # Last day of the period aggregate_monthly_df selects, weeks count as months
+    if agg_str == "year":
+        return pd.Timestamp(year=year, month=12, day=31)
+
+    period_start = pd.Timestamp(year=year, month=month, day=1)
+    if agg_str == "quarter":
+        return period_start + pd.offsets.QuarterEnd(0)
+
+    return period_start + pd.offsets.MonthEnd(0)
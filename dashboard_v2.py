@@ -19,13 +19,22 @@ from dash_files.dashboard_utils import (
     week_dropdown,
     aggregation_radio,
     aggregate_monthly_df,
+    first_dropdown_year,
+    period_end,
 )
 from data_getters.utils import Data_Getter_Utils
+from data_getters.cache_query import Cache_Query_Engine
+from data_getters.balance_history import Balance_History
+from data_getters.finance_cube import Finance_Cube
 from data_getters.get_mint_data import Finances_Dashboard_Helpers
 from data_getters.get_exist_data import Exist_Dashboard_Helpers
 from data_getters.get_marvin_data import Marvin_Dashboard_Helpers
 from data_getters.get_manual_files import Manual_Dashboard_Helpers
 
+# Monthly averages behind the shortfall row go back to this year, however far
+# back the year dropdown goes
+HISTORICAL_START_YEAR = 2022
+
 template_name = "superhero"
 load_figure_template(template_name)
 server = flask.Flask(__name__)
@@ -40,7 +49,7 @@ app = Dash(__name__, server=server, external_stylesheets=[dbc.themes.SUPERHERO])
 )
 def monthly_finance_barchart(month: int, year: int, agg_str: str):
     filter_df = Finances_Dashboard_Helpers.create_spend_budget_df(
-        finance_df, budget_df, year, month, agg_str
+        None, budget_df, year, month, agg_str, finance_cube=finance_cube
     )
 
     filter_df["diff"] = (filter_df["total"] - filter_df["budget"]) * -1
@@ -98,16 +107,30 @@ def accounts_table(
     month: int,
     year: int,
     agg_str: str,
-    historical_start_year: int = 2022,
+    historical_start_year: int = HISTORICAL_START_YEAR,
 ):
-    pivot_account_df = pd.pivot_table(
-        account_df[["account_type", "total"]], values="total", columns=["account_type"]
-    )
-
     if agg_str == "week":
         agg_str = "month"
 
-    select_df = aggregate_monthly_df(finance_df, month, year, 0, agg_str)
+    # Balances at the end of the selected period rather than today. Periods
+    # before the first recorded ingest fall back to the latest account totals
+    as_of = period_end(month, year, agg_str)
+    if balance_history is not None and balance_history.position(as_of) >= 0:
+        pivot_account_df = (
+            balance_history.as_of(as_of)
+            .reindex(["bank", "investment", "loan"], fill_value=0.0)
+            .to_frame()
+            .T
+        )
+    else:
+        pivot_account_df = pd.pivot_table(
+            account_df[["account_type", "total"]],
+            values="total",
+            columns=["account_type"],
+            observed=True,
+        )
+
+    select_df = finance_cube.period_totals(year, month, agg_str)
 
     distinct_categories = ["paycheck", "investments", "bonus"]
 
@@ -116,6 +139,17 @@ def accounts_table(
     profit = income + spend
     budget = budget_df["budget"].sum()
 
+    # Every profit_target keystroke lands here, the what-if engine behind the
+    # rollup makes it a lookup rather than a regroup of the history
+    shortfall = Finances_Dashboard_Helpers.get_budget_shortfall(
+        None,
+        profit_target,
+        month,
+        year,
+        historical_start_year,
+        finance_cube=finance_cube,
+    )
+
     ret_df = pd.DataFrame(
         data={
             "budget": budget,
@@ -123,6 +157,7 @@ def accounts_table(
             "delta": budget - abs(spend),
             "paycheck": income,
             "savings": profit,
+            "shortfall": 0.0 if np.isnan(shortfall) else shortfall,
         },
         index=[0],
     )
@@ -140,6 +175,7 @@ def accounts_table(
         "budget",
         "delta",
         "savings",
+        "shortfall",
     ]
     final_df = pd.melt(final_df, id_vars=[], value_vars=final_cols)
 
@@ -163,15 +199,15 @@ def table_base(week_num: int, month: int, year: int, agg_str: str):
 
     agg_week_df = (
         select_df[~select_df["name"].isin(sleep_vals + ["Rating"])]
-        .groupby(["name", "positive"], as_index=False)
+        .groupby(["name", "positive"], as_index=False, observed=True)
         .agg({"value": "sum", "target": "mean", "week_count": "max"})
     )
     agg_week_df["target"] = agg_week_df["target"] * agg_week_df["week_count"]
 
     rating_df = select_df[select_df["name"] == "Rating"]
-    rating_df = rating_df.groupby(["name", "positive"], as_index=False).agg(
-        {"value": "mean", "target": "mean"}
-    )
+    rating_df = rating_df.groupby(
+        ["name", "positive"], as_index=False, observed=True
+    ).agg({"value": "mean", "target": "mean"})
     rating_df["value"] = round(rating_df["value"], 2)
 
     sleep_df = select_df[select_df["name"].isin(sleep_vals)]
@@ -371,22 +407,63 @@ app.layout = dbc.Container(
     className="dbc",
 )
 
+
+def load_finance_cube(
+    data_getter: Data_Getter_Utils, start_year: int, budget_df: pd.DataFrame
+) -> Finance_Cube:
+    # The rollup also has to reach back to the historical averages' start
+    finance_start_year = min(start_year, HISTORICAL_START_YEAR)
+
+    # Finance callbacks answer from a rollup built once at startup. With DuckDB
+    # installed the daily rows are aggregated in the engine, not loaded whole.
+    # Without it they're read past Frame_Cache, so they're released with the
+    # rollup built
+    if Cache_Query_Engine.available():
+        finance_df = Cache_Query_Engine(data_getter.cache_dir).aggregate(
+            Finances_Dashboard_Helpers.finance_prefix,
+            ["year", "month", "day", "category"],
+            ["total"],
+            "year >= ?",
+            [finance_start_year],
+        )
+    else:
+        finance_df = pd.concat(
+            data_getter.iter_latest_file(
+                Finances_Dashboard_Helpers.finance_prefix,
+                filters=[("year", ">=", finance_start_year)],
+            ),
+            ignore_index=True,
+        )
+
+    return Finance_Cube(finance_df, budget_df)
+
+
 if __name__ == "__main__":
     user_name = "jjm"
     data_getter = Data_Getter_Utils()
     user_config = data_getter.get_user_config(user_name)
 
-    exist_data = data_getter.get_latest_file(file_prefix="exist_data")
+    # Nothing before the year dropdown's first year is ever shown
+    start_year = first_dropdown_year()
+    start_date = pd.Timestamp(year=start_year, month=1, day=1)
+
+    exist_data = data_getter.get_latest_file(
+        file_prefix="exist_data", filters=[("date", ">=", start_date)]
+    )
     day_rating = Exist_Dashboard_Helpers.get_weekly_rating_df(
         exist_data, user_config=user_config
     )
 
-    marvin_data = data_getter.get_latest_file(file_prefix="marvin_habits")
+    marvin_data = data_getter.get_latest_file(
+        file_prefix="marvin_habits", filters=[("timestamp", ">=", start_date)]
+    )
     week_habits_df = Marvin_Dashboard_Helpers.format_habit_df(
         marvin_data, user_config=user_config
     )
 
-    sleep_df = data_getter.get_latest_file(file_prefix="sleep_data")
+    sleep_df = data_getter.get_latest_file(
+        file_prefix="sleep_data", filters=[("year", ">=", start_year)]
+    )
     sleep_df = Manual_Dashboard_Helpers.format_sleep_df(
         sleep_df=sleep_df, user_config=user_config
     )
@@ -396,9 +473,18 @@ if __name__ == "__main__":
     )
 
     budget_df = data_getter.get_latest_file(file_prefix="monthly_budget")
-    finance_df = data_getter.get_latest_file(file_prefix="daily_finances")
     account_df = data_getter.get_latest_file(file_prefix="account_totals")
 
-    month_sum_df = Finances_Dashboard_Helpers.get_month_sum_df(finance_df)
+    try:
+        balance_history = Balance_History.load(user_name)
+    except ValueError:
+        # No ingest has recorded balances yet
+        balance_history = None
+
+    finance_cube = load_finance_cube(data_getter, start_year, budget_df)
+
+    month_sum_df = Finances_Dashboard_Helpers.get_month_sum_df(
+        None, finance_cube=finance_cube
+    )
 
     app.run_server(debug=True)
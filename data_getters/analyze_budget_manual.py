@@ -6,11 +6,11 @@ from data_getters.utils import Data_Getter_Utils
 
 class Budget_Analysis_Helpers:
     def join_user_df(
-        base_df: pd.DataFrame, file_prefix: str, user_id: str
+        base_df: pd.DataFrame, file_prefix: str, user_id: str, filters: list = None
     ) -> pd.DataFrame:
 
         user_df = Data_Getter_Utils().get_latest_file(
-            file_prefix=f"{file_prefix}_{user_id}"
+            file_prefix=f"{file_prefix}_{user_id}", filters=filters
         )
         user_df["user"] = user_id
         base_df = pd.concat([base_df, user_df])
@@ -76,11 +76,11 @@ if __name__ == "__main__":
             budget_df, "monthly_budget", user
         )
         finance_df = Budget_Analysis_Helpers.join_user_df(
-            finance_df, "daily_finances", user
+            finance_df, "daily_finances", user, filters=[("year", ">=", 2021)]
         )
 
     monthly_df = finance_df.groupby(
-        ["year", "month", "category", "user"], as_index=False
+        ["year", "month", "category", "user"], as_index=False, observed=True
     ).agg({"total": "sum"})
     monthly_df["day"] = 1
     monthly_df["timestamp"] = pd.to_datetime(monthly_df[["year", "month", "day"]])
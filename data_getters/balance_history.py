@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from data_getters.utils import Data_Getter_Utils
+
+
+class Balance_History:
+
+    # Per account balances for every day accounts were ingested. Each ingest
+    # records all active accounts, so the last ingest on or before a date is
+    # the complete picture as of that date. Queries binary search the sorted
+    # ingest days
+
+    data_prefix = "account_balances"
+
+    def __init__(self, history_df: pd.DataFrame):
+        history_df = history_df.copy()
+        history_df["date"] = pd.to_datetime(history_df["date"])
+        self.history_df = history_df.sort_values(
+            ["date", "account"], kind="stable", ignore_index=True
+        )
+        self.history_dates = pd.DatetimeIndex(self.history_df["date"])
+
+        # Ingest days x account types, plus their sum, precomputed once
+        self.type_totals = (
+            self.history_df.groupby(["date", "account_type"], observed=True)["balance"]
+            .sum()
+            .unstack(fill_value=0.0)
+            .sort_index()
+        )
+        self.type_totals.columns = self.type_totals.columns.astype(str)
+        self.net_worth_totals = self.type_totals.sum(axis=1)
+
+    def data_name(user_name: str) -> str:
+        return f"{Balance_History.data_prefix}_{user_name}"
+
+    def account_type(types: pd.Series, default=np.nan) -> np.ndarray:
+        conditions = [
+            types.isin(["CreditAccount", "BankAccount", "CashAccount"]),
+            types.isin(["InvestmentAccount"]),
+            types.isin(["LoanAccount"]),
+        ]
+        choices = ["bank", "investment", "loan"]
+
+        return np.select(conditions, choices, default=default)
+
+    def record(
+        accounts_df: pd.DataFrame, user_name: str, date: datetime = None
+    ) -> pd.DataFrame:
+        # Append only: just the ingest day's month is rewritten, and a same-day
+        # re-run replaces that day's rows
+        date = pd.Timestamp(date or datetime.now()).normalize()
+        data_name = Balance_History.data_name(user_name)
+
+        active_df = accounts_df[accounts_df["systemStatus"] == "ACTIVE"]
+        account = active_df["name"].astype(object)
+        if "id" in active_df.columns:
+            account = (
+                active_df["id"].astype(object).where(active_df["id"].notna(), account)
+            )
+
+        day_df = pd.DataFrame(
+            data={
+                "date": date,
+                "account": account.astype(str).values,
+                "account_type": Balance_History.account_type(
+                    active_df["type"], default="other"
+                ),
+                "balance": active_df["currentBalance"].astype(float).values,
+            }
+        )
+
+        month_start = date.replace(day=1)
+        write_df = day_df
+        try:
+            month_df = Data_Getter_Utils().get_latest_file(
+                data_name,
+                filters=[
+                    ("date", ">=", month_start),
+                    ("date", "<", month_start + pd.offsets.MonthBegin(1)),
+                ],
+            )
+            month_df = month_df[month_df["date"] != date]
+
+            if len(month_df) > 0:
+                write_df = pd.concat([month_df, day_df], ignore_index=True)
+        except ValueError:
+            # First ingest for this user
+            pass
+
+        Data_Getter_Utils.write_temp_cache(write_df, data_name, full=False)
+
+        return day_df
+
+    def load(user_name: str):
+        return Balance_History(
+            Data_Getter_Utils().get_latest_file(Balance_History.data_name(user_name))
+        )
+
+    def position(self, date: datetime) -> int:
+        # Last ingest day on or before date, -1 if there's none
+        return self.type_totals.index.searchsorted(pd.Timestamp(date), side="right") - 1
+
+    def as_of(self, date: datetime) -> pd.Series:
+        # Balance per account type as of date
+        position = self.position(date)
+
+        if position < 0:
+            return pd.Series(dtype=float)
+
+        return self.type_totals.iloc[position]
+
+    def accounts_as_of(self, date: datetime) -> pd.DataFrame:
+        position = self.position(date)
+
+        if position < 0:
+            return self.history_df.iloc[0:0]
+
+        day = self.type_totals.index[position]
+        start = self.history_dates.searchsorted(day, side="left")
+        end = self.history_dates.searchsorted(day, side="right")
+
+        return self.history_df.iloc[start:end]
+
+    def net_worth(self, start_date: datetime, end_date: datetime) -> pd.Series:
+        # Summed balances on each ingest day in [start_date, end_date]
+        dates = self.net_worth_totals.index
+        start = dates.searchsorted(pd.Timestamp(start_date), side="left")
+        end = dates.searchsorted(pd.Timestamp(end_date), side="right")
+
+        return self.net_worth_totals.iloc[start:end]
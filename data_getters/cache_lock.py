@@ -0,0 +1,37 @@
+import os
+from contextlib import contextmanager
+
+import filelock
+
+
+class Cache_Lock:
+
+    # OS file lock through filelock, it's released if the holder crashes so
+    # there's no stale lock to break
+    lock_file = ".cache.lock"
+    timeout_seconds = 600
+    poll_seconds = 1
+
+    def lock_path(cache_dir: str) -> str:
+        return os.path.join(cache_dir, Cache_Lock.lock_file)
+
+    @contextmanager
+    def hold(cache_dir: str):
+        os.makedirs(cache_dir, exist_ok=True)
+        lock_path = Cache_Lock.lock_path(cache_dir)
+        cache_lock = filelock.FileLock(lock_path)
+
+        try:
+            cache_lock.acquire(
+                timeout=Cache_Lock.timeout_seconds,
+                poll_interval=Cache_Lock.poll_seconds,
+            )
+        except filelock.Timeout:
+            raise TimeoutError(
+                f"Cache {cache_dir} is locked by another refresh ({lock_path})"
+            )
+
+        try:
+            yield lock_path
+        finally:
+            cache_lock.release()
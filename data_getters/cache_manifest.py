@@ -0,0 +1,155 @@
+import os
+import json
+import threading
+import glob
+import pandas as pd
+
+from data_getters.cache_storage import (
+    atomic_write_json,
+    get_storage_backend,
+    storage_backends,
+)
+from data_getters.partitioned_cache import Partitioned_Cache
+
+
+class Cache_Manifest:
+
+    manifest_file = "manifest.json"
+    # Guards load-modify-save of the manifest between threads of one process,
+    # Cache_Lock keeps separate refresh runs apart
+    lock = threading.RLock()
+
+    def manifest_path(cache_dir: str) -> str:
+        return os.path.join(cache_dir, Cache_Manifest.manifest_file)
+
+    def load(cache_dir: str) -> dict:
+        manifest_path = Cache_Manifest.manifest_path(cache_dir)
+
+        if not os.path.exists(manifest_path):
+            return Cache_Manifest.rebuild(cache_dir)
+
+        with open(manifest_path) as json_file:
+            return json.load(json_file)
+
+    def save(cache_dir: str, manifest: dict):
+        atomic_write_json(Cache_Manifest.manifest_path(cache_dir), manifest)
+
+    def snapshot_entry(df: pd.DataFrame, file_path: str, date_str: str) -> dict:
+        return {
+            "file": os.path.basename(file_path),
+            "date": date_str,
+            "rows": len(df),
+            "schema": {str(col): str(dtype) for col, dtype in df.dtypes.items()},
+        }
+
+    def add_snapshot(
+        cache_dir: str,
+        data_name: str,
+        df: pd.DataFrame,
+        file_path: str,
+        date_str: str,
+        **extra,
+    ) -> dict:
+        entry = dict(Cache_Manifest.snapshot_entry(df, file_path, date_str), **extra)
+
+        with Cache_Manifest.lock:
+            manifest = Cache_Manifest.load(cache_dir)
+
+            # One snapshot per dataset per day, a same-day rewrite replaces the
+            # entry. Files it leaves behind under another name (a revision, a
+            # format fallback) are removed by the retention policy
+            replaced = [x for x in manifest.get(data_name, []) if x["date"] == date_str]
+            superseded = [
+                file
+                for x in replaced
+                for file in [x["file"]] + x.get("superseded", [])
+                if file != entry["file"]
+            ]
+            if len(superseded) > 0:
+                entry["superseded"] = superseded
+
+            snapshots = [
+                x for x in manifest.get(data_name, []) if x["date"] != date_str
+            ]
+            snapshots.append(entry)
+            manifest[data_name] = sorted(snapshots, key=lambda x: x["date"])
+
+            Cache_Manifest.save(cache_dir, manifest)
+
+        return manifest
+
+    def split_file_name(file_path: str):
+        # name_date.ext or name_date.rNNN.ext
+        file_name = os.path.basename(file_path).split(".")[0]
+        data_name, date_str = file_name.rsplit("_", 1)
+
+        return data_name, date_str
+
+    def rebuild(cache_dir: str) -> dict:
+        # One-off scan for caches written before the manifest existed
+        manifest = {}
+        if not os.path.isdir(cache_dir):
+            return manifest
+
+        extensions = [x.extension for x in storage_backends.values()]
+        files = sorted(
+            x
+            for x in glob.glob(f"{cache_dir}/*")
+            if os.path.splitext(x)[1] in extensions
+        )
+
+        for file in files:
+            try:
+                data_name, date_str = Cache_Manifest.split_file_name(file)
+                pd.to_datetime(date_str, format="%Y-%m-%d")
+            except ValueError:
+                continue
+
+            df = get_storage_backend(file).read(file)
+            snapshots = [
+                x for x in manifest.get(data_name, []) if x["date"] != date_str
+            ]
+            snapshots.append(Cache_Manifest.snapshot_entry(df, file, date_str))
+            manifest[data_name] = sorted(snapshots, key=lambda x: x["date"])
+
+        for versions_path in glob.glob(
+            os.path.join(cache_dir, "*", Partitioned_Cache.versions_file)
+        ):
+            data_name = os.path.basename(os.path.dirname(versions_path))
+            versions = Partitioned_Cache.load_versions(cache_dir, data_name)
+            version_info = versions["versions"].get(str(versions["current"]))
+
+            if version_info is None:
+                continue
+
+            manifest[data_name] = [
+                {
+                    "file": data_name,
+                    "date": version_info["created"][:10],
+                    "rows": sum(x["rows"] for x in version_info["partitions"].values()),
+                    "schema": {},
+                    "version": versions["current"],
+                    "partitioned": True,
+                }
+            ]
+
+        Cache_Manifest.save(cache_dir, manifest)
+
+        return manifest
+
+    def latest_snapshot(manifest: dict, file_prefix: str) -> dict:
+        if file_prefix in manifest:
+            return manifest[file_prefix][-1]
+
+        # Callers like the dashboards ask for "daily_finances" without the user
+        # suffix, match whole name segments so "..._j" never picks up "..._jjm"
+        candidates = [
+            snapshots[-1]
+            for data_name, snapshots in manifest.items()
+            if data_name.startswith(f"{file_prefix}_") and len(snapshots) > 0
+        ]
+
+        if len(candidates) == 0:
+            return None
+
+        return max(candidates, key=lambda x: x["date"])
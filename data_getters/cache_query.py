@@ -0,0 +1,162 @@
+import os
+import threading
+import pandas as pd
+
+from data_getters.cache_manifest import Cache_Manifest
+from data_getters.cache_storage import Arrow_Storage, Csv_Storage, Parquet_Storage
+from data_getters.partitioned_cache import Partitioned_Cache
+from data_getters.utils import Data_Getter_Utils
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+
+class Cache_Query_Engine:
+
+    # Optional embedded DuckDB over the cached datasets, so period filters and
+    # groupbys run vectorized in the engine instead of on whole pandas frames.
+    # Parquet and CSV are scanned from disk, arrow snapshots are handed over as
+    # memory-mapped tables
+
+    def available() -> bool:
+        return duckdb is not None
+
+    def __init__(self, cache_dir: str = None):
+        self.cache_dir = cache_dir or Data_Getter_Utils.cache_dir
+        self.conn = duckdb.connect(database=":memory:")
+        # One connection, Dash runs callbacks on several threads
+        self.lock = threading.Lock()
+        self.views = {}
+        self.registered = {}
+        self.source_count = 0
+
+    def period_where(agg_str: str, year: int, month: int, week_num: int):
+        # Same periods as dashboard_utils.aggregate_monthly_df
+        if agg_str == "week":
+            return "year = ? AND week_number = ?", [year, week_num]
+        elif agg_str == "month":
+            return "year = ? AND month = ?", [year, month]
+        elif agg_str == "year":
+            return "year = ?", [year]
+        elif agg_str == "quarter":
+            return "year = ? AND FLOOR((month - 1) / 3) = ?", [year, (month - 1) // 3]
+
+        raise ValueError(f"Unknown aggregation {agg_str}!")
+
+    def file_source(self, file_path: str) -> str:
+        sql_path = file_path.replace("'", "''")
+
+        if file_path.endswith(Parquet_Storage.extension):
+            return f"read_parquet('{sql_path}')"
+
+        if file_path.endswith(Csv_Storage.extension):
+            return f"read_csv_auto('{sql_path}')"
+
+        return self.register_source(Arrow_Storage.read_table(file_path))
+
+    def register_source(self, data) -> str:
+        self.source_count += 1
+        source_name = f"__cache_source_{self.source_count}"
+        self.conn.register(source_name, data)
+
+        return source_name
+
+    def snapshot_sources(self, snapshot: dict) -> list:
+        if not snapshot.get("partitioned"):
+            return [self.file_source(os.path.join(self.cache_dir, snapshot["file"]))]
+
+        data_name = snapshot["file"]
+        dataset_dir = Partitioned_Cache.dataset_dir(self.cache_dir, data_name)
+        versions = Partitioned_Cache.load_versions(self.cache_dir, data_name)
+        version_info = versions["versions"][str(snapshot["version"])]
+
+        sources = []
+        for key in sorted(version_info["partitions"]):
+            partition = version_info["partitions"][key]
+
+            # Deltas only make sense applied, hand those months over as frames
+            if partition.get("delta") is not None:
+                sources.append(
+                    self.register_source(
+                        Partitioned_Cache.read_partition(dataset_dir, partition)
+                    )
+                )
+            else:
+                sources.append(
+                    self.file_source(os.path.join(dataset_dir, partition["file"]))
+                )
+
+        return sources
+
+    def view(self, file_prefix: str) -> str:
+        manifest = Cache_Manifest.load(self.cache_dir)
+        snapshot = Cache_Manifest.latest_snapshot(manifest, file_prefix)
+
+        if snapshot is None:
+            raise ValueError(f"No dated file for prefix {file_prefix}!")
+
+        # Rebuilt whenever a newer snapshot or version lands
+        snapshot_key = (snapshot["file"], snapshot.get("version"))
+        view_name = f'"{file_prefix}"'
+
+        if self.views.get(file_prefix) != snapshot_key:
+            # Drop the previous snapshot's mapped tables before registering new ones
+            for source_name in self.registered.pop(file_prefix, []):
+                self.conn.unregister(source_name)
+
+            registered_before = self.source_count
+            sources = self.snapshot_sources(snapshot)
+            self.registered[file_prefix] = [
+                f"__cache_source_{x}"
+                for x in range(registered_before + 1, self.source_count + 1)
+            ]
+
+            union_sql = " UNION ALL BY NAME ".join(
+                f"SELECT * FROM {x}" for x in sources
+            )
+
+            self.conn.execute(f"CREATE OR REPLACE VIEW {view_name} AS {union_sql}")
+            self.views[file_prefix] = snapshot_key
+
+        return view_name
+
+    def query(self, sql: str, params: list = None) -> pd.DataFrame:
+        with self.lock:
+            return self.conn.execute(sql, params or []).df()
+
+    def aggregate(
+        self,
+        file_prefix: str,
+        group_cols: list,
+        sum_cols: list,
+        where: str = None,
+        params: list = None,
+    ) -> pd.DataFrame:
+        with self.lock:
+            view_name = self.view(file_prefix)
+
+        group_sql = ", ".join(group_cols)
+        sum_sql = ", ".join(f"SUM({x}) AS {x}" for x in sum_cols)
+        where_sql = f"WHERE {where}" if where else ""
+
+        return self.query(
+            f"SELECT {group_sql}, {sum_sql} FROM {view_name} {where_sql} "
+            f"GROUP BY {group_sql} ORDER BY {group_sql}",
+            params,
+        )
+
+    def aggregate_period(
+        self,
+        file_prefix: str,
+        group_cols: list,
+        sum_cols: list,
+        year: int,
+        month: int,
+        week_num: int,
+        agg_str: str,
+    ) -> pd.DataFrame:
+        where, params = Cache_Query_Engine.period_where(agg_str, year, month, week_num)
+
+        return self.aggregate(file_prefix, group_cols, sum_cols, where, params)
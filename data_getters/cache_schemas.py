@@ -0,0 +1,157 @@
+import numpy as np
+import pandas as pd
+
+
+class Cache_Schemas:
+
+    # Per dataset: required columns and the dtypes applied on write and on load.
+    # Repeated strings become categoricals, calendar fields small ints. Money
+    # stays float64, float32 starts dropping cents past ~$100k
+    schemas = {
+        "daily_finances": {
+            "year": "int16",
+            "month": "int8",
+            "day": "int8",
+            "category": "category",
+            "total": "float64",
+            "timestamp": "datetime",
+        },
+        "monthly_budget": {
+            "category": "category",
+            "budget": "float64",
+        },
+        "account_totals": {
+            "account_type": "category",
+            "total": "float64",
+        },
+        "mint_transactions_raw": {
+            "date": "datetime",
+            "amount": "float64",
+            "type": "category",
+            "accountId": "category",
+            "name": "category",
+            "parentName": "category",
+        },
+        "mint_budgets_raw": {
+            "budgetDate": "datetime",
+            "amount": "float64",
+            "budgetAmount": "float64",
+            "name": "category",
+        },
+        "account_balances": {
+            "date": "datetime",
+            "account": "category",
+            "account_type": "category",
+            "balance": "float64",
+        },
+        "mint_accounts_raw": {
+            "type": "category",
+            "systemStatus": "category",
+            "currentBalance": "float64",
+        },
+        "marvin_habits": {
+            "timestamp": "datetime",
+            "id": "category",
+            "name": "category",
+            "positive": "bool",
+            "period": "category",
+            "week_number": "int8",
+        },
+        "marvin_tasks": {
+            "parent": "category",
+            "category": "category",
+            "duration": "float64",
+        },
+        "exist_data": {
+            "date": "datetime",
+            "attribute": "category",
+        },
+        "sleep_data": {
+            "year": "int16",
+            "month": "int8",
+            "week": "int8",
+            "bedtime": "datetime",
+            "wakeup": "datetime",
+            "duration": "timedelta",
+        },
+    }
+
+    def get_schema(data_name: str) -> dict:
+        for dataset_name, schema in Cache_Schemas.schemas.items():
+            if data_name == dataset_name or data_name.startswith(f"{dataset_name}_"):
+                return schema
+
+        return None
+
+    def validate(df: pd.DataFrame, data_name: str):
+        schema = Cache_Schemas.get_schema(data_name)
+
+        if schema is None:
+            return
+
+        missing_cols = [x for x in schema if x not in df.columns]
+
+        if len(missing_cols) > 0:
+            raise ValueError(f"{data_name} is missing columns {missing_cols}!")
+
+    def has_dtype(series: pd.Series, dtype: str) -> bool:
+        if dtype == "datetime":
+            return pd.api.types.is_datetime64_any_dtype(series)
+
+        if dtype == "timedelta":
+            return pd.api.types.is_timedelta64_dtype(series)
+
+        if dtype == "category":
+            return isinstance(series.dtype, pd.CategoricalDtype)
+
+        # Nullable ints are Int16 etc
+        return str(series.dtype).lower() == dtype
+
+    def cast_column(series: pd.Series, dtype: str) -> pd.Series:
+        if dtype == "datetime":
+            return pd.to_datetime(series)
+
+        if dtype == "timedelta":
+            return pd.to_timedelta(series)
+
+        if dtype == "category":
+            return series.astype("category")
+
+        has_nulls = series.isna().any()
+
+        if dtype == "bool":
+            return series if has_nulls else series.astype(dtype)
+
+        if dtype.startswith("int"):
+            # Out of range values are left alone rather than wrapped around
+            int_info = np.iinfo(dtype)
+            if series.min() < int_info.min or series.max() > int_info.max:
+                return series
+
+            return series.astype(dtype.capitalize() if has_nulls else dtype)
+
+        return series.astype(dtype)
+
+    def apply(df: pd.DataFrame, data_name: str, validate: bool = True) -> pd.DataFrame:
+        # validate=False for column projections, which only hold some columns
+        schema = Cache_Schemas.get_schema(data_name)
+
+        if schema is None:
+            return df
+
+        if validate:
+            Cache_Schemas.validate(df, data_name)
+
+        # Columns that already have their dtype, like everything in an arrow
+        # snapshot, are left as loaded so memory-mapped buffers stay mapped
+        df = df.copy(deep=False)
+        for col, dtype in schema.items():
+            if col not in df.columns or Cache_Schemas.has_dtype(df[col], dtype):
+                continue
+
+            try:
+                df[col] = Cache_Schemas.cast_column(df[col], dtype)
+            except (ValueError, TypeError) as e:
+                raise ValueError(f"{data_name} column {col} is not {dtype}: {e}")
+
+        return df
@@ -0,0 +1,255 @@
+import os
+import json
+import operator
+import threading
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+
+class Csv_Storage:
+
+    extension = ".csv"
+
+    # CSV drops dtypes, so columns we know are dates get parsed back on read
+    datetime_columns = [
+        "timestamp",
+        "date",
+        "day",
+        "budgetDate",
+        "bedtime",
+        "wakeup",
+        "start_time",
+        "end_time",
+    ]
+
+    def available() -> bool:
+        return True
+
+    def write(df: pd.DataFrame, file_path: str):
+        df.to_csv(file_path, index=False)
+
+    def read(
+        file_path: str, columns: list = None, filters: list = None
+    ) -> pd.DataFrame:
+        # No pushdown for CSV, filters are applied after the dtypes come back
+        df = pd.read_csv(file_path, index_col=None, usecols=columns)
+
+        return apply_filters(Csv_Storage.restore_dtypes(df), filters)
+
+    def restore_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+        for col in Csv_Storage.datetime_columns:
+            if col not in df.columns or not pd.api.types.is_string_dtype(df[col]):
+                continue
+
+            # marvin's "day" can still hold "unassigned", leave those as strings
+            try:
+                df[col] = pd.to_datetime(df[col])
+            except (ValueError, TypeError):
+                continue
+
+        return df
+
+
+class Parquet_Storage:
+
+    extension = ".parquet"
+
+    def available() -> bool:
+        return pyarrow is not None
+
+    # Row groups carry min/max stats, filters skip the ones that can't match
+    row_group_size = 100000
+
+    def write(df: pd.DataFrame, file_path: str):
+        df.to_parquet(
+            file_path,
+            index=False,
+            engine="pyarrow",
+            row_group_size=Parquet_Storage.row_group_size,
+        )
+
+    def read(
+        file_path: str, columns: list = None, filters: list = None
+    ) -> pd.DataFrame:
+        return pd.read_parquet(
+            file_path, engine="pyarrow", columns=columns, filters=filters or None
+        )
+
+
+class Arrow_Storage:
+
+    # Uncompressed Arrow IPC, read back through a memory map so numeric columns
+    # are zero-copy and processes opening the same snapshot share its pages
+    extension = ".arrow"
+
+    def available() -> bool:
+        return pyarrow is not None
+
+    def write(df: pd.DataFrame, file_path: str):
+        table = pyarrow.Table.from_pandas(df, preserve_index=False)
+
+        with pyarrow.OSFile(file_path, "wb") as sink:
+            with pyarrow.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+    def read_table(file_path: str):
+        with pyarrow.memory_map(file_path, "r") as source:
+            return pyarrow.ipc.open_file(source).read_all()
+
+    def read(
+        file_path: str, columns: list = None, filters: list = None
+    ) -> pd.DataFrame:
+        table = Arrow_Storage.filter_table(
+            Arrow_Storage.read_table(file_path), filters
+        )
+
+        if columns is not None:
+            table = table.select(columns)
+
+        # split_blocks skips consolidating columns into 2D blocks, which would copy
+        return table.to_pandas(split_blocks=True)
+
+    def filter_table(table, filters: list):
+        # Snapshots are written in date order, so range filters on the date
+        # columns match one run of rows. A slice of the table keeps it mapped,
+        # only scattered matches are copied out
+        if not filters:
+            return table
+
+        filter_cols = list(dict.fromkeys(x[0] for x in filters))
+        mask = filter_mask(table.select(filter_cols).to_pandas(), filters)
+        rows = np.flatnonzero(mask)
+
+        if len(rows) == 0:
+            return table.slice(0, 0)
+
+        if rows[-1] - rows[0] + 1 == len(rows):
+            return table.slice(rows[0], len(rows))
+
+        return table.filter(pyarrow.array(mask))
+
+
+filter_ops = {
+    "==": operator.eq,
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda x, y: x.isin(y),
+    "not in": lambda x, y: ~x.isin(y),
+}
+
+
+def filter_mask(df: pd.DataFrame, filters: list) -> np.ndarray:
+    # Same (column, op, value) conjunction pyarrow takes for parquet
+    mask = np.ones(len(df), dtype=bool)
+    for col, op, value in filters:
+        mask &= np.asarray(filter_ops[op](df[col], value).fillna(False), dtype=bool)
+
+    return mask
+
+
+def apply_filters(df: pd.DataFrame, filters: list) -> pd.DataFrame:
+    if not filters:
+        return df
+
+    mask = filter_mask(df, filters)
+
+    # Already filtered at read, nothing to copy
+    if mask.all():
+        return df
+
+    return df[mask].reset_index(drop=True)
+
+
+storage_backends = {
+    "csv": Csv_Storage,
+    "parquet": Parquet_Storage,
+    "arrow": Arrow_Storage,
+}
+
+
+def get_storage_backend(file_path: str):
+    for backend in storage_backends.values():
+        if file_path.endswith(backend.extension):
+            return backend
+
+    raise ValueError(f"No storage backend for file {file_path}")
+
+
+def temp_path(file_path: str) -> str:
+    # Never carries a cache extension, so a crashed write is never picked up
+    return f"{file_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+
+
+def revision_path(file_path: str) -> str:
+    # First free name_date.rNNN.ext next to a snapshot that can't be replaced
+    file_stem, extension = os.path.splitext(file_path)
+    file_stem = file_stem.split(".")[0]
+
+    revision = 1
+    while os.path.exists(f"{file_stem}.r{revision:03d}{extension}"):
+        revision += 1
+
+    return f"{file_stem}.r{revision:03d}{extension}"
+
+
+def atomic_write(backend, df: pd.DataFrame, file_path: str) -> str:
+    tmp_path = temp_path(file_path)
+
+    try:
+        backend.write(df, tmp_path)
+
+        try:
+            os.replace(tmp_path, file_path)
+        except PermissionError:
+            # A same-day rewrite of a snapshot a dashboard still has memory
+            # mapped on Windows, written under a new name instead
+            file_path = revision_path(file_path)
+            os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return file_path
+
+
+def atomic_write_json(file_path: str, data: dict):
+    tmp_path = temp_path(file_path)
+
+    try:
+        with open(tmp_path, "w") as json_file:
+            json.dump(data, json_file, indent=2, sort_keys=True)
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_with_fallback(df: pd.DataFrame, file_stem: str, storage_format: str) -> str:
+    backend = storage_backends[storage_format]
+
+    if not backend.available():
+        backend = Csv_Storage
+
+    file_path = file_stem + backend.extension
+
+    try:
+        file_path = atomic_write(backend, df, file_path)
+    except (ValueError, TypeError, NotImplementedError):
+        # Mixed-type object columns can't be stored columnar, keep them as CSV
+        if backend is Csv_Storage:
+            raise
+
+        file_path = file_stem + Csv_Storage.extension
+        file_path = atomic_write(Csv_Storage, df, file_path)
+
+    return file_path
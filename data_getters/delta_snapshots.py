@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+
+class Delta_Snapshots:
+
+    op_col = "__delta_op"
+    id_col = "__delta_id"
+    # Past this share of the partition a delta saves little, write a new base
+    rebase_ratio = 0.5
+
+    def normalize(df: pd.DataFrame) -> pd.DataFrame:
+        # Same values must hash the same whether fresh from a source or read back
+        df = df.copy(deep=False)
+
+        for col in df.columns:
+            if pd.api.types.is_datetime64_any_dtype(df[col]):
+                df[col] = df[col].astype("datetime64[ns]")
+            elif isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype(object)
+
+        return df
+
+    def row_ids(df: pd.DataFrame, key_cols: list = None) -> pd.Series:
+        # Rows are identified by their key, or their whole content without one.
+        # Repeats of the same key (two identical coffees on one day) get an
+        # occurrence number so they stay separate rows
+        normalized = Delta_Snapshots.normalize(df)
+        key_df = normalized[key_cols] if key_cols else normalized
+
+        key_hash = pd.Series(
+            pd.util.hash_pandas_object(key_df, index=False).values, index=df.index
+        )
+        occurrence = key_hash.groupby(key_hash).cumcount()
+
+        row_ids = pd.util.hash_pandas_object(
+            pd.DataFrame({"key": key_hash.values, "n": occurrence.values}),
+            index=False,
+        ).values
+
+        # int64 rather than uint64 so the ids survive a CSV fallback round trip
+        return pd.Series(row_ids.view("int64"), index=df.index)
+
+    def row_hashes(df: pd.DataFrame) -> np.ndarray:
+        return pd.util.hash_pandas_object(
+            Delta_Snapshots.normalize(df), index=False
+        ).values
+
+    def diff(
+        base_df: pd.DataFrame, new_df: pd.DataFrame, key_cols: list = None
+    ) -> pd.DataFrame:
+        base_ids = Delta_Snapshots.row_ids(base_df, key_cols)
+        new_ids = Delta_Snapshots.row_ids(new_df, key_cols)
+
+        base_content = Delta_Snapshots.row_hashes(base_df)
+        new_content = Delta_Snapshots.row_hashes(new_df)
+
+        # Inserted rows have an id the base doesn't, updated ones a new content
+        base_pos = pd.Index(base_ids.values).get_indexer(new_ids.values)
+        found = base_pos != -1
+        upsert_mask = ~found
+        upsert_mask[found] = base_content[base_pos[found]] != new_content[found]
+        deleted_mask = ~base_ids.isin(new_ids)
+
+        # Ids go in as arrays, an id Series would grow an empty frame to its
+        # own length
+        upserts = new_df[upsert_mask].assign(
+            **{
+                Delta_Snapshots.op_col: "upsert",
+                Delta_Snapshots.id_col: new_ids.values[upsert_mask],
+            }
+        )
+        deletes = base_df[deleted_mask.values].assign(
+            **{
+                Delta_Snapshots.op_col: "delete",
+                Delta_Snapshots.id_col: base_ids.values[deleted_mask.values],
+            }
+        )
+
+        return pd.concat([upserts, deletes], ignore_index=True)
+
+    def apply(
+        base_df: pd.DataFrame, delta_df: pd.DataFrame, key_cols: list = None
+    ) -> pd.DataFrame:
+        base_ids = Delta_Snapshots.row_ids(base_df, key_cols)
+
+        # Every id in the delta is either gone or replaced by its upsert row
+        kept_df = base_df[~base_ids.isin(delta_df[Delta_Snapshots.id_col]).values]
+        upserts = delta_df[delta_df[Delta_Snapshots.op_col] == "upsert"].drop(
+            columns=[Delta_Snapshots.op_col, Delta_Snapshots.id_col]
+        )
+
+        return pd.concat([kept_df, upserts], ignore_index=True)
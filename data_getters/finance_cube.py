@@ -0,0 +1,192 @@
+import numpy as np
+import pandas as pd
+
+
+class Finance_Cube:
+
+    # Daily finances rolled up once, at dashboard startup, so callbacks slice a
+    # sorted index instead of regrouping the whole daily history. cells is the
+    # finest grain (a week split over two months is two cells), months is the
+    # monthly rollup with the category's monthly budget joined
+
+    cell_dims = ["year", "quarter", "month", "week_number", "category"]
+    month_dims = ["year", "quarter", "month", "category"]
+
+    def __init__(self, finance_df: pd.DataFrame, budget_df: pd.DataFrame = None):
+        dates = pd.to_datetime(finance_df[["year", "month", "day"]])
+
+        cells_df = pd.DataFrame(
+            data={
+                "year": finance_df["year"].astype(int).values,
+                "quarter": dates.dt.quarter.values,
+                "month": finance_df["month"].astype(int).values,
+                "week_number": dates.dt.isocalendar().week.astype(int).values,
+                "category": finance_df["category"].astype(str).values,
+                "total": finance_df["total"].values,
+            }
+        )
+
+        self.cells = (
+            cells_df.groupby(Finance_Cube.cell_dims)[["total"]].sum().sort_index()
+        )
+
+        months = self.cells.groupby(level=Finance_Cube.month_dims)[["total"]].sum()
+
+        budgets = pd.Series(dtype=float)
+        if budget_df is not None:
+            budgets = budget_df.groupby(
+                budget_df["category"].astype(str), observed=True
+            )["budget"].sum()
+
+        months["budget"] = (
+            budgets.reindex(months.index.get_level_values("category")).fillna(0).values
+        )
+        self.months = months.sort_index()
+        self.what_if_engine = None
+
+    def what_if(self):
+        # Built on first use, most callbacks never need it
+        if self.what_if_engine is None:
+            self.what_if_engine = Budget_What_If(self)
+
+        return self.what_if_engine
+
+    def period_key(year: int, month: int, agg_str: str) -> tuple:
+        quarter = (month - 1) // 3 + 1
+
+        if agg_str == "year":
+            return (year,)
+        elif agg_str == "quarter":
+            return (year, quarter)
+        elif agg_str in ["month", "week"]:
+            return (year, quarter, month)
+
+        raise ValueError(f"Unknown aggregation {agg_str}!")
+
+    def period_slice(
+        frame: pd.DataFrame, year: int, month: int, agg_str: str
+    ) -> pd.DataFrame:
+        # Leading levels of a sorted index, a binary search per level
+        key = Finance_Cube.period_key(year, month, agg_str)
+        start, end = frame.index.slice_locs(key, key)
+
+        return frame.iloc[start:end]
+
+    def period_totals(
+        self, year: int, month: int, agg_str: str, week_num: int = 0
+    ) -> pd.DataFrame:
+        # Total and budget by category for the same periods as
+        # dashboard_utils.aggregate_monthly_df
+        if agg_str == "week":
+            year_cells = Finance_Cube.period_slice(self.cells, year, month, "year")
+            week_cells = year_cells[
+                year_cells.index.get_level_values("week_number") == week_num
+            ]
+
+            return (
+                week_cells.groupby(level="category")[["total"]]
+                .sum()
+                .assign(budget=0.0)
+                .reset_index(drop=False)
+            )
+
+        return (
+            Finance_Cube.period_slice(self.months, year, month, agg_str)
+            .groupby(level="category")[["total", "budget"]]
+            .sum()
+            .reset_index(drop=False)
+        )
+
+    def month_totals(
+        self, exclude_categories: list = None, start_year: int = None
+    ) -> pd.DataFrame:
+        months = self.months
+        if start_year is not None:
+            months = months.iloc[months.index.slice_locs((start_year,))[0] :]
+
+        if exclude_categories:
+            months = months[
+                ~months.index.get_level_values("category").isin(exclude_categories)
+            ]
+
+        return (
+            months.groupby(level=["year", "month"])[["total"]]
+            .sum()
+            .reset_index(drop=False)
+        )
+
+
+class Budget_What_If:
+
+    # get_budget_shortfall for whole grids of profit targets and start years.
+    # Monthly spend is reduced once to suffix sums over the sorted months, so
+    # the average since any start year is a searchsorted and a division
+
+    spend_exclude = ["income", "bonus"]
+    income_category = "income"
+
+    def __init__(self, finance_cube: Finance_Cube):
+        spend_df = finance_cube.month_totals(Budget_What_If.spend_exclude)
+
+        # Sums from each month to the end, with an empty suffix past the last
+        self.spend_years = spend_df["year"].values
+        self.spend_suffix_sums = np.append(
+            np.cumsum(spend_df["total"].values[::-1])[::-1], 0.0
+        )
+
+        months = finance_cube.months
+        income_months = months[
+            months.index.get_level_values("category") == Budget_What_If.income_category
+        ]
+        income_df = (
+            income_months.groupby(level=["year", "month"])[["total"]]
+            .sum()
+            .reset_index(drop=False)
+        )
+        self.income_keys = (income_df["year"] * 12 + income_df["month"]).values
+        self.income_totals = income_df["total"].values
+
+    def average_spend(self, start_years) -> np.ndarray:
+        start_years = np.atleast_1d(start_years)
+        positions = np.searchsorted(self.spend_years, start_years, side="left")
+        month_counts = len(self.spend_years) - positions
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(
+                month_counts > 0,
+                self.spend_suffix_sums[positions] / month_counts,
+                np.nan,
+            )
+
+    def monthly_income(self, years, months) -> np.ndarray:
+        keys = np.atleast_1d(years) * 12 + np.atleast_1d(months)
+
+        if len(self.income_keys) == 0:
+            return np.zeros(len(keys))
+
+        positions = np.searchsorted(self.income_keys, keys)
+        positions = np.minimum(positions, len(self.income_keys) - 1)
+        found = self.income_keys[positions] == keys
+        return np.where(found, self.income_totals[positions], 0.0)
+
+    def shortfall(
+        self, profit_targets, month: int, year: int, start_years
+    ) -> np.ndarray:
+        # profit_targets x start_years, one broadcast
+        income = self.monthly_income(year, month)[0]
+        average_spend = self.average_spend(start_years)
+
+        return (
+            average_spend[np.newaxis, :]
+            + income
+            - np.atleast_1d(profit_targets).astype(float)[:, np.newaxis]
+        )
+
+    def shortfall_table(
+        self, profit_targets, month: int, year: int, start_years
+    ) -> pd.DataFrame:
+        return pd.DataFrame(
+            self.shortfall(profit_targets, month, year, start_years),
+            index=pd.Index(np.atleast_1d(profit_targets), name="profit_target"),
+            columns=pd.Index(np.atleast_1d(start_years), name="start_year"),
+        )
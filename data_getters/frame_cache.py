@@ -0,0 +1,105 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+
+class Frame_Cache:
+
+    # Process-wide LRU of loaded snapshots, keyed by file path
+    max_bytes = 512 * 1024 * 1024
+    # mtime + size catches normal rewrites, hashing also catches same-tick ones
+    validate_hash = False
+
+    _frames = OrderedDict()
+    _total_bytes = 0
+    _lock = threading.Lock()
+
+    def file_hash(file_path: str) -> str:
+        file_hash = hashlib.blake2b()
+
+        with open(file_path, "rb") as cache_file:
+            for chunk in iter(lambda: cache_file.read(1024 * 1024), b""):
+                file_hash.update(chunk)
+
+        return file_hash.hexdigest()
+
+    def file_signature(file_path: str) -> tuple:
+        file_stat = os.stat(file_path)
+        signature = (file_stat.st_mtime_ns, file_stat.st_size)
+
+        if Frame_Cache.validate_hash:
+            signature += (Frame_Cache.file_hash(file_path),)
+
+        return signature
+
+    def lock_values(df: pd.DataFrame) -> pd.DataFrame:
+        # Cached arrays are made read-only, so a caller writing to its view in
+        # place raises instead of changing every other caller's frame. pandas 3
+        # copies on write and never writes through to them
+        if int(pd.__version__.split(".")[0]) >= 3:
+            return df
+
+        # The block arrays themselves, a column's .values can be a view of them.
+        # Falls back to those views if the internals ever move
+        arrays = getattr(getattr(df, "_mgr", None), "arrays", None)
+        if arrays is None:
+            arrays = [df[col].values for col in df.columns]
+
+        for values in arrays:
+            values = getattr(values, "_ndarray", values)
+
+            if isinstance(values, np.ndarray):
+                values.flags.writeable = False
+
+        return df
+
+    def read_only_view(df: pd.DataFrame) -> pd.DataFrame:
+        # Callers add and replace columns on what they load, they get their own
+        # frame around the cached, read-only arrays. Nothing is copied
+        return df.copy(deep=False)
+
+    def get(file_path: str, loader, key_extra: tuple = ()) -> pd.DataFrame:
+        key = (os.path.abspath(file_path),) + key_extra
+        signature = Frame_Cache.file_signature(file_path)
+
+        with Frame_Cache._lock:
+            cached = Frame_Cache._frames.get(key)
+
+            if cached is not None and cached[0] == signature:
+                Frame_Cache._frames.move_to_end(key)
+                return Frame_Cache.read_only_view(cached[1])
+
+        df = Frame_Cache.lock_values(loader(file_path))
+        Frame_Cache.put(key, signature, df)
+
+        return Frame_Cache.read_only_view(df)
+
+    def put(key: tuple, signature: tuple, df: pd.DataFrame):
+        frame_bytes = int(df.memory_usage(index=True, deep=True).sum())
+
+        with Frame_Cache._lock:
+            Frame_Cache.evict(key)
+
+            if frame_bytes > Frame_Cache.max_bytes:
+                return
+
+            while Frame_Cache._total_bytes + frame_bytes > Frame_Cache.max_bytes:
+                Frame_Cache.evict(next(iter(Frame_Cache._frames)))
+
+            Frame_Cache._frames[key] = (signature, df, frame_bytes)
+            Frame_Cache._total_bytes += frame_bytes
+
+    def evict(key: tuple):
+        cached = Frame_Cache._frames.pop(key, None)
+
+        if cached is not None:
+            Frame_Cache._total_bytes -= cached[2]
+
+    def clear():
+        with Frame_Cache._lock:
+            Frame_Cache._frames.clear()
+            Frame_Cache._total_bytes = 0
+
@@ -145,6 +145,8 @@ class Exist_Dashboard_Helpers:
             .rename(columns={"index": "attribute", 0: "target"})
         )
 
+        # Loaded frames share Frame_Cache's read-only arrays
+        exist_df = exist_df.copy()
         exist_df["attribute"] = exist_df["attribute"].str.replace(" ", "_").str.lower()
         exist_df.replace(
             {"attribute": {"bedtime": "sleep_start", "wake_time": "sleep_end"}},
@@ -1,167 +1,502 @@
 import datetime
+import warnings
+import threading
+import itertools
 import requests
 import couchdb
-from itertools import repeat
 import pandas as pd
 import numpy as np
+from typing import Iterator
 
 from data_getters.utils import Data_Getter_Utils
+from data_getters.sync_state import Sync_State
+
+
+class Broken_Category_Warning(UserWarning):
+    pass
+
+
+class Category_Tree:
+
+    # Marvin categories indexed by id, built once per sync. Each category's
+    # path is resolved once and shared by every task under it, instead of
+    # scanning the whole category list at each level for each task
+
+    root_id = "root"
+
+    def __init__(self, categories):
+        self.nodes = {x["_id"]: x for x in categories}
+        # id -> (parent_sequence, root title), None if the path is broken
+        self.paths = {}
+        # id -> why its path couldn't be resolved
+        self.broken = {}
+
+    def path(self, category_id: str):
+        if category_id in self.paths:
+            return self.paths[category_id]
+
+        # Walk up to the root or an already resolved ancestor
+        chain = []
+        seen = set()
+        parent_id = category_id
+        while parent_id != Category_Tree.root_id and parent_id not in self.paths:
+            if parent_id in seen:
+                self.mark_broken(chain, f"cycle through {parent_id}")
+                return None
+
+            node = self.nodes.get(parent_id)
+            if node is None:
+                self.mark_broken(chain, f"missing parent {parent_id}")
+                return None
+
+            seen.add(parent_id)
+            chain.append(node)
+            parent_id = node.get("parentId", Category_Tree.root_id)
+
+        parent_path = self.paths.get(parent_id)
+        if parent_id != Category_Tree.root_id and parent_path is None:
+            self.mark_broken(chain, self.broken[parent_id])
+            return None
+
+        # Resolve back down the chain, the deepest ancestor first
+        for node in reversed(chain):
+            if parent_path is None:
+                parent_path = (node["title"], node["title"])
+            else:
+                parent_path = (f"{node['title']}/{parent_path[0]}", parent_path[1])
+
+            self.paths[node["_id"]] = parent_path
+
+        return self.paths[category_id]
+
+    def mark_broken(self, chain: list, reason: str):
+        for node in chain:
+            self.paths[node["_id"]] = None
+            self.broken[node["_id"]] = reason
+
+    def resolve(self, task: dict):
+        # Tasks outside any category (inbox, root) have no path, same as before
+        parent_id = task.get("parentId")
+        if parent_id not in self.nodes:
+            return None
+
+        return self.path(parent_id)
+
+    def resolve_ids(self, parent_ids: pd.Series) -> pd.DataFrame:
+        # parent and category for a column of parent ids, each distinct id is
+        # resolved once. Rows that no longer resolve are NaN
+        codes, unique_ids = pd.factorize(parent_ids)
+        unique_paths = [
+            self.path(x) if x in self.nodes else None for x in unique_ids
+        ] + [None]
+
+        return (
+            pd.DataFrame(
+                data={
+                    "parent": [np.nan if x is None else x[0] for x in unique_paths],
+                    "category": [np.nan if x is None else x[1] for x in unique_paths],
+                }
+            )
+            .iloc[codes]
+            .set_index(parent_ids.index)
+        )
+
+    def report(self, stage: str):
+        if len(self.broken) > 0:
+            warnings.warn(
+                f"{stage}: tasks under categories with a broken parent chain "
+                f"were left out: {dict(sorted(self.broken.items()))}",
+                Broken_Category_Warning,
+            )
 
 
 class Marvin_Processor:
 
     endpoint = "https://serv.amazingmarvin.com/api/"
+    # Docs per _changes request during an incremental sync
+    changes_batch_size = 10000
+    # Docs per _find request, each page is parsed before the next is fetched
+    find_page_size = 2000
+    # Only the fields the parsers read
+    doc_fields = {
+        "Categories": ["_id", "title", "parentId"],
+        "Tasks": [
+            "_id",
+            "title",
+            "day",
+            "parentId",
+            "times",
+            "duration",
+            "timeEstimate",
+        ],
+        "Habits": ["_id", "id", "title", "isPositive", "target", "period", "history"],
+    }
+
+    # One connection per sync database, shared by the task and habit syncs
+    couch_server_dbs = {}
+    couch_server_dbs_lock = threading.Lock()
 
     def get_couch_server_db(user_config: dict):
 
         marvin_config = user_config["marvin_config"]
-
-        couch = couchdb.Server(marvin_config["sync_server"])
-        couch.resource.credentials = (
+        server_key = (
+            marvin_config["sync_server"],
             marvin_config["sync_user"],
-            marvin_config["sync_password"],
+            marvin_config["sync_database"],
         )
-        server_DB = couch[marvin_config["sync_database"]]
 
-        return server_DB
-
-    def parse_task_duration(task):
-
-        # If this, seems like calData may be the thing to get?
-        if task.get("times") is None:
-            start_time = None
-            end_time = None
-            duration = None
-        else:
-            start_time = (
-                None
-                if len(task["times"]) == 0
-                else pd.to_datetime(
-                    datetime.date.fromtimestamp(
-                        task["times"][0] / Data_Getter_Utils.milliseconds_in_seconds
-                    )
+        with Marvin_Processor.couch_server_dbs_lock:
+            if server_key not in Marvin_Processor.couch_server_dbs:
+                couch = couchdb.Server(marvin_config["sync_server"])
+                couch.resource.credentials = (
+                    marvin_config["sync_user"],
+                    marvin_config["sync_password"],
                 )
-            )
+                Marvin_Processor.couch_server_dbs[server_key] = couch[
+                    marvin_config["sync_database"]
+                ]
+
+            return Marvin_Processor.couch_server_dbs[server_key]
+
+    def find_docs(server_db, db_name: str, fields: list = None) -> Iterator[dict]:
+        # Streams every doc of a Marvin db, a page at a time. Database.find
+        # drops the bookmark, so a query only ever saw CouchDB's default first
+        # 25 docs
+        mango_query = {
+            "selector": {"db": db_name},
+            "limit": Marvin_Processor.find_page_size,
+        }
+        if fields is not None:
+            mango_query["fields"] = fields
+
+        while True:
+            _, _, page = server_db.resource.post_json("_find", mango_query)
+            yield from page["docs"]
+
+            if len(page["docs"]) < Marvin_Processor.find_page_size:
+                break
+
+            mango_query["bookmark"] = page["bookmark"]
+
+    def marvin_dates(marvin_times) -> pd.DatetimeIndex:
+        # Millisecond timestamps -> local calendar day, what
+        # datetime.date.fromtimestamp gives, for a whole column at once. The
+        # local UTC offset is only looked up once per distinct hour
+        marvin_times = np.asarray(marvin_times, dtype=float)
+        timed = ~np.isnan(marvin_times)
+
+        hours, hour_positions = np.unique(
+            marvin_times[timed] // Data_Getter_Utils.milliseconds_in_hours,
+            return_inverse=True,
+        )
+        hour_offsets = np.array(
+            [
+                datetime.datetime.fromtimestamp(x * 3600)
+                .astimezone()
+                .utcoffset()
+                .total_seconds()
+                * Data_Getter_Utils.milliseconds_in_seconds
+                for x in hours
+            ]
+        )
 
-            end_time = (
-                None
-                if len(task["times"]) == 0
-                else pd.to_datetime(
-                    datetime.date.fromtimestamp(
-                        task["times"][1] / Data_Getter_Utils.milliseconds_in_seconds
-                    )
-                )
-            )
+        local_times = marvin_times.copy()
+        if len(hours) > 0:
+            local_times[timed] += hour_offsets[hour_positions]
 
-            duration = task["duration"] / Data_Getter_Utils.milliseconds_in_hours
+        return pd.DatetimeIndex(pd.to_datetime(local_times, unit="ms")).normalize()
 
-        return duration, start_time, end_time
+    def parse_tasks(tasks, category_tree) -> pd.DataFrame:
+        # Couch docs -> column lists in one pass, the frame is built once
+        columns = {
+            x: []
+            for x in [
+                "name",
+                "day",
+                "time_estimate",
+                "parent",
+                "category",
+                "start_time",
+                "end_time",
+                "duration",
+                "doc_id",
+                "parent_id",
+            ]
+        }
 
-    def get_parent_list(task, categories):
+        for task in tasks:
+            category_path = category_tree.resolve(task)
 
-        parent_val = [item for item in categories if item["_id"] == task["parentId"]]
+            if category_path is None:
+                continue
 
-        if len(parent_val) == 0:
-            return []
+            # No times when untracked, seems like calData may be the thing to get?
+            times = task.get("times")
+            tracked = times is not None
 
-        parent = parent_val[0]
-        parent_list = [parent]
+            columns["name"].append(task["title"])
+            columns["day"].append(task.get("day"))
+            columns["time_estimate"].append(task.get("timeEstimate"))
+            columns["parent"].append(category_path[0])
+            columns["category"].append(category_path[1])
+            columns["start_time"].append(
+                times[0] if tracked and len(times) > 0 else np.nan
+            )
+            columns["end_time"].append(
+                times[1] if tracked and len(times) > 1 else np.nan
+            )
+            columns["duration"].append(task.get("duration") if tracked else None)
+            columns["doc_id"].append(task.get("_id"))
+            columns["parent_id"].append(task["parentId"])
 
-        while parent["parentId"] != "root":
-            parent = [item for item in categories if item["_id"] == parent["parentId"]][
-                0
-            ]
-            parent_list.append(parent)
+        task_df = pd.DataFrame(data=columns)
 
-        return parent_list
+        for col in ["time_estimate", "duration"]:
+            task_df[col] = (
+                pd.to_numeric(task_df[col], errors="coerce")
+                / Data_Getter_Utils.milliseconds_in_hours
+            )
 
-    def parse_task(task, categories):
+        for col in ["start_time", "end_time"]:
+            task_df[col] = Marvin_Processor.marvin_dates(task_df[col])
 
-        parent_list = Marvin_Processor.get_parent_list(task, categories)
+        return task_df
 
-        if len(parent_list) == 0:
-            return pd.DataFrame()
+    def parse_habits(habits) -> pd.DataFrame:
+        # Every habit's interleaved [time, count, ...] history flattened into
+        # one array in a single pass, metadata repeated onto it by position
+        habit_cols = ["id", "name", "positive", "target", "period", "doc_id"]
+        metadata = {x: [] for x in habit_cols}
+        histories = []
+        pair_counts = []
+
+        for habit in habits:
+            habit_history = habit.get("history") or []
+            # An odd trailing time has no count, zip left it out too
+            pair_count = len(habit_history) // 2
+
+            histories.append(habit_history[: pair_count * 2])
+            pair_counts.append(pair_count)
+
+            metadata["id"].append(habit.get("id"))
+            metadata["name"].append(habit.get("title"))
+            metadata["positive"].append(habit.get("isPositive"))
+            metadata["target"].append(habit.get("target"))
+            metadata["period"].append(habit.get("period"))
+            metadata["doc_id"].append(habit.get("_id"))
+
+        flat_history = np.asarray(list(itertools.chain.from_iterable(histories)))
+        habit_positions = np.repeat(np.arange(len(pair_counts)), pair_counts)
+
+        # Typed from the habits that have history, like the per habit frames
+        habits_df = (
+            pd.DataFrame(data=metadata, dtype=object)
+            .iloc[habit_positions]
+            .infer_objects()
+        )
+        habits_df = pd.concat(
+            [
+                pd.DataFrame(
+                    data={
+                        "marvin_time": flat_history[0::2],
+                        "count": flat_history[1::2],
+                        "habit": habit_positions,
+                    }
+                ),
+                habits_df.reset_index(drop=True),
+            ],
+            axis=1,
+        )
 
-        parent_sequence = "/".join([o["title"] for o in parent_list])
+        # A time logged twice keeps its last count, as the per habit dict did
+        habits_df = habits_df.drop_duplicates(["habit", "marvin_time"], keep="last")
 
-        duration, start_time, end_time = Marvin_Processor.parse_task_duration(task)
+        timestamps = Marvin_Processor.marvin_dates(habits_df["marvin_time"])
+        habits_df.insert(0, "timestamp", timestamps)
+        habits_df["week_number"] = timestamps.isocalendar().week.values
 
-        time_estimate = task.get("timeEstimate")
-        time_estimate = (
-            None
-            if time_estimate is None
-            else time_estimate / Data_Getter_Utils.milliseconds_in_hours
-        )
+        return habits_df.drop(columns="habit").reset_index(drop=True)
 
-        return pd.DataFrame(
-            data={
-                "name": [task["title"]],
-                "day": [task["day"]],
-                "time_estimate": [time_estimate],
-                "parent": [parent_sequence],
-                "category": [parent_list[-1]["title"]],
-                "start_time": [start_time],
-                "end_time": [end_time],
-                "duration": [duration],
-            }
-        )
+    def current_seq(server_db):
+        # Taken before a full read, changes made during it are replayed by the
+        # next incremental sync
+        return server_db.changes(since="now")["last_seq"]
 
-    def parse_habits(habit):
+    def read_changes(server_db, since, db_names: list) -> tuple:
+        # Latest version of each doc changed after since, None if deleted.
+        # Deleted docs lose their db field, so they're passed on regardless
+        changed_docs = {}
 
-        habit_history = habit.get("history")
+        while True:
+            feed = server_db.changes(
+                since=since,
+                limit=Marvin_Processor.changes_batch_size,
+                include_docs=True,
+            )
 
-        history_df = pd.DataFrame.from_dict(
-            dict(zip(habit_history[::2], habit_history[1::2])), orient="index"
-        ).reset_index(drop=False)
+            for change in feed["results"]:
+                doc = change.get("doc")
+
+                if change.get("deleted") or doc is None or doc.get("_deleted"):
+                    changed_docs[change["id"]] = None
+                elif doc.get("db") in db_names:
+                    changed_docs[change["id"]] = doc
+
+            since = feed["last_seq"]
+            if len(feed["results"]) == 0 or not feed.get("pending", 0):
+                break
+
+        return changed_docs, since
+
+    def load_synced(data_name: str, required_cols: list) -> tuple:
+        # Stored table and the sequence it's synced to. Incremental only when
+        # the table has the doc ids to apply changes to
+        sync_state = Sync_State.get(Data_Getter_Utils.cache_dir, data_name)
+        if sync_state is None:
+            return None, None
+
+        try:
+            stored_df = Data_Getter_Utils().get_latest_file(data_name)
+        except ValueError:
+            return None, None
+
+        if not set(required_cols) <= set(stored_df.columns):
+            return None, None
+
+        return sync_state["since"], stored_df
+
+    def set_sync_since(data_name: str, since):
+        # Only moved once the table is safely written
+        Sync_State.set(
+            Data_Getter_Utils.cache_dir,
+            data_name,
+            {
+                "since": since,
+                "synced": datetime.datetime.now().isoformat(timespec="seconds"),
+            },
+        )
 
-        history_df.rename(columns={"index": "marvin_time", 0: "count"}, inplace=True)
+    def get_marvin_task_data(user_config: dict, incremental: bool = False):
+        # incremental pulls only the docs changed since the last sync from the
+        # _changes feed and applies them to the stored tasks and categories
+        server_db = Marvin_Processor.get_couch_server_db(user_config)
 
-        history_df[["id", "name", "positive", "target", "period"]] = [
-            habit.get("id"),
-            habit.get("title"),
-            habit.get("isPositive"),
-            habit.get("target"),
-            habit.get("period"),
-        ]
+        since = None
+        if incremental:
+            since, task_df = Marvin_Processor.load_synced(
+                "marvin_tasks", ["doc_id", "parent_id"]
+            )
+            category_since, category_df = Marvin_Processor.load_synced(
+                "marvin_categories", ["_id"]
+            )
+            if category_since != since:
+                since = None
 
-        history_df["timestamp"] = (
-            history_df["marvin_time"] / Data_Getter_Utils.milliseconds_in_seconds
-        ).map(datetime.date.fromtimestamp)
+        if since is None:
+            since = Marvin_Processor.current_seq(server_db)
 
-        history_df["timestamp"] = pd.to_datetime(history_df["timestamp"])
+            category_docs = list(
+                Marvin_Processor.find_docs(
+                    server_db, "Categories", Marvin_Processor.doc_fields["Categories"]
+                )
+            )
+            category_tree = Category_Tree(category_docs)
+            task_df = Marvin_Processor.parse_tasks(
+                Marvin_Processor.find_docs(
+                    server_db, "Tasks", Marvin_Processor.doc_fields["Tasks"]
+                ),
+                category_tree,
+            )
+        else:
+            changed_docs, since = Marvin_Processor.read_changes(
+                server_db, since, ["Categories", "Tasks"]
+            )
+            changed_categories = [
+                x
+                for x in changed_docs.values()
+                if x is not None and x["db"] == "Categories"
+            ]
+            changed_tasks = [
+                x for x in changed_docs.values() if x is not None and x["db"] == "Tasks"
+            ]
 
-        return history_df.set_index("timestamp")
+            replaced = category_df["_id"].isin(list(changed_docs))
+            category_changed = len(changed_categories) > 0 or replaced.any()
+            category_docs = (
+                category_df[~replaced].to_dict("records") + changed_categories
+            )
+            category_tree = Category_Tree(category_docs)
 
-    def get_marvin_task_data(user_config: dict):
+            task_df = task_df[~task_df["doc_id"].isin(list(changed_docs))]
 
-        server_db = Marvin_Processor.get_couch_server_db(user_config)
+            if category_changed:
+                # Renames and moves change the paths of tasks that didn't change
+                task_df = task_df.assign(
+                    **category_tree.resolve_ids(task_df["parent_id"])
+                ).dropna(subset=["parent"])
 
-        categories = list(server_db.find({"selector": {"db": "Categories"}}))
-        all_tasks = server_db.find({"selector": {"db": "Tasks"}})
+            task_df = pd.concat(
+                [task_df, Marvin_Processor.parse_tasks(changed_tasks, category_tree)],
+                ignore_index=True,
+            )
 
-        task_df = pd.concat(
-            map(Marvin_Processor.parse_task, all_tasks, repeat(categories))
-        )
+        category_tree.report("marvin_tasks")
         task_df = task_df[task_df["day"] != "unassigned"]
 
+        Data_Getter_Utils.write_temp_cache(
+            Marvin_Processor.category_df(category_docs), "marvin_categories"
+        )
         Data_Getter_Utils.write_temp_cache(task_df, "marvin_tasks")
 
-    def get_marvin_habit_data(user_name: str):
+        Marvin_Processor.set_sync_since("marvin_categories", since)
+        Marvin_Processor.set_sync_since("marvin_tasks", since)
+
+        return task_df
+
+    def category_df(category_docs: list) -> pd.DataFrame:
+        # Just what Category_Tree needs to rebuild the paths
+        return pd.DataFrame(
+            data={
+                x: [doc.get(x) for doc in category_docs]
+                for x in ["_id", "title", "parentId"]
+            }
+        )
+
+    def get_marvin_habit_data(user_name: str, incremental: bool = False):
 
         server_db = Marvin_Processor.get_couch_server_db(user_name)
 
-        habits = list(server_db.find({"selector": {"db": "Habits"}}))
+        since = None
+        if incremental:
+            since, habits_df = Marvin_Processor.load_synced("marvin_habits", ["doc_id"])
 
-        habits_df = pd.concat(map(Marvin_Processor.parse_habits, habits))
+        if since is None:
+            since = Marvin_Processor.current_seq(server_db)
 
-        habits_df["week_number"] = habits_df["week_number"] = (
-            pd.to_datetime(habits_df.index).isocalendar().week
-        )
+            habits_df = Marvin_Processor.parse_habits(
+                Marvin_Processor.find_docs(
+                    server_db, "Habits", Marvin_Processor.doc_fields["Habits"]
+                )
+            )
+        else:
+            changed_docs, since = Marvin_Processor.read_changes(
+                server_db, since, ["Habits"]
+            )
+
+            habits_df = habits_df[~habits_df["doc_id"].isin(list(changed_docs))]
 
-        habits_df.reset_index(drop=False, inplace=True)
+            changed_habits = [x for x in changed_docs.values() if x is not None]
+            habits_df = pd.concat(
+                [habits_df, Marvin_Processor.parse_habits(changed_habits)],
+                ignore_index=True,
+            )
 
         Data_Getter_Utils.write_temp_cache(habits_df, "marvin_habits")
 
+        Marvin_Processor.set_sync_since("marvin_habits", since)
+
+        return habits_df
+
 
 class Marvin_Dashboard_Helpers:
     def format_task_df(task_df: pd.DataFrame, user_config: dict) -> pd.DataFrame:
@@ -213,9 +548,9 @@ class Marvin_Dashboard_Helpers:
         # TODO handle these when get to aggreations, for now only 1
         habit_df = habit_df[habit_df["period"] == "week"]
 
-        week_habits_df = habit_df.groupby(group_cols, as_index=False).agg(
-            {"count": "sum", "target": "mean"}
-        )
+        week_habits_df = habit_df.groupby(
+            group_cols, as_index=False, observed=True
+        ).agg({"count": "sum", "target": "mean"})
 
         return week_habits_df[group_cols + ["count", "target"]].rename(
             columns={"count": "value"}
@@ -4,18 +4,34 @@ import pandas as pd
 import numpy as np
 import mintapi
 import json
-
-from typing import List
+import hashlib
+import itertools
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+from datetime import datetime
+from typing import Iterator, List
+from mintapi.filters import DateFilter
 from webdriver_manager.firefox import GeckoDriverManager
 from seleniumrequests import Firefox
 
 from data_getters.utils import Data_Getter_Utils
+from data_getters.sync_state import Sync_State
+from data_getters.balance_history import Balance_History
 from dash_files.dashboard_utils import (
     aggregate_monthly_df,
 )
 
 
 class Mint_API_Getter:
+
+    # Entries turned into a frame at a time when streaming a Mint response
+    batch_size = 100000
+    # Incremental syncs refetch this far back from the watermark, Mint keeps
+    # editing recent transactions (pending posts, recategorizations)
+    resync_days = 14
+
     # https://github.com/mintapi/mintapi
     def get_mint_conn(login_config: dict):
         driver = Firefox(executable_path=GeckoDriverManager().install())
@@ -31,39 +47,85 @@ class Mint_API_Getter:
             driver=driver,
         )
 
-    def process_mint_df(mint_json_return: json, ret_cols: List[str]) -> pd.DataFrame:
-        ret_df = pd.DataFrame()
+    def flat_columns(ret_cols: List[str], nested_cols: dict = None) -> List[str]:
+        # Nested fields come out under their own name, e.g. category.parentName
+        # becomes parentName
+        nested_cols = nested_cols or {}
+        flat_cols = [x for x in ret_cols if x not in nested_cols]
+
+        for fields in nested_cols.values():
+            flat_cols += fields
+
+        if len(set(flat_cols)) != len(flat_cols):
+            raise ValueError(f"Nested fields {nested_cols} clash with {ret_cols}!")
+
+        return flat_cols
+
+    def mint_record_batches(
+        mint_json_return: json,
+        ret_cols: List[str],
+        nested_cols: dict = None,
+        batch_size: int = None,
+    ) -> Iterator[pd.DataFrame]:
+        # Only ret_cols are pulled out of each entry, and the fields listed in
+        # nested_cols out of nested objects like category. Missing values are None
+        nested_cols = nested_cols or {}
+        batch_size = batch_size or Mint_API_Getter.batch_size
+
+        flat_cols = Mint_API_Getter.flat_columns(ret_cols, nested_cols)
+        top_cols = [x for x in ret_cols if x not in nested_cols]
+        nested_fields = [
+            (col, field) for col, fields in nested_cols.items() for field in fields
+        ]
 
-        for entry in mint_json_return:
-            ret_df = pd.concat(
-                [ret_df, pd.DataFrame.from_dict(entry, orient="index").T]
+        entries = iter(mint_json_return)
+
+        while True:
+            batch = list(itertools.islice(entries, batch_size))
+            if len(batch) == 0:
+                return
+
+            yield pd.DataFrame.from_records(
+                [
+                    [entry.get(col) for col in top_cols]
+                    + [
+                        (entry.get(col) or {}).get(field)
+                        for col, field in nested_fields
+                    ]
+                    for entry in batch
+                ],
+                columns=flat_cols,
             )
 
-        ret_df = ret_df[ret_cols].reset_index(drop=True)
+    def process_mint_df(
+        mint_json_return: json, ret_cols: List[str], nested_cols: dict = None
+    ) -> pd.DataFrame:
+        flat_cols = Mint_API_Getter.flat_columns(ret_cols, nested_cols)
+        batch_dfs = list(
+            Mint_API_Getter.mint_record_batches(mint_json_return, ret_cols, nested_cols)
+        )
 
-        return ret_df
+        if len(batch_dfs) == 0:
+            return pd.DataFrame(columns=flat_cols)
 
-    def expand_category_col(df, ret_cols, keep_names):
-        df = pd.concat(
-            [
-                df.drop(columns={"category"}),
-                df["category"].apply(pd.Series),
-            ],
-            axis=1,
-        )
+        ret_df = pd.concat(batch_dfs, ignore_index=True)
 
-        ret_cols = set(ret_cols) - set(["category"])
-        ret_cols = list(ret_cols) + keep_names
+        # Nested fields are category names and the like, few distinct values
+        for fields in (nested_cols or {}).values():
+            for field in fields:
+                ret_df[field] = ret_df[field].astype("category")
 
-        return df[ret_cols]
+        return ret_df
 
     def close_mint_conn(mint_conn):
         mint_conn.close()
 
     def get_accounts_df(mint_conn, user_name: str):
-        accounts = mint_conn.get_account_data()
+        return Mint_API_Getter.process_accounts(mint_conn.get_account_data(), user_name)
 
+    def process_accounts(accounts: json, user_name: str):
         ret_cols = [
+            "id",
             "name",
             "type",
             "systemStatus",
@@ -76,29 +138,168 @@ class Mint_API_Getter:
         Data_Getter_Utils.write_temp_cache(
             accounts_df, f"mint_accounts_raw_{user_name}"
         )
+        Balance_History.record(accounts_df, user_name)
 
         return accounts_df
 
-    def get_transactions_df(mint_conn, user_name: str):
-        transactions = mint_conn.get_transaction_data(limit=1000000)
+    def watermark_key(user_name: str) -> str:
+        return f"mint_transactions_{user_name}"
+
+    def unclean_key(user_name: str) -> str:
+        return f"mint_unclean_{user_name}"
+
+    def mark_unclean(user_name: str, resync_from: pd.Timestamp):
+        # Lowered to the earliest day changed by any sync since the last clean,
+        # so a sync that's never cleaned isn't skipped by the next one. None
+        # means everything changed
+        with Sync_State.lock:
+            unclean = Sync_State.get(
+                Data_Getter_Utils.cache_dir, Mint_API_Getter.unclean_key(user_name)
+            )
+            if unclean is not None:
+                if unclean["resync_from"] is None or resync_from is None:
+                    resync_from = None
+                else:
+                    resync_from = min(resync_from, pd.Timestamp(unclean["resync_from"]))
+
+            Sync_State.set(
+                Data_Getter_Utils.cache_dir,
+                Mint_API_Getter.unclean_key(user_name),
+                {
+                    "resync_from": (
+                        None
+                        if resync_from is None
+                        else resync_from.strftime("%Y-%m-%d")
+                    )
+                },
+            )
+
+    def merge_transactions(
+        history_df: pd.DataFrame, new_df: pd.DataFrame, resync_from: pd.Timestamp
+    ):
+        # The refetched window replaces the stored one, so edits and deletions in
+        # it are picked up. Returns the merged history and the first day changed
+        history_df = history_df.copy()
+        new_df = new_df.copy()
+        history_df["date"] = pd.to_datetime(history_df["date"])
+        new_df["date"] = pd.to_datetime(new_df["date"])
+
+        kept_df = history_df[history_df["date"] < resync_from]
+
+        # A transaction moved back out of the window is in both, the fetched
+        # copy wins. Histories written before ids were kept only have NaN ids
+        if "id" in kept_df.columns:
+            moved = kept_df["id"].notna() & kept_df["id"].isin(new_df["id"])
+            if moved.any():
+                resync_from = min(resync_from, kept_df.loc[moved, "date"].min())
+            kept_df = kept_df[~moved]
+
+        merged_df = pd.concat([kept_df, new_df], ignore_index=True)
+
+        return (
+            merged_df.sort_values("date", kind="stable", ignore_index=True),
+            resync_from,
+        )
+
+    def get_transactions_df(mint_conn, user_name: str, incremental: bool = False):
+        return Mint_API_Getter.process_transactions(
+            Mint_API_Getter.fetch_transactions(mint_conn, user_name, incremental),
+            user_name,
+        )
+
+    def fetch_transactions(mint_conn, user_name: str, incremental: bool = False):
+        # incremental: only fetch from resync_days before the stored watermark
+        # and merge into the cached history. Falls back to a full fetch when
+        # there's no watermark or no history yet
+        data_name = f"mint_transactions_raw_{user_name}"
+
+        watermark = None
+        if incremental:
+            watermark = Sync_State.get(
+                Data_Getter_Utils.cache_dir, Mint_API_Getter.watermark_key(user_name)
+            )
+
+        history_df = None
+        if watermark is not None:
+            try:
+                history_df = Data_Getter_Utils().get_latest_file(data_name)
+            except ValueError:
+                watermark = None
+
+        if watermark is None:
+            return {
+                "transactions": mint_conn.get_transaction_data(limit=1000000),
+                "history_df": None,
+                "resync_from": None,
+            }
+
+        resync_from = pd.Timestamp(watermark["date"]) - pd.Timedelta(
+            days=Mint_API_Getter.resync_days
+        )
 
-        ret_cols = ["date", "description", "amount", "type", "category", "accountId"]
+        return {
+            "transactions": mint_conn.get_transaction_data(
+                date_filter=DateFilter.Options.CUSTOM,
+                start_date=resync_from.strftime("%Y-%m-%d"),
+                end_date=datetime.now().strftime("%Y-%m-%d"),
+                limit=1000000,
+            ),
+            "history_df": history_df,
+            "resync_from": resync_from,
+        }
 
-        transactions_df = Mint_API_Getter.process_mint_df(transactions, ret_cols)
+    def process_transactions(payload: dict, user_name: str):
+        ret_cols = [
+            "id",
+            "date",
+            "description",
+            "amount",
+            "type",
+            "category",
+            "accountId",
+        ]
+        nested_cols = {"category": ["name", "parentName"]}
 
-        transactions_df = Mint_API_Getter.expand_category_col(
-            transactions_df, ret_cols, ["name", "parentName"]
+        transactions_df = Mint_API_Getter.process_mint_df(
+            payload["transactions"], ret_cols, nested_cols
         )
 
+        resync_from = payload["resync_from"]
+        if payload["history_df"] is not None:
+            transactions_df, resync_from = Mint_API_Getter.merge_transactions(
+                payload["history_df"], transactions_df, resync_from
+            )
+
+        # Unchanged months hash the same and aren't rewritten
         Data_Getter_Utils.write_temp_cache(
             transactions_df, f"mint_transactions_raw_{user_name}"
         )
 
+        if len(transactions_df) == 0:
+            return transactions_df
+
+        # Only moved once the history is safely written
+        transactions_df["date"] = pd.to_datetime(transactions_df["date"])
+        last_transaction = transactions_df.loc[transactions_df["date"].idxmax()]
+        Sync_State.set(
+            Data_Getter_Utils.cache_dir,
+            Mint_API_Getter.watermark_key(user_name),
+            {
+                "date": last_transaction["date"].strftime("%Y-%m-%d"),
+                "id": str(last_transaction["id"]),
+                "synced": datetime.now().isoformat(timespec="seconds"),
+            },
+        )
+        Mint_API_Getter.mark_unclean(user_name, resync_from)
+
         return transactions_df
 
     def get_investments_df(mint_conn, user_name: str):
-        investments = mint_conn.get_investment_data()
+        return Mint_API_Getter.process_investments(
+            mint_conn.get_investment_data(), user_name
+        )
 
+    def process_investments(investments: json, user_name: str):
         ret_cols = [
             # TODO not always there in all datasets, why?
             # "symbol",
@@ -118,19 +319,162 @@ class Mint_API_Getter:
         return investments_df
 
     def get_budgets_df(mint_conn, user_name: str):
-        budgets = mint_conn.get_budget_data()
+        return Mint_API_Getter.process_budgets(mint_conn.get_budget_data(), user_name)
 
+    def process_budgets(budgets: json, user_name: str):
         ret_cols = ["budgetDate", "category", "amount", "budgetAmount"]
-        budgets_df = Mint_API_Getter.process_mint_df(budgets, ret_cols)
-
-        budgets_df = Mint_API_Getter.expand_category_col(budgets_df, ret_cols, ["name"])
+        budgets_df = Mint_API_Getter.process_mint_df(
+            budgets, ret_cols, nested_cols={"category": ["name"]}
+        )
 
         Data_Getter_Utils.write_temp_cache(budgets_df, f"mint_budgets_raw_{user_name}")
 
         return budgets_df
 
+    def ingest_user(
+        login_config: dict, user_name: str, process_pool, incremental: bool = False
+    ) -> dict:
+        # The Selenium session isn't thread safe, its requests stay serial. Each
+        # payload is processed and cached on process_pool while the next one
+        # downloads. Transactions go first, they take longest to process
+        mint_conn = Mint_API_Getter.get_mint_conn(login_config)
+
+        futures = {}
+        try:
+            futures["transactions"] = process_pool.submit(
+                Mint_API_Getter.process_transactions,
+                Mint_API_Getter.fetch_transactions(mint_conn, user_name, incremental),
+                user_name,
+            )
+            futures["investments"] = process_pool.submit(
+                Mint_API_Getter.process_investments,
+                mint_conn.get_investment_data(),
+                user_name,
+            )
+            futures["accounts"] = process_pool.submit(
+                Mint_API_Getter.process_accounts,
+                mint_conn.get_account_data(),
+                user_name,
+            )
+            futures["budgets"] = process_pool.submit(
+                Mint_API_Getter.process_budgets, mint_conn.get_budget_data(), user_name
+            )
+        finally:
+            Mint_API_Getter.close_mint_conn(mint_conn)
+
+        return {name: future.result() for name, future in futures.items()}
+
+    def ingest_users(
+        mint_logins: dict, max_workers: int = None, incremental: bool = False
+    ) -> dict:
+        # One session per user, all logged in at once, so a household refresh
+        # takes as long as its slowest user. max_workers sizes the pool shared
+        # by every user's payload processing
+        with ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="mint_process"
+        ) as process_pool, ThreadPoolExecutor(
+            max_workers=max(len(mint_logins), 1), thread_name_prefix="mint_session"
+        ) as session_pool:
+            futures = {
+                user_name: session_pool.submit(
+                    Mint_API_Getter.ingest_user,
+                    login_config,
+                    user_name,
+                    process_pool,
+                    incremental,
+                )
+                for user_name, login_config in mint_logins.items()
+            }
+
+            return {user_name: future.result() for user_name, future in futures.items()}
+
+
+class Unmapped_Category_Warning(UserWarning):
+    pass
+
+
+class Category_Mapper:
+
+    # Mint category name -> aggregate and meta category, compiled once per
+    # mapping config. Rows used to be inner merged against the melted config,
+    # which silently dropped any name missing from it
+
+    def __init__(self, user_config: dict):
+        category_df = Mint_Processor.get_category_df(user_config)
+
+        # A name listed under two categories would have been double counted by
+        # the merge, the first listing wins
+        category_df = category_df.drop_duplicates("name")
+
+        self.config_hash = Category_Mapper.config_hash(user_config)
+        self.names = pd.Index(category_df["name"])
+        self.categories = pd.Categorical(category_df["category"])
+        self.meta_categories = pd.Categorical(category_df["meta_category"])
+
+    def config_hash(user_config: dict) -> str:
+        mapping = {
+            "aggregate_categories": user_config["aggregate_categories"],
+            "meta_categories": user_config["meta_categories"],
+        }
+
+        return hashlib.blake2b(
+            json.dumps(mapping, sort_keys=True).encode(), digest_size=16
+        ).hexdigest()
+
+    def positions(self, names: pd.Series) -> np.ndarray:
+        # Categorical names are looked up once per distinct name, then spread
+        # to rows by their codes. -1 where the name isn't mapped
+        if isinstance(names.dtype, pd.CategoricalDtype):
+            category_pos = self.names.get_indexer(names.cat.categories)
+            codes = names.cat.codes.values
+
+            return np.where(codes >= 0, category_pos[codes], -1)
+
+        return self.names.get_indexer(names)
+
+    def map(self, names: pd.Series) -> pd.DataFrame:
+        positions = self.positions(names)
+        mapped = positions >= 0
+
+        categories = self.categories.take(positions, allow_fill=True)
+        meta_categories = self.meta_categories.take(positions, allow_fill=True)
+
+        return pd.DataFrame(
+            data={
+                "category": categories,
+                "meta_category": meta_categories,
+                "mapped": mapped,
+            },
+            index=names.index,
+        )
+
+    def map_rows(self, df: pd.DataFrame, stage: str) -> pd.DataFrame:
+        # Adds category and meta_category, drops rows that couldn't be mapped
+        # and warns about their names so they can be added to the config
+        mapped_df = self.map(df["name"])
+        mapped = mapped_df["mapped"].values
+
+        unmapped_names = df["name"][~mapped & df["name"].notna().values]
+        if len(unmapped_names) > 0:
+            warnings.warn(
+                f"{stage}: Mint categories missing from the category config "
+                f"were left out: {sorted(unmapped_names.astype(str).unique())}",
+                Unmapped_Category_Warning,
+            )
+
+        df = df.assign(
+            category=mapped_df["category"], meta_category=mapped_df["meta_category"]
+        )
+
+        return df[mapped]
+
 
 class Mint_Processor:
+
+    # Compiled category mappers by config hash, shared by the cleaning stages
+    category_mappers = {}
+    category_mappers_lock = threading.Lock()
+
     def category_dict_to_df(category_dict: dict):
         category_df = pd.melt(
             pd.DataFrame(dict([(k, pd.Series(v)) for k, v in category_dict.items()]))
@@ -157,6 +501,17 @@ class Mint_Processor:
             columns={"category": "meta_category", "name": "category"}
         ).merge(agg_categories_df, on="category")
 
+    def get_category_mapper(user_config: dict) -> Category_Mapper:
+        config_hash = Category_Mapper.config_hash(user_config)
+
+        with Mint_Processor.category_mappers_lock:
+            if config_hash not in Mint_Processor.category_mappers:
+                Mint_Processor.category_mappers[config_hash] = Category_Mapper(
+                    user_config
+                )
+
+            return Mint_Processor.category_mappers[config_hash]
+
     def clean_budgets(user_config: dict, user_name: str):
         raw_budgets_df = (
             Data_Getter_Utils()
@@ -169,11 +524,11 @@ class Mint_Processor:
             raw_budgets_df["budgetDate"] == max(raw_budgets_df["budgetDate"])
         ]
 
-        category_df = Mint_Processor.get_category_df(user_config)
+        category_mapper = Mint_Processor.get_category_mapper(user_config)
 
         agg_budgets_df = (
-            raw_budgets_df.merge(category_df, on="name")
-            .groupby(["category"], as_index=False)
+            category_mapper.map_rows(raw_budgets_df, f"mint_budgets_raw_{user_name}")
+            .groupby(["category"], as_index=False, observed=True)
             .agg({"budgetAmount": "sum"})
         )
 
@@ -190,11 +545,9 @@ class Mint_Processor:
 
         return agg_budgets_df
 
-    def clean_transactions(user_config: dict, user_name: str):
-        raw_transactions_df = Data_Getter_Utils().get_latest_file(
-            f"mint_transactions_raw_{user_name}"
-        )
-
+    def aggregate_transactions(
+        raw_transactions_df: pd.DataFrame, category_mapper: Category_Mapper, stage: str
+    ) -> pd.DataFrame:
         raw_transactions_df["parentName"] = np.where(
             raw_transactions_df["parentName"] == "Root",
             raw_transactions_df["name"],
@@ -207,23 +560,111 @@ class Mint_Processor:
         raw_transactions_df["month"] = raw_transactions_df["date"].dt.month
         raw_transactions_df["day"] = raw_transactions_df["date"].dt.day
 
-        category_df = Mint_Processor.get_category_df(user_config)
-
-        agg_transactions_df = (
-            raw_transactions_df.merge(category_df, on="name")
-            .groupby(["year", "month", "day", "category"], as_index=False)
+        return (
+            category_mapper.map_rows(raw_transactions_df, stage)
+            .groupby(
+                ["year", "month", "day", "category"], as_index=False, observed=True
+            )
             .agg({"amount": "sum"})
         )
 
+    def clean_transactions(
+        user_config: dict,
+        user_name: str,
+        incremental: bool = False,
+        chunked: bool = False,
+    ):
+        # incremental: only days from the earliest resync_from of the syncs
+        # since the last clean are re-aggregated, older days are kept from the
+        # current daily_finances. A changed category mapping forces a full clean.
+        # chunked: stream the raw history a month at a time, peak memory stays
+        # flat however many years are kept
+        category_mapper = Mint_Processor.get_category_mapper(user_config)
+        clean_key = f"daily_finances_{user_name}"
+        clean_state = Sync_State.get(Data_Getter_Utils.cache_dir, clean_key) or {}
+
+        unclean_key = Mint_API_Getter.unclean_key(user_name)
+        unclean = Sync_State.get(Data_Getter_Utils.cache_dir, unclean_key)
+
+        since = None
+        if (
+            incremental
+            and clean_state.get("category_hash") == category_mapper.config_hash
+            and unclean is not None
+            and unclean["resync_from"] is not None
+        ):
+            since = pd.Timestamp(unclean["resync_from"])
+
+        kept_df = None
+        if since is not None:
+            try:
+                kept_df = Data_Getter_Utils().get_latest_file(
+                    f"daily_finances_{user_name}",
+                    filters=[("timestamp", "<", since)],
+                )
+            except ValueError:
+                since = None
+
+        raw_name = f"mint_transactions_raw_{user_name}"
+        raw_filters = None if since is None else [("date", ">=", since)]
+
+        if chunked:
+            # A month of raw transactions in memory at a time, plus the daily
+            # aggregates so far. Months don't share days, so the final groupby
+            # only puts them back in order and totals match the in-memory path
+            partial_dfs = [
+                Mint_Processor.aggregate_transactions(
+                    chunk_df, category_mapper, raw_name
+                )
+                for chunk_df in Data_Getter_Utils().iter_latest_file(
+                    raw_name, filters=raw_filters
+                )
+            ]
+            agg_transactions_df = (
+                pd.concat(
+                    partial_dfs
+                    or [
+                        pd.DataFrame(
+                            columns=["year", "month", "day", "category", "amount"]
+                        )
+                    ],
+                    ignore_index=True,
+                )
+                .groupby(
+                    ["year", "month", "day", "category"], as_index=False, observed=True
+                )
+                .agg({"amount": "sum"})
+            )
+        else:
+            agg_transactions_df = Mint_Processor.aggregate_transactions(
+                Data_Getter_Utils().get_latest_file(raw_name, filters=raw_filters),
+                category_mapper,
+                raw_name,
+            )
+
         agg_transactions_df["timestamp"] = pd.to_datetime(
             agg_transactions_df[["year", "month", "day"]]
         )
 
         agg_transactions_df.rename(columns={"amount": "total"}, inplace=True)
 
-        Data_Getter_Utils.write_temp_cache(
-            agg_transactions_df, f"daily_finances_{user_name}"
+        if kept_df is not None:
+            agg_transactions_df = pd.concat(
+                [kept_df, agg_transactions_df], ignore_index=True
+            )
+
+        Data_Getter_Utils.write_temp_cache(agg_transactions_df, clean_key)
+        Sync_State.set(
+            Data_Getter_Utils.cache_dir,
+            clean_key,
+            {"category_hash": category_mapper.config_hash},
         )
+
+        # Consumed, unless a sync lowered it again while cleaning
+        with Sync_State.lock:
+            if Sync_State.get(Data_Getter_Utils.cache_dir, unclean_key) == unclean:
+                Sync_State.clear(Data_Getter_Utils.cache_dir, unclean_key)
+
         return agg_transactions_df
 
     def clean_accounts(user_config: dict, user_name: str):
@@ -231,16 +672,9 @@ class Mint_Processor:
             f"mint_accounts_raw_{user_name}"
         )
 
-        conditions = [
-            raw_accounts_df["type"].isin(
-                ["CreditAccount", "BankAccount", "CashAccount"]
-            ),
-            raw_accounts_df["type"].isin(["InvestmentAccount"]),
-            raw_accounts_df["type"].isin(["LoanAccount"]),
-        ]
-        choices = ["bank", "investment", "loan"]
-
-        raw_accounts_df["account_type"] = np.select(conditions, choices, default=np.nan)
+        raw_accounts_df["account_type"] = Balance_History.account_type(
+            raw_accounts_df["type"]
+        )
 
         clean_accounts_df = (
             raw_accounts_df[raw_accounts_df["systemStatus"] == "ACTIVE"]
@@ -258,17 +692,25 @@ class Mint_Processor:
 
 
 class Finances_Dashboard_Helpers:
+
+    finance_prefix = "daily_finances"
+
     def get_month_sum_df(
-        finance_df: pd.DataFrame, remove_category_list=["bonus", "investment"]
+        finance_df: pd.DataFrame,
+        remove_category_list=["bonus", "investment"],
+        finance_cube=None,
     ):
-        regular_finances = finance_df[
-            ~finance_df["category"].isin(remove_category_list)
-        ]
-        month_sum_df = (
-            regular_finances.groupby(["year", "month"])
-            .agg({"total": "sum"})
-            .reset_index(drop=False)
-        )
+        if finance_cube is not None:
+            month_sum_df = finance_cube.month_totals(remove_category_list)
+        else:
+            regular_finances = finance_df[
+                ~finance_df["category"].isin(remove_category_list)
+            ]
+            month_sum_df = (
+                regular_finances.groupby(["year", "month"])
+                .agg({"total": "sum"})
+                .reset_index(drop=False)
+            )
 
         month_sum_df["day"] = 1
         month_sum_df["datetime"] = pd.to_datetime(
@@ -285,12 +727,20 @@ class Finances_Dashboard_Helpers:
         agg_str: str,
         housing_payment: int = 0,
         profit_target: int = 3000,
+        finance_cube=None,
     ):
         if agg_str == "week":
             agg_str = "month"
 
+        if finance_cube is not None:
+            filter_df = finance_cube.period_totals(year, month, agg_str)
+            return filter_df[
+                (abs(filter_df["total"]) > 100)
+                & ~(filter_df["category"].isin(["paycheck", "investments", "bonus"]))
+            ]
+
         monthly_df = finance_df.groupby(
-            ["year", "month", "category"], as_index=False
+            ["year", "month", "category"], as_index=False, observed=True
         ).agg({"total": "sum"})
         monthly_df = monthly_df.merge(budget_df, how="left", on="category")
         filter_df = aggregate_monthly_df(monthly_df, month, year, 0, agg_str)
@@ -300,7 +750,7 @@ class Finances_Dashboard_Helpers:
         )
 
         filter_df = (
-            filter_df.groupby("category")
+            filter_df.groupby("category", observed=True)
             .agg({"total": "sum", "budget": "sum"})
             .reset_index(drop=False)
         )
@@ -325,7 +775,13 @@ class Finances_Dashboard_Helpers:
         month: int,
         year: int,
         historical_start_year: int,
+        finance_cube=None,
     ):
+        if finance_cube is not None:
+            return finance_cube.what_if().shortfall(
+                profit_target, month, year, historical_start_year
+            )[0, 0]
+
         monthly_income = Finances_Dashboard_Helpers.get_monthly_income(
             finance_df, month, year
         )
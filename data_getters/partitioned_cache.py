@@ -0,0 +1,320 @@
+import os
+import json
+import shutil
+import hashlib
+import pandas as pd
+from datetime import datetime
+from typing import Iterator
+
+from data_getters.delta_snapshots import Delta_Snapshots
+from data_getters.cache_storage import (
+    apply_filters,
+    atomic_write_json,
+    filter_ops,
+    get_storage_backend,
+    write_with_fallback,
+)
+
+
+class Partitioned_Cache:
+
+    versions_file = "_versions.json"
+    undated_partition = "undated"
+    # Readers pin a version, keep the previous one around for anyone mid-read
+    keep_versions = 2
+
+    def dataset_dir(cache_dir: str, data_name: str) -> str:
+        return os.path.join(cache_dir, data_name)
+
+    def versions_path(cache_dir: str, data_name: str) -> str:
+        return os.path.join(
+            Partitioned_Cache.dataset_dir(cache_dir, data_name),
+            Partitioned_Cache.versions_file,
+        )
+
+    def load_versions(cache_dir: str, data_name: str) -> dict:
+        versions_path = Partitioned_Cache.versions_path(cache_dir, data_name)
+
+        if not os.path.exists(versions_path):
+            return {"current": 0, "versions": {}}
+
+        with open(versions_path) as json_file:
+            return json.load(json_file)
+
+    def save_versions(cache_dir: str, data_name: str, versions: dict):
+        atomic_write_json(
+            Partitioned_Cache.versions_path(cache_dir, data_name), versions
+        )
+
+    def partition_keys(df: pd.DataFrame, partition_col: str) -> pd.Series:
+        # errors="coerce" so marvin's "unassigned" days land in their own partition
+        dates = pd.to_datetime(df[partition_col], errors="coerce")
+
+        return dates.dt.strftime("%Y-%m").fillna(Partitioned_Cache.undated_partition)
+
+    def partition_hash(df: pd.DataFrame) -> str:
+        partition_hash = hashlib.blake2b()
+        partition_hash.update(",".join(map(str, df.columns)).encode())
+        partition_hash.update(
+            pd.util.hash_pandas_object(df, index=False).values.tobytes()
+        )
+
+        return partition_hash.hexdigest()
+
+    def write(
+        cache_dir: str,
+        data_name: str,
+        df: pd.DataFrame,
+        partition_col: str,
+        storage_format: str,
+        full: bool = True,
+        delta: bool = False,
+        key_cols: list = None,
+    ) -> dict:
+        # full=True: df is the whole history, months missing from it are dropped.
+        # full=False: df only holds the months being appended or replaced.
+        # delta=True stores a changed month as a diff against its base file
+        versions = Partitioned_Cache.load_versions(cache_dir, data_name)
+        current = versions["versions"].get(str(versions["current"]), {})
+        current_partitions = current.get("partitions", {})
+
+        new_version = versions["current"] + 1
+        partitions = {} if full else dict(current_partitions)
+
+        partition_keys = Partitioned_Cache.partition_keys(df, partition_col)
+
+        for key, partition_df in df.groupby(partition_keys, sort=True):
+            partition_df = partition_df.reset_index(drop=True)
+            partition_hash = Partitioned_Cache.partition_hash(partition_df)
+
+            existing = current_partitions.get(key)
+            if existing is not None and existing["hash"] == partition_hash:
+                partitions[key] = existing
+                continue
+
+            partitions[key] = Partitioned_Cache.write_partition(
+                Partitioned_Cache.dataset_dir(cache_dir, data_name),
+                key,
+                partition_df,
+                new_version,
+                storage_format,
+                existing if delta else None,
+                key_cols,
+            )
+            partitions[key]["hash"] = partition_hash
+
+        versions["versions"][str(new_version)] = {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "columns": [str(x) for x in df.columns],
+            "partition_col": partition_col,
+            "partitions": partitions,
+        }
+        versions["current"] = new_version
+
+        os.makedirs(Partitioned_Cache.dataset_dir(cache_dir, data_name), exist_ok=True)
+        Partitioned_Cache.save_versions(cache_dir, data_name, versions)
+
+        Partitioned_Cache.prune(cache_dir, data_name, Partitioned_Cache.keep_versions)
+
+        return dict(versions["versions"][str(new_version)], version=new_version)
+
+    def has_keys(df: pd.DataFrame, key_cols: list) -> bool:
+        if not set(key_cols) <= set(df.columns):
+            return False
+
+        return not df[key_cols].isna().any().any()
+
+    def write_partition(
+        dataset_dir: str,
+        key: str,
+        partition_df: pd.DataFrame,
+        version: int,
+        storage_format: str,
+        base: dict = None,
+        key_cols: list = None,
+    ) -> dict:
+        partition_dir = os.path.join(dataset_dir, key)
+        os.makedirs(partition_dir, exist_ok=True)
+
+        if base is not None:
+            base_df = Partitioned_Cache.read_file(dataset_dir, base["file"])
+
+            # Months written before the key column existed, or with rows
+            # missing it, are diffed on whole rows
+            if key_cols is not None and not (
+                Partitioned_Cache.has_keys(base_df, key_cols)
+                and Partitioned_Cache.has_keys(partition_df, key_cols)
+            ):
+                key_cols = None
+
+            # Always diffed against the base, never the last delta, so reading
+            # a month is at most base + one delta
+            if list(base_df.columns) == list(partition_df.columns):
+                delta_df = Delta_Snapshots.diff(base_df, partition_df, key_cols)
+
+                if len(delta_df) <= Delta_Snapshots.rebase_ratio * len(partition_df):
+                    delta_path = write_with_fallback(
+                        delta_df,
+                        os.path.join(partition_dir, f"delta-{version:06d}"),
+                        storage_format,
+                    )
+
+                    return {
+                        "file": base["file"],
+                        "delta": os.path.relpath(delta_path, dataset_dir),
+                        "key_cols": key_cols,
+                        "rows": len(partition_df),
+                    }
+
+        file_path = write_with_fallback(
+            partition_df,
+            os.path.join(partition_dir, f"part-{version:06d}"),
+            storage_format,
+        )
+
+        return {
+            "file": os.path.relpath(file_path, dataset_dir),
+            "rows": len(partition_df),
+        }
+
+    def read_file(
+        dataset_dir: str, file: str, columns: list = None, filters: list = None
+    ) -> pd.DataFrame:
+        file_path = os.path.join(dataset_dir, file)
+
+        return get_storage_backend(file_path).read(file_path, columns, filters)
+
+    def read_partition(
+        dataset_dir: str, partition: dict, columns: list = None, filters: list = None
+    ) -> pd.DataFrame:
+        if partition.get("delta") is None:
+            return Partitioned_Cache.read_file(
+                dataset_dir, partition["file"], columns, filters
+            )
+
+        # Row ids cover every column, so the base has to be read whole
+        partition_df = Delta_Snapshots.apply(
+            Partitioned_Cache.read_file(dataset_dir, partition["file"]),
+            Partitioned_Cache.read_file(dataset_dir, partition["delta"]),
+            partition["key_cols"],
+        )
+        partition_df = apply_filters(partition_df, filters)
+
+        return partition_df if columns is None else partition_df[columns]
+
+    def partition_may_match(key: str, partition_col: str, filters: list) -> bool:
+        if key == Partitioned_Cache.undated_partition:
+            return True
+
+        month_start = pd.Timestamp(f"{key}-01")
+        month_end = month_start + pd.offsets.MonthBegin(1)
+        month_values = {"year": month_start.year, "month": month_start.month}
+
+        for col, op, value in filters or []:
+            if col in month_values:
+                if not filter_ops[op](pd.Series([month_values[col]]), value).iloc[0]:
+                    return False
+
+            elif col == partition_col and op in ["==", "=", "<", "<=", ">", ">="]:
+                # Rows in the partition fall in [month_start, month_end)
+                value = pd.Timestamp(value)
+                if op in [">", ">="] and value >= month_end:
+                    return False
+                if op == "<" and value <= month_start:
+                    return False
+                if op in ["<=", "==", "="] and value < month_start:
+                    return False
+                if op in ["==", "="] and value >= month_end:
+                    return False
+
+        return True
+
+    def iter_partitions(
+        cache_dir: str,
+        data_name: str,
+        version: int = None,
+        columns: list = None,
+        filters: list = None,
+    ) -> Iterator[pd.DataFrame]:
+        # One month at a time, oldest first. Months the filters rule out are
+        # never opened
+        versions = Partitioned_Cache.load_versions(cache_dir, data_name)
+        version = versions["current"] if version is None else version
+
+        if str(version) not in versions["versions"]:
+            raise ValueError(f"No version {version} for partitioned {data_name}!")
+
+        version_info = versions["versions"][str(version)]
+        dataset_dir = Partitioned_Cache.dataset_dir(cache_dir, data_name)
+
+        for key in sorted(version_info["partitions"]):
+            if Partitioned_Cache.partition_may_match(
+                key, version_info.get("partition_col"), filters
+            ):
+                yield Partitioned_Cache.read_partition(
+                    dataset_dir, version_info["partitions"][key], columns, filters
+                )
+
+    def read(
+        cache_dir: str,
+        data_name: str,
+        version: int = None,
+        columns: list = None,
+        filters: list = None,
+    ) -> pd.DataFrame:
+        partition_dfs = list(
+            Partitioned_Cache.iter_partitions(
+                cache_dir, data_name, version, columns, filters
+            )
+        )
+
+        if len(partition_dfs) == 0:
+            versions = Partitioned_Cache.load_versions(cache_dir, data_name)
+            version = versions["current"] if version is None else version
+
+            return pd.DataFrame(
+                columns=columns or versions["versions"][str(version)]["columns"]
+            )
+
+        return pd.concat(partition_dfs, ignore_index=True)
+
+    def remove_file(file_path: str):
+        try:
+            os.remove(file_path)
+        except PermissionError:
+            # Windows won't delete a file a running dashboard still has mapped,
+            # it's unreferenced so the next prune picks it up
+            pass
+
+    def prune(cache_dir: str, data_name: str, keep_versions: int):
+        versions = Partitioned_Cache.load_versions(cache_dir, data_name)
+
+        version_ids = sorted(int(x) for x in versions["versions"])
+        kept_ids = version_ids[-keep_versions:]
+
+        versions["versions"] = {str(x): versions["versions"][str(x)] for x in kept_ids}
+        Partitioned_Cache.save_versions(cache_dir, data_name, versions)
+
+        # Unchanged months are shared between versions, only drop unreferenced files
+        referenced = {
+            os.path.normpath(partition[file_key])
+            for version_info in versions["versions"].values()
+            for partition in version_info["partitions"].values()
+            for file_key in ["file", "delta"]
+            if partition.get(file_key) is not None
+        }
+
+        dataset_dir = Partitioned_Cache.dataset_dir(cache_dir, data_name)
+        for root, dirs, files in os.walk(dataset_dir):
+            for file in files:
+                rel_path = os.path.relpath(os.path.join(root, file), dataset_dir)
+                if (
+                    file != Partitioned_Cache.versions_file
+                    and rel_path not in referenced
+                ):
+                    Partitioned_Cache.remove_file(os.path.join(root, file))
+
+        for entry in os.listdir(dataset_dir):
+            entry_path = os.path.join(dataset_dir, entry)
+            if os.path.isdir(entry_path) and len(os.listdir(entry_path)) == 0:
+                shutil.rmtree(entry_path)
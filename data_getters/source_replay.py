@@ -0,0 +1,350 @@
+import os
+import json
+import time
+import threading
+from urllib.parse import urlsplit
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from data_getters import get_exist_data
+from data_getters.cache_storage import atomic_write_json
+from data_getters.get_exist_data import Exist_Processor
+from data_getters.get_marvin_data import Marvin_Processor
+from data_getters.get_mint_data import Mint_API_Getter
+
+
+class Source_Replay:
+
+    # Record real Mint, Exist and Marvin responses once, then serve them from
+    # local stand-ins so the whole refresh runs without network. Recordings are
+    # sanitized JSON files in a replay dir:
+    #   mint_<user>.json  payload per mintapi call
+    #   exist.json        response body per request path
+    #   marvin.json       every CouchDB doc, in sync order
+    # latency_seconds is slept before every stand-in response
+
+    # Credentials and account numbers never make it into a recording
+    sensitive_keys = {
+        "password",
+        "sync_password",
+        "token",
+        "mfa_token",
+        "login_email",
+        "email",
+        "username",
+        "accountNumber",
+        "accountNumberLast4",
+        "cpAccountNumberLast4",
+        "routingNumber",
+    }
+    replaced_value = "replay"
+
+    def sanitize(data):
+        if isinstance(data, dict):
+            return {
+                key: (
+                    Source_Replay.replaced_value
+                    if key in Source_Replay.sensitive_keys
+                    else Source_Replay.sanitize(value)
+                )
+                for key, value in data.items()
+            }
+
+        if isinstance(data, list):
+            return [Source_Replay.sanitize(x) for x in data]
+
+        return data
+
+    def save(replay_dir: str, file_name: str, data: dict):
+        os.makedirs(replay_dir, exist_ok=True)
+        atomic_write_json(
+            os.path.join(replay_dir, file_name), Source_Replay.sanitize(data)
+        )
+
+    def load(replay_dir: str, file_name: str) -> dict:
+        file_path = os.path.join(replay_dir, file_name)
+
+        if not os.path.exists(file_path):
+            raise ValueError(f"No recording {file_path}, record it first!")
+
+        with open(file_path) as json_file:
+            return json.load(json_file)
+
+    def mint_file(user_name: str) -> str:
+        return f"mint_{user_name}.json"
+
+    @contextmanager
+    def install(replay_dir: str, user_config: dict, latency_seconds: float = 0):
+        # Points the getters at the stand-ins until the block exits. Mint logins
+        # are matched to their user's recording through user_config
+        exist_server = Replay_Exist_Server(
+            Source_Replay.load(replay_dir, "exist.json"), latency_seconds
+        )
+        marvin_db = Replay_Couch_DB(
+            Source_Replay.load(replay_dir, "marvin.json")["docs"], latency_seconds
+        )
+        mint_users = {
+            creds["login_email"]: user
+            for user, creds in user_config.get("mint_login", {}).items()
+        }
+
+        patches = [
+            (
+                Mint_API_Getter,
+                "get_mint_conn",
+                lambda login_config: Replay_Mint(
+                    Source_Replay.load(
+                        replay_dir,
+                        Source_Replay.mint_file(
+                            mint_users[login_config["login_email"]]
+                        ),
+                    ),
+                    latency_seconds,
+                ),
+            ),
+            (Marvin_Processor, "get_couch_server_db", lambda user_config: marvin_db),
+            (Exist_Processor, "exist_server_url", exist_server.url),
+        ]
+        originals = [(owner, name, owner.__dict__[name]) for owner, name, _ in patches]
+
+        exist_server.start()
+        try:
+            for owner, name, value in patches:
+                setattr(owner, name, value)
+            yield
+        finally:
+            for owner, name, value in originals:
+                setattr(owner, name, value)
+            exist_server.stop()
+
+    def record_mint(mint_conn, user_name: str, replay_dir: str) -> dict:
+        recording = {
+            "transactions": mint_conn.get_transaction_data(limit=1000000),
+            "accounts": mint_conn.get_account_data(),
+            "investments": mint_conn.get_investment_data(),
+            "budgets": mint_conn.get_budget_data(),
+        }
+        Source_Replay.save(replay_dir, Source_Replay.mint_file(user_name), recording)
+
+        return recording
+
+    def record_marvin(server_db, replay_dir: str) -> dict:
+        docs = []
+        for db_name in ["Categories", "Tasks", "Habits"]:
+            docs += [dict(x) for x in Marvin_Processor.find_docs(server_db, db_name)]
+
+        recording = {"docs": docs}
+        Source_Replay.save(replay_dir, "marvin.json", recording)
+
+        return recording
+
+    @contextmanager
+    def record_exist(replay_dir: str):
+        # Run Exist_Processor.get_exist_data inside the block, every response it
+        # gets is kept by request path
+        recorder = Exist_Recorder(get_exist_data.requests)
+
+        get_exist_data.requests = recorder
+        try:
+            yield recorder
+        finally:
+            get_exist_data.requests = recorder.requests
+            Source_Replay.save(replay_dir, "exist.json", recorder.recording)
+
+
+class Exist_Recorder:
+    def __init__(self, requests):
+        self.requests = requests
+        self.recording = {"base_url": Exist_Processor.exist_server_url, "responses": {}}
+
+    def request_key(self, method: str, url: str) -> str:
+        return f"{method} {url[len(self.recording['base_url']):]}"
+
+    def record(self, method: str, url: str, response):
+        self.recording["responses"][self.request_key(method, url)] = response.json()
+
+        return response
+
+    def get(self, url: str, **kwargs):
+        return self.record("GET", url, self.requests.get(url, **kwargs))
+
+    def post(self, url: str, **kwargs):
+        return self.record("POST", url, self.requests.post(url, **kwargs))
+
+
+class Replay_Mint:
+
+    # Stands in for mintapi.Mint, same methods as Mint_API_Getter calls
+
+    def __init__(self, recording: dict, latency_seconds: float = 0):
+        self.recording = recording
+        self.latency_seconds = latency_seconds
+
+    def respond(self, payload_name: str) -> list:
+        time.sleep(self.latency_seconds)
+
+        return json.loads(json.dumps(self.recording[payload_name]))
+
+    def get_transaction_data(
+        self, start_date: str = None, end_date: str = None, **kwargs
+    ):
+        transactions = self.respond("transactions")
+
+        # Incremental syncs ask for a date window
+        return [
+            x
+            for x in transactions
+            if (start_date is None or x["date"] >= start_date)
+            and (end_date is None or x["date"] <= end_date)
+        ]
+
+    def get_account_data(self):
+        return self.respond("accounts")
+
+    def get_investment_data(self):
+        return self.respond("investments")
+
+    def get_budget_data(self):
+        return self.respond("budgets")
+
+    def close(self):
+        pass
+
+
+class Replay_Couch_DB:
+
+    # Stands in for a couchdb.Database: mango find on top-level field equality
+    # and a _changes feed. The feed is every doc in change order, a doc's
+    # position is its sequence number and an update or delete moves it to the
+    # end, like CouchDB only listing each doc's latest change
+
+    def __init__(self, docs: list, latency_seconds: float = 0):
+        self.feed = list(docs)
+        self.latency_seconds = latency_seconds
+        self.resource = Replay_Couch_Resource(self)
+
+    def matches(doc: dict, selector: dict) -> bool:
+        return all(doc.get(key) == value for key, value in selector.items())
+
+    def save(self, doc: dict):
+        self.feed = [
+            None if x is not None and x["_id"] == doc["_id"] else x for x in self.feed
+        ]
+        self.feed.append(doc)
+
+    def delete(self, doc_id: str):
+        self.save({"_id": doc_id, "_deleted": True})
+
+    def find(self, mango_query: dict, wrapper=None):
+        time.sleep(self.latency_seconds)
+        selector = mango_query.get("selector", {})
+        fields = mango_query.get("fields")
+
+        for doc in self.feed:
+            if doc is None or doc.get("_deleted"):
+                continue
+
+            if Replay_Couch_DB.matches(doc, selector):
+                yield doc if fields is None else {x: doc[x] for x in fields if x in doc}
+
+    def changes(self, since=0, limit: int = None, include_docs: bool = False, **opts):
+        time.sleep(self.latency_seconds)
+        since = len(self.feed) if since == "now" else int(since or 0)
+
+        results = []
+        seq = since
+        while seq < len(self.feed) and (limit is None or len(results) < limit):
+            doc = self.feed[seq]
+            seq += 1
+
+            if doc is None:
+                continue
+
+            change = {
+                "seq": seq,
+                "id": doc["_id"],
+                "changes": [{"rev": doc.get("_rev")}],
+            }
+            if doc.get("_deleted"):
+                change["deleted"] = True
+            if include_docs:
+                change["doc"] = doc
+            results.append(change)
+
+        pending = sum(x is not None for x in self.feed[seq:])
+
+        return {"results": results, "last_seq": seq, "pending": pending}
+
+
+class Replay_Couch_Resource:
+
+    # The raw HTTP side of Replay_Couch_DB, _find with limit and bookmark
+    # pagination. Bookmarks are just the offset of the next page
+
+    def __init__(self, couch_db: Replay_Couch_DB):
+        self.couch_db = couch_db
+
+    def post_json(self, path: str, body: dict = None, headers=None, **params):
+        if path != "_find":
+            raise ValueError(f"Replay Couch DB only answers _find, not {path}!")
+
+        docs = list(self.couch_db.find(body))
+        start = int(body.get("bookmark", 0))
+        end = len(docs) if body.get("limit") is None else start + body["limit"]
+
+        return 200, {}, {"docs": docs[start:end], "bookmark": str(end)}
+
+
+class Replay_Exist_Server:
+
+    # Local HTTP server answering recorded Exist requests. Absolute "next" page
+    # links in the recording are pointed back at this server
+
+    def __init__(self, recording: dict, latency_seconds: float = 0):
+        self.recording = recording
+        self.latency_seconds = latency_seconds
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler_class())
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api/2/"
+        self.thread = None
+
+    def response_body(self, method: str, path: str) -> bytes:
+        relative_path = path[len(urlsplit(self.url).path) :]
+        body = self.recording["responses"].get(f"{method} {relative_path}")
+
+        if body is None:
+            return None
+
+        return json.dumps(body).replace(self.recording["base_url"], self.url).encode()
+
+    def handler_class(self):
+        replay_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def respond(self, method: str):
+                time.sleep(replay_server.latency_seconds)
+                body = replay_server.response_body(method, self.path)
+
+                self.send_response(404 if body is None else 200)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(body or b"{}")
+
+            def do_GET(self):
+                self.respond("GET")
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self.respond("POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,43 @@
+import os
+import json
+import threading
+
+from data_getters.cache_storage import atomic_write_json
+
+
+class Sync_State:
+
+    # Watermarks for incremental source syncs, one entry per source and user.
+    # Lives next to the cache so wiping the cache also forces a full sync
+    state_file = "sync_state.json"
+    lock = threading.RLock()
+
+    def state_path(cache_dir: str) -> str:
+        return os.path.join(cache_dir, Sync_State.state_file)
+
+    def load(cache_dir: str) -> dict:
+        state_path = Sync_State.state_path(cache_dir)
+
+        if not os.path.exists(state_path):
+            return {}
+
+        with open(state_path) as json_file:
+            return json.load(json_file)
+
+    def get(cache_dir: str, key: str) -> dict:
+        return Sync_State.load(cache_dir).get(key)
+
+    def set(cache_dir: str, key: str, state: dict):
+        with Sync_State.lock:
+            sync_state = Sync_State.load(cache_dir)
+            sync_state[key] = state
+
+            os.makedirs(cache_dir, exist_ok=True)
+            atomic_write_json(Sync_State.state_path(cache_dir), sync_state)
+
+    def clear(cache_dir: str, key: str):
+        with Sync_State.lock:
+            sync_state = Sync_State.load(cache_dir)
+
+            if sync_state.pop(key, None) is not None:
+                atomic_write_json(Sync_State.state_path(cache_dir), sync_state)
@@ -3,6 +3,19 @@ import json
 import glob
 import pandas as pd
 from datetime import datetime
+from typing import Iterator
+
+from data_getters.cache_manifest import Cache_Manifest
+from data_getters.cache_schemas import Cache_Schemas
+from data_getters.frame_cache import Frame_Cache
+from data_getters.partitioned_cache import Partitioned_Cache
+from data_getters.cache_storage import (
+    Csv_Storage,
+    apply_filters,
+    get_storage_backend,
+    storage_backends,
+    write_with_fallback,
+)
 
 
 class Data_Getter_Utils:
@@ -10,32 +23,360 @@ class Data_Getter_Utils:
     milliseconds_in_hours = 3600000
     milliseconds_in_seconds = 1000
     cache_dir = "./temp_cache"
+    # parquet keeps dtypes, falls back to csv if pyarrow is missing
+    cache_format = "parquet"
+    # Loaded at dashboard startup, memory-mapped arrow instead of parsed parquet
+    mmap_datasets = [
+        "exist_data",
+        "marvin_habits",
+        "sleep_data",
+        "monthly_budget",
+        "daily_finances",
+        "account_totals",
+    ]
+    # Long source histories, stored per month so a refresh only rewrites the
+    # months that changed. Maps dataset to the date column it's partitioned on
+    partitioned_datasets = {
+        "mint_transactions_raw": "date",
+        "marvin_tasks": "day",
+        "marvin_habits": "timestamp",
+        "exist_data": "date",
+        "account_balances": "date",
+    }
+    # Partitioned datasets whose changed months are stored as a diff against the
+    # month's base file. Maps dataset to its key columns, None for whole rows
+    delta_datasets = {
+        "mint_transactions_raw": ["id"],
+        "marvin_tasks": None,
+        "exist_data": ["date", "attribute"],
+    }
+    # Retention: newest snapshots kept as-is, older ones compacted to monthly
+    retain_snapshots = 3
+    retain_monthly = 12
 
-    def write_temp_cache(df, data_name: str):
+    def write_temp_cache(df, data_name: str, full: bool = True):
         date_str = datetime.now().strftime("%Y-%m-%d")
-        df.to_csv(f"./temp_cache/{data_name}_{date_str}.csv", index=False)
+        df = Cache_Schemas.apply(df, data_name)
 
-    def get_latest_file(self, file_prefix: str):
+        partitioned_name = Data_Getter_Utils.match_dataset(
+            data_name, Data_Getter_Utils.partitioned_datasets
+        )
+        delta_name = Data_Getter_Utils.match_dataset(
+            data_name, Data_Getter_Utils.delta_datasets
+        )
+        if partitioned_name is not None:
+            version_info = Partitioned_Cache.write(
+                Data_Getter_Utils.cache_dir,
+                data_name,
+                df,
+                Data_Getter_Utils.partitioned_datasets[partitioned_name],
+                Data_Getter_Utils.storage_format(data_name),
+                full=full,
+                delta=delta_name is not None,
+                key_cols=Data_Getter_Utils.delta_datasets.get(delta_name),
+            )
 
-        files = glob.glob(f"{self.cache_dir}/{file_prefix}*")
+            Cache_Manifest.add_snapshot(
+                Data_Getter_Utils.cache_dir,
+                data_name,
+                df,
+                data_name,
+                date_str,
+                rows=sum(x["rows"] for x in version_info["partitions"].values()),
+                version=version_info["version"],
+                partitioned=True,
+            )
 
-        latest_date = pd.to_datetime("1/1/2019")
-        for file in files:
-            file_name = os.path.basename(file)
-            split_filename = file_name.split("_")
+            return Partitioned_Cache.dataset_dir(Data_Getter_Utils.cache_dir, data_name)
 
-            date = pd.to_datetime(split_filename[-1].replace(".csv", ""))
-            if date > latest_date:
-                latest_date = date.date()
+        file_stem = os.path.join(Data_Getter_Utils.cache_dir, f"{data_name}_{date_str}")
 
-        file_path = [x for x in files if latest_date.strftime("%Y-%m-%d") in x]
+        storage_format = Data_Getter_Utils.storage_format(data_name)
+        file_path = write_with_fallback(df, file_stem, storage_format)
 
-        if len(file_path) == 0:
-            raise ValueError(f"No dated file for prefix {file_prefix}!")
+        # written_as tells migrate_cache a CSV here was a deliberate fallback
+        Cache_Manifest.add_snapshot(
+            Data_Getter_Utils.cache_dir,
+            data_name,
+            df,
+            file_path,
+            date_str,
+            written_as=storage_format,
+        )
+
+        return file_path
+
+    def get_latest_file(
+        self, file_prefix: str, columns: list = None, filters: list = None
+    ):
+        # filters are pyarrow-style (column, op, value) tuples, all must hold,
+        # e.g. get_latest_file("daily_finances", filters=[("year", ">=", 2022)])
+        snapshot = self.latest_snapshot(file_prefix)
+        file_path = os.path.join(self.cache_dir, snapshot["file"])
+        read_cols = Data_Getter_Utils.read_columns(columns, filters)
+
+        query_key = (
+            tuple(columns) if columns is not None else None,
+            repr(filters) if filters else None,
+        )
+
+        if snapshot.get("partitioned"):
+            data_name = snapshot["file"]
 
-        ret_df = pd.read_csv(file_path[0], index_col=None)
+            # Pinned to the manifest's version so all months come from one write
+            return Frame_Cache.get(
+                Partitioned_Cache.versions_path(self.cache_dir, data_name),
+                lambda _: Data_Getter_Utils.finish_load(
+                    Partitioned_Cache.read(
+                        self.cache_dir,
+                        data_name,
+                        snapshot["version"],
+                        read_cols,
+                        filters,
+                    ),
+                    data_name,
+                    columns,
+                    filters,
+                ),
+                key_extra=(snapshot["version"],) + query_key,
+            )
+
+        ret_df = Frame_Cache.get(
+            file_path,
+            lambda x: Data_Getter_Utils.read_file(x, columns, filters),
+            key_extra=query_key,
+        )
         return ret_df
 
+    def iter_latest_file(
+        self, file_prefix: str, columns: list = None, filters: list = None
+    ) -> Iterator[pd.DataFrame]:
+        # Same as get_latest_file, a month at a time for partitioned datasets so
+        # only one month is in memory. Chunks skip Frame_Cache for the same
+        # reason. Other snapshots come back as a single chunk, also uncached
+        snapshot = self.latest_snapshot(file_prefix)
+
+        if not snapshot.get("partitioned"):
+            yield Data_Getter_Utils.read_file(
+                os.path.join(self.cache_dir, snapshot["file"]), columns, filters
+            )
+            return
+
+        data_name = snapshot["file"]
+        for partition_df in Partitioned_Cache.iter_partitions(
+            self.cache_dir,
+            data_name,
+            snapshot["version"],
+            Data_Getter_Utils.read_columns(columns, filters),
+            filters,
+        ):
+            yield Data_Getter_Utils.finish_load(
+                partition_df, data_name, columns, filters
+            )
+
+    def latest_snapshot(self, file_prefix: str) -> dict:
+        manifest = Cache_Manifest.load(self.cache_dir)
+        snapshot = Cache_Manifest.latest_snapshot(manifest, file_prefix)
+
+        # Files removed behind the manifest's back, rescan once
+        if snapshot is not None and not os.path.exists(
+            os.path.join(self.cache_dir, snapshot["file"])
+        ):
+            manifest = Cache_Manifest.rebuild(self.cache_dir)
+            snapshot = Cache_Manifest.latest_snapshot(manifest, file_prefix)
+
+        if snapshot is None:
+            raise ValueError(f"No dated file for prefix {file_prefix}!")
+
+        return snapshot
+
+    def read_file(file_path: str, columns: list, filters: list) -> pd.DataFrame:
+        return Data_Getter_Utils.finish_load(
+            get_storage_backend(file_path).read(
+                file_path, Data_Getter_Utils.read_columns(columns, filters), filters
+            ),
+            Cache_Manifest.split_file_name(file_path)[0],
+            columns,
+            filters,
+        )
+
+    def read_columns(columns: list, filters: list) -> list:
+        # Filter columns are read too, they're dropped again after filtering
+        if columns is not None and filters:
+            return list(dict.fromkeys(columns + [x[0] for x in filters]))
+
+        return columns
+
+    def finish_load(
+        df: pd.DataFrame, data_name: str, columns: list, filters: list
+    ) -> pd.DataFrame:
+        # Parquet has already filtered, this catches CSV strings typed by the schema
+        df = Cache_Schemas.apply(df, data_name, validate=columns is None)
+        df = apply_filters(df, filters)
+
+        # Selecting columns copies them, skipped when the read already did it
+        if columns is None or list(df.columns) == list(columns):
+            return df
+
+        return df[columns]
+
+    def remove_snapshot(self, file_path: str):
+        data_name, date_str = Cache_Manifest.split_file_name(file_path)
+
+        with Cache_Manifest.lock:
+            manifest = Cache_Manifest.load(self.cache_dir)
+            manifest[data_name] = [
+                x for x in manifest.get(data_name, []) if x["date"] != date_str
+            ]
+            if len(manifest[data_name]) == 0:
+                del manifest[data_name]
+
+            Cache_Manifest.save(self.cache_dir, manifest)
+
+        os.remove(file_path)
+
+    def remove_superseded(self, snapshot: dict) -> list:
+        # Same-day files replaced by this snapshot, once nothing maps them
+        removed_files = []
+        kept_files = []
+
+        for file in snapshot.pop("superseded", []):
+            file_path = os.path.join(self.cache_dir, file)
+
+            try:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                    removed_files.append(file_path)
+            except PermissionError:
+                kept_files.append(file)
+
+        if len(kept_files) > 0:
+            snapshot["superseded"] = kept_files
+
+        return removed_files
+
+    def apply_retention_policy(
+        self, keep_snapshots: int = None, keep_monthly: int = None
+    ) -> list:
+        # Per dataset: the newest keep_snapshots stay as they are, older ones are
+        # compacted to the last snapshot of each month for keep_monthly months.
+        # A source that failed today still keeps its last good snapshot
+        keep_snapshots = (
+            Data_Getter_Utils.retain_snapshots
+            if keep_snapshots is None
+            else keep_snapshots
+        )
+        keep_monthly = (
+            Data_Getter_Utils.retain_monthly if keep_monthly is None else keep_monthly
+        )
+
+        removed_files = []
+        with Cache_Manifest.lock:
+            manifest = Cache_Manifest.load(self.cache_dir)
+
+            for data_name, snapshots in manifest.items():
+                for snapshot in snapshots:
+                    removed_files += self.remove_superseded(snapshot)
+
+                older = snapshots[: max(len(snapshots) - keep_snapshots, 0)]
+
+                monthly = {}
+                for snapshot in older:
+                    monthly[snapshot["date"][:7]] = snapshot
+                checkpoints = (
+                    list(monthly.values())[-keep_monthly:] if keep_monthly else []
+                )
+
+                for snapshot in older:
+                    file_path = os.path.join(self.cache_dir, snapshot["file"])
+
+                    if (
+                        snapshot in checkpoints
+                        or snapshot.get("partitioned")
+                        or not os.path.exists(file_path)
+                    ):
+                        continue
+
+                    try:
+                        os.remove(file_path)
+                        removed_files.append(file_path)
+                    except PermissionError:
+                        # Still memory-mapped by a dashboard on Windows, next run
+                        checkpoints.append(snapshot)
+
+                manifest[data_name] = [
+                    x for x in snapshots if x not in older or x in checkpoints
+                ]
+
+            Cache_Manifest.save(self.cache_dir, manifest)
+
+        # Partitioned datasets share unchanged months between versions, their
+        # compaction is dropping versions nobody reads any more
+        for data_name, snapshots in manifest.items():
+            if len(snapshots) > 0 and snapshots[-1].get("partitioned"):
+                Partitioned_Cache.prune(
+                    self.cache_dir, data_name, Partitioned_Cache.keep_versions
+                )
+
+        return removed_files
+
+    def match_dataset(data_name: str, dataset_names) -> str:
+        for dataset_name in dataset_names:
+            if data_name == dataset_name or data_name.startswith(f"{dataset_name}_"):
+                return dataset_name
+
+        return None
+
+    def storage_format(data_name: str) -> str:
+        if Data_Getter_Utils.match_dataset(data_name, Data_Getter_Utils.mmap_datasets):
+            return "arrow"
+
+        return Data_Getter_Utils.cache_format
+
+    def cache_extensions():
+        return [x.extension for x in storage_backends.values()]
+
+    def migrate_cache(self, storage_format: str = None):
+        # Runs every refresh but only reads legacy CSVs, ones written before the
+        # manifest recorded a target format. A CSV the current writer fell back
+        # to, or an attempted migration that fell back again, is left alone
+        manifest = Cache_Manifest.load(self.cache_dir)
+
+        migrated_files = []
+        for file in glob.glob(f"{self.cache_dir}/*{Csv_Storage.extension}"):
+            file_stem = os.path.splitext(file)[0]
+            data_name, date_str = Cache_Manifest.split_file_name(file)
+            target_format = storage_format or Data_Getter_Utils.storage_format(
+                data_name
+            )
+
+            written = [
+                x
+                for x in manifest.get(data_name, [])
+                if x["file"] == os.path.basename(file) and "written_as" in x
+            ]
+            if target_format == "csv" or len(written) > 0:
+                continue
+
+            # Typed first, arrow snapshots are read back without any casting
+            df = Cache_Schemas.apply(Csv_Storage.read(file), data_name, validate=False)
+            new_file = write_with_fallback(df, file_stem, target_format)
+
+            Cache_Manifest.add_snapshot(
+                self.cache_dir,
+                data_name,
+                df,
+                new_file,
+                date_str,
+                written_as=target_format,
+            )
+
+            if new_file != file:
+                os.remove(file)
+                migrated_files.append(new_file)
+
+        return migrated_files
+
     def get_user_config(self, username: str):
 
         config_dir = "./user_config"
@@ -54,4 +395,8 @@ class Data_Getter_Utils:
 
     def get_existing_cache(self):
 
-        return glob.glob(f"{self.cache_dir}/*.csv")
+        return [
+            x
+            for x in glob.glob(f"{self.cache_dir}/*")
+            if os.path.splitext(x)[1] in Data_Getter_Utils.cache_extensions()
+        ]
@@ -1,44 +1,60 @@
-import os
+import contextlib
 from data_getters.get_exist_data import Exist_Processor
 from data_getters.get_manual_files import Manual_Processor
 from data_getters.get_marvin_data import Marvin_Processor
 from data_getters.get_mint_data import Mint_API_Getter, Mint_Processor
+from data_getters.cache_lock import Cache_Lock
+from data_getters.source_replay import Source_Replay
 from data_getters.utils import Data_Getter_Utils
 
 CALL_MINT = False
+# Users left out of the Mint refresh
+SKIP_MINT_USERS = ["dmg"]
+# Threads processing and caching Mint payloads, shared by all users
+MINT_WORKERS = 4
+# Recorded responses to refresh from instead of the live sources
+REPLAY_DIR = None
 
 if __name__ == "__main__":
     user_name = "jjm"
     data_getter = Data_Getter_Utils()
     user_config = data_getter.get_user_config(user_name)
 
-    existing_cache = data_getter.get_existing_cache()
+    replay = (
+        Source_Replay.install(REPLAY_DIR, user_config)
+        if REPLAY_DIR is not None
+        else contextlib.nullcontext()
+    )
 
-    for user, creds in user_config["mint_login"].items():
-        if user == "dmg":
-            continue
+    # Overlapping refreshes would interleave writes to the same snapshots
+    with Cache_Lock.hold(data_getter.cache_dir), replay:
+        # One-off conversion of snapshots written before the parquet backend
+        data_getter.migrate_cache()
 
-        if CALL_MINT:
-            mint_conn = Mint_API_Getter.get_mint_conn(creds)
-
-            investments_df = Mint_API_Getter.get_investments_df(mint_conn, user)
-            accounts_df = Mint_API_Getter.get_accounts_df(mint_conn, user)
-
-            transactions_df = Mint_API_Getter.get_transactions_df(mint_conn, user)
-            budgets_df = Mint_API_Getter.get_budgets_df(mint_conn, user)
-
-        if user == "jjm":
-            Manual_Processor.get_sleep_df_from_xml(user_config)
+        mint_logins = {
+            user: creds
+            for user, creds in user_config["mint_login"].items()
+            if user not in SKIP_MINT_USERS
+        }
 
-            Marvin_Processor.get_marvin_habit_data(user_config)
-            Marvin_Processor.get_marvin_task_data(user_config)
-            Exist_Processor.get_exist_data(user_config)
-
-        Mint_Processor.clean_budgets(user_config, user)
-        Mint_Processor.clean_accounts(user_config, user)
-        Mint_Processor.clean_transactions(user_config, user)
-
-    new_cache = data_getter.get_existing_cache()
-
-    if len(new_cache) == len(existing_cache) * 2:
-        [os.remove(x) for x in existing_cache]
+        if CALL_MINT:
+            # Every user's Mint session runs at once
+            Mint_API_Getter.ingest_users(
+                mint_logins, max_workers=MINT_WORKERS, incremental=True
+            )
+
+        for user in mint_logins:
+            if user == "jjm":
+                Manual_Processor.get_sleep_df_from_xml(user_config)
+
+                Marvin_Processor.get_marvin_habit_data(user_config, incremental=True)
+                Marvin_Processor.get_marvin_task_data(user_config, incremental=True)
+                Exist_Processor.get_exist_data(user_config)
+
+            Mint_Processor.clean_budgets(user_config, user)
+            Mint_Processor.clean_accounts(user_config, user)
+            Mint_Processor.clean_transactions(
+                user_config, user, incremental=True, chunked=True
+            )
+
+        data_getter.apply_retention_policy()
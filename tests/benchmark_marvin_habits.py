@@ -0,0 +1,96 @@
+import sys
+import time
+import random
+import datetime
+import pandas as pd
+
+from data_getters.utils import Data_Getter_Utils
+from data_getters.get_marvin_data import Marvin_Processor
+
+# python -m tests.benchmark_marvin_habits [events...]
+# Times expanding habit histories into the habits frame, for a total number
+# of logged events spread over a few hundred habits. The old frame per habit
+# is only timed up to legacy_max_events
+
+legacy_max_events = 200000
+habit_count = 300
+
+
+def synthetic_habits(events: int) -> list:
+    rand = random.Random(0)
+    per_habit = max(events // habit_count, 1)
+
+    return [
+        {
+            "_id": f"habit_{x}",
+            "id": f"habit_{x}",
+            "title": f"habit {x}",
+            "isPositive": rand.random() < 0.8,
+            "target": rand.randint(1, 7),
+            "period": rand.choice(["week", "day"]),
+            "history": [
+                y
+                for t in sorted(
+                    rand.sample(range(1577836800, 1704067200, 60), per_habit)
+                )
+                for y in [t * Data_Getter_Utils.milliseconds_in_seconds, 1]
+            ],
+        }
+        for x in range(habit_count)
+    ]
+
+
+def legacy_parse_habit(habit) -> pd.DataFrame:
+    habit_history = habit.get("history")
+
+    history_df = pd.DataFrame.from_dict(
+        dict(zip(habit_history[::2], habit_history[1::2])), orient="index"
+    ).reset_index(drop=False)
+    history_df.rename(columns={"index": "marvin_time", 0: "count"}, inplace=True)
+
+    history_df[["id", "name", "positive", "target", "period", "doc_id"]] = [
+        habit.get("id"),
+        habit.get("title"),
+        habit.get("isPositive"),
+        habit.get("target"),
+        habit.get("period"),
+        habit.get("_id"),
+    ]
+    history_df["timestamp"] = pd.to_datetime(
+        (history_df["marvin_time"] / Data_Getter_Utils.milliseconds_in_seconds).map(
+            datetime.date.fromtimestamp
+        )
+    )
+
+    return history_df.set_index("timestamp")
+
+
+def legacy_parse_habits(habits: list) -> pd.DataFrame:
+    habits_df = pd.concat(map(legacy_parse_habit, habits))
+    habits_df["week_number"] = pd.to_datetime(habits_df.index).isocalendar().week
+
+    return habits_df.reset_index(drop=False)
+
+
+def time_call(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    sizes = [int(x) for x in sys.argv[1:]] or [30000, 300000, 3000000]
+
+    print(f"{'events':>10} {'before (events/s)':>18} {'after (events/s)':>18}")
+    for size in sizes:
+        habits = synthetic_habits(size)
+        events = sum(len(x["history"]) // 2 for x in habits)
+
+        after = time_call(Marvin_Processor.parse_habits, habits)
+
+        before = "skipped"
+        if events <= legacy_max_events:
+            before_seconds = time_call(legacy_parse_habits, habits)
+            before = f"{events / before_seconds:,.0f}"
+
+        print(f"{events:>10,} {before:>18} {events / after:>18,.0f}")
@@ -0,0 +1,99 @@
+import sys
+import time
+import random
+import datetime
+import pandas as pd
+
+from data_getters.utils import Data_Getter_Utils
+from data_getters.get_marvin_data import Category_Tree, Marvin_Processor
+
+# python -m tests.benchmark_marvin_tasks [sizes...]
+# Times building the task frame from Couch docs. The old per-task frame and
+# concat is only timed up to legacy_max_size
+
+legacy_max_size = 20000
+
+
+def synthetic_marvin(size: int):
+    rand = random.Random(0)
+
+    categories = [{"_id": "c0", "title": "Root", "parentId": "root"}]
+    for i in range(1, 200):
+        categories.append(
+            {"_id": f"c{i}", "title": f"Category {i}", "parentId": f"c{i // 4}"}
+        )
+
+    tasks = []
+    for x in range(size):
+        start = rand.randint(1577836800000, 1672531200000)
+        tasks.append(
+            {
+                "title": f"task {x}",
+                "parentId": rand.choice(categories)["_id"],
+                "day": "2022-06-01",
+                "timeEstimate": 1800000,
+                "duration": rand.randint(1, 7200000),
+                "times": [start, start + 3600000],
+            }
+        )
+
+    return categories, tasks
+
+
+def legacy_parse_task(task, categories):
+    parent_val = [item for item in categories if item["_id"] == task["parentId"]]
+    parent_list = [parent_val[0]]
+    while parent_list[-1]["parentId"] != "root":
+        parent_list.append(
+            [x for x in categories if x["_id"] == parent_list[-1]["parentId"]][0]
+        )
+
+    to_date = lambda x: pd.to_datetime(
+        datetime.date.fromtimestamp(x / Data_Getter_Utils.milliseconds_in_seconds)
+    )
+
+    return pd.DataFrame(
+        data={
+            "name": [task["title"]],
+            "day": [task["day"]],
+            "time_estimate": [
+                task["timeEstimate"] / Data_Getter_Utils.milliseconds_in_hours
+            ],
+            "parent": ["/".join([o["title"] for o in parent_list])],
+            "category": [parent_list[-1]["title"]],
+            "start_time": [to_date(task["times"][0])],
+            "end_time": [to_date(task["times"][1])],
+            "duration": [task["duration"] / Data_Getter_Utils.milliseconds_in_hours],
+        }
+    )
+
+
+def legacy_parse_tasks(tasks, categories) -> pd.DataFrame:
+    return pd.concat([legacy_parse_task(x, categories) for x in tasks])
+
+
+def batch_parse_tasks(tasks, categories) -> pd.DataFrame:
+    return Marvin_Processor.parse_tasks(tasks, Category_Tree(categories))
+
+
+def time_call(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    sizes = [int(x) for x in sys.argv[1:]] or [10000, 100000, 1000000]
+
+    print(f"{'tasks':>10} {'before (tasks/s)':>18} {'after (tasks/s)':>18}")
+    for size in sizes:
+        categories, tasks = synthetic_marvin(size)
+
+        after = time_call(batch_parse_tasks, tasks, categories)
+
+        before = "skipped"
+        if size <= legacy_max_size:
+            before_seconds = time_call(legacy_parse_tasks, tasks, categories)
+            before = f"{size / before_seconds:,.0f}"
+
+        print(f"{size:>10,} {before:>18} {size / after:>18,.0f}")
@@ -0,0 +1,78 @@
+import sys
+import time
+import random
+import pandas as pd
+
+from data_getters.get_mint_data import Mint_API_Getter
+
+# python -m tests.benchmark_process_mint_df [sizes...]
+# Times building and flattening the transactions frame. The old per-entry
+# concat is quadratic, it's only timed up to legacy_max_size
+
+legacy_max_size = 10000
+ret_cols = ["date", "description", "amount", "type", "category", "accountId"]
+nested_cols = {"category": ["name", "parentName"]}
+
+
+def synthetic_transactions(size: int) -> list:
+    rand = random.Random(0)
+    categories = [
+        {"name": "Groceries", "parentName": "Food & Dining"},
+        {"name": "Paycheck", "parentName": "Income"},
+        {"name": "Rent", "parentName": "Home"},
+    ]
+
+    return [
+        {
+            "date": f"2022-{rand.randint(1, 12):02d}-{rand.randint(1, 28):02d}",
+            "description": f"merchant {rand.randint(0, 500)}",
+            "amount": round(rand.uniform(-500, 500), 2),
+            "type": "CashAndCreditTransaction",
+            "category": rand.choice(categories),
+            "accountId": str(rand.randint(1, 10)),
+            "isPending": False,
+        }
+        for x in range(size)
+    ]
+
+
+def legacy_process_mint_df(mint_json_return: list, ret_cols: list) -> pd.DataFrame:
+    ret_df = pd.DataFrame()
+
+    for entry in mint_json_return:
+        ret_df = pd.concat([ret_df, pd.DataFrame.from_dict(entry, orient="index").T])
+
+    ret_df = ret_df[ret_cols].reset_index(drop=True)
+
+    # expand_category_col
+    ret_df = pd.concat(
+        [ret_df.drop(columns={"category"}), ret_df["category"].apply(pd.Series)],
+        axis=1,
+    )
+
+    return ret_df
+
+
+def time_call(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    sizes = [int(x) for x in sys.argv[1:]] or [10000, 100000, 1000000]
+
+    print(f"{'rows':>10} {'before (rows/s)':>18} {'after (rows/s)':>18}")
+    for size in sizes:
+        transactions = synthetic_transactions(size)
+
+        after = time_call(
+            Mint_API_Getter.process_mint_df, transactions, ret_cols, nested_cols
+        )
+
+        before = "skipped"
+        if size <= legacy_max_size:
+            before_seconds = time_call(legacy_process_mint_df, transactions, ret_cols)
+            before = f"{size / before_seconds:,.0f}"
+
+        print(f"{size:>10,} {before:>18} {size / after:>18,.0f}")
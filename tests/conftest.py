@@ -0,0 +1,145 @@
+import pytest
+
+from data_getters.utils import Data_Getter_Utils
+from data_getters.frame_cache import Frame_Cache
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(Data_Getter_Utils, "cache_dir", str(tmp_path))
+    Frame_Cache.clear()
+    return tmp_path
+
+
+@pytest.fixture
+def replay_user_config():
+    return {
+        "mint_login": {"jjm": {"login_email": "jjm@example.com", "password": "x"}},
+        "aggregate_categories": {"food": ["Groceries"], "paycheck": ["Paycheck"]},
+        "meta_categories": {"spending": ["food"], "income": ["paycheck"]},
+        "exist_config": {"username": "jjm", "password": "x", "key_habits": {}},
+        "marvin_config": {"aggregate_categories": []},
+    }
+
+
+@pytest.fixture
+def replay_dir(tmp_path):
+    # Small synthetic recordings in the shape Source_Replay records them
+    from data_getters.source_replay import Source_Replay
+
+    replay_dir = str(tmp_path / "replay")
+
+    transactions = [
+        {
+            "id": str(i),
+            "date": f"2022-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+            "description": f"merchant {i}",
+            "amount": -10.0 if i % 5 else 2000.0,
+            "type": "CashAndCreditTransaction",
+            "accountId": "1",
+            "category": {
+                "name": "Groceries" if i % 5 else "Paycheck",
+                "parentName": "Food & Dining" if i % 5 else "Income",
+            },
+        }
+        for i in range(200)
+    ]
+    Source_Replay.save(
+        replay_dir,
+        Source_Replay.mint_file("jjm"),
+        {
+            "transactions": transactions,
+            "accounts": [
+                {
+                    "id": "1",
+                    "name": "Checking",
+                    "type": "BankAccount",
+                    "systemStatus": "ACTIVE",
+                    "currentBalance": 1000.0,
+                    "availableBalance": 1000.0,
+                    "accountNumber": "123456789",
+                }
+            ],
+            "investments": [{"description": "Index fund", "currentValue": 100.0}],
+            "budgets": [
+                {
+                    "budgetDate": "2022-12-01",
+                    "amount": -30.0,
+                    "budgetAmount": 400.0,
+                    "category": {"name": "Groceries"},
+                }
+            ],
+        },
+    )
+
+    Source_Replay.save(
+        replay_dir,
+        "exist.json",
+        {
+            "base_url": "https://exist.io/api/2/",
+            "responses": {
+                "POST auth/simple-token/": {"token": "secret"},
+                "GET attributes/with-values/": {"results": [], "next": None},
+                "GET attributes/with-values/?days=31&date_max=2023-01-31": {
+                    "results": [
+                        {
+                            "label": "Mood",
+                            "values": [{"date": "2023-01-31", "value": 4}],
+                        }
+                    ],
+                    "next": "https://exist.io/api/2/attributes/with-values/?page=2",
+                },
+                "GET attributes/with-values/?page=2": {
+                    "results": [
+                        {
+                            "label": "Steps",
+                            "values": [{"date": "2023-01-31", "value": 9000}],
+                        }
+                    ],
+                    "next": None,
+                },
+            },
+        },
+    )
+
+    Source_Replay.save(
+        replay_dir,
+        "marvin.json",
+        {
+            "docs": [
+                {
+                    "_id": "cat_work",
+                    "db": "Categories",
+                    "title": "Work",
+                    "parentId": "root",
+                },
+                {
+                    "_id": "cat_project",
+                    "db": "Categories",
+                    "title": "Project",
+                    "parentId": "cat_work",
+                },
+                {
+                    "_id": "task_1",
+                    "db": "Tasks",
+                    "title": "Write report",
+                    "parentId": "cat_project",
+                    "day": "2023-01-10",
+                    "duration": 3600000,
+                    "times": [1673344800000, 1673348400000],
+                },
+                {
+                    "_id": "habit_1",
+                    "db": "Habits",
+                    "id": "habit_1",
+                    "title": "Exercise",
+                    "isPositive": True,
+                    "target": 3,
+                    "period": "week",
+                    "history": [1673344800000, 1, 1673431200000, 1],
+                },
+            ]
+        },
+    )
+
+    return replay_dir
@@ -0,0 +1,129 @@
+import pytest
+import pandas as pd
+
+from data_getters.finance_cube import Finance_Cube
+from data_getters.frame_cache import Frame_Cache
+from data_getters.balance_history import Balance_History
+from data_getters.get_mint_data import Finances_Dashboard_Helpers
+
+import dashboard_v2
+from data_getters.utils import Data_Getter_Utils
+from data_getters.cache_query import Cache_Query_Engine
+
+
+@pytest.fixture
+def daily_finances_df():
+    years = [2021, 2022, 2026, 2027]
+
+    return pd.DataFrame(
+        data={
+            "year": years,
+            "month": [1] * len(years),
+            "day": [5] * len(years),
+            "category": ["food"] * len(years),
+            "total": [-10.0, -20.0, -30.0, -40.0],
+            "timestamp": pd.to_datetime([f"{x}-01-05" for x in years]),
+        }
+    )
+
+
+class Test_Dashboard_Startup:
+    @staticmethod
+    @pytest.mark.parametrize("engine", [True, False])
+    def test_rollup_reaches_historical_start(
+        cache_dir, daily_finances_df, engine, monkeypatch
+    ):
+
+        if engine and not Cache_Query_Engine.available():
+            pytest.skip("duckdb not installed")
+        monkeypatch.setattr(Cache_Query_Engine, "available", lambda: engine)
+
+        Data_Getter_Utils.write_temp_cache(daily_finances_df, "daily_finances_jjm")
+        budget_df = pd.DataFrame(data={"category": ["food"], "budget": [100.0]})
+
+        # The year dropdown starting after the historical window
+        finance_cube = dashboard_v2.load_finance_cube(
+            Data_Getter_Utils(), 2027, budget_df
+        )
+
+        # The daily rows aren't kept around once the rollup is built
+        assert len(Frame_Cache._frames) == 0
+
+        years = finance_cube.months.index.get_level_values("year")
+        assert sorted(years.unique()) == [
+            dashboard_v2.HISTORICAL_START_YEAR,
+            2026,
+            2027,
+        ]
+
+
+@pytest.fixture
+def finance_df():
+    return pd.DataFrame(
+        data={
+            "year": [2022, 2022, 2023, 2023],
+            "month": [12, 12, 1, 1],
+            "day": [5, 20, 5, 20],
+            "category": ["food", "paycheck", "food", "paycheck"],
+            "total": [-1200.0, 3000.0, -1800.0, 3000.0],
+        }
+    )
+
+
+@pytest.fixture
+def dashboard_data(finance_df, monkeypatch):
+    # The module globals main() loads at startup
+    budget_df = pd.DataFrame(data={"category": ["food"], "budget": [1500.0]})
+    account_df = pd.DataFrame(
+        data={"account_type": ["bank", "investment"], "total": [100.0, 200.0]}
+    )
+
+    monkeypatch.setattr(
+        dashboard_v2, "finance_cube", Finance_Cube(finance_df), raising=False
+    )
+    monkeypatch.setattr(dashboard_v2, "balance_history", None, raising=False)
+    monkeypatch.setattr(dashboard_v2, "account_df", account_df, raising=False)
+    monkeypatch.setattr(dashboard_v2, "budget_df", budget_df, raising=False)
+
+
+def rendered_rows(table) -> dict:
+    _, body = table.children
+
+    return {row.children[0].children: row.children[1].children for row in body.children}
+
+
+class Test_Accounts_Table:
+    @staticmethod
+    def test_shortfall_row_rendered(finance_df, dashboard_data):
+
+        rows = rendered_rows(dashboard_v2.accounts_table(500, 6, 1, 2023, "month"))
+
+        # Average spend of -1500 plus 3000 paid, less the 500 target
+        expected = Finances_Dashboard_Helpers.get_budget_shortfall(
+            finance_df, 500, 1, 2023, dashboard_v2.HISTORICAL_START_YEAR
+        )
+        assert expected == 1000.0
+        assert rows["shortfall"] == "$1,000"
+        assert rows["savings"] == "$1,200"
+
+    @staticmethod
+    def test_period_before_first_ingest(dashboard_data, monkeypatch):
+
+        balance_history = Balance_History(
+            pd.DataFrame(
+                data={
+                    "date": ["2023-02-10", "2023-02-10"],
+                    "account": ["1", "2"],
+                    "account_type": ["bank", "investment"],
+                    "balance": [1000.0, 5000.0],
+                }
+            )
+        )
+        monkeypatch.setattr(dashboard_v2, "balance_history", balance_history)
+
+        # No ingest recorded yet, the latest account totals are shown
+        rows = rendered_rows(dashboard_v2.accounts_table(500, 6, 1, 2023, "month"))
+        assert (rows["bank"], rows["investment"]) == ("$100", "$200")
+
+        rows = rendered_rows(dashboard_v2.accounts_table(500, 6, 2, 2023, "month"))
+        assert (rows["bank"], rows["investment"]) == ("$1,000", "$5,000")
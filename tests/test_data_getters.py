@@ -1,32 +1,76 @@
-import pytest
-import math 
+import math
+import pandas as pd
 
 from data_getters.utils import Data_Getter_Utils
+from data_getters.source_replay import Source_Replay
+from data_getters.get_exist_data import Exist_Processor
 from data_getters.get_marvin_data import Marvin_Processor
 from data_getters.get_mint_data import Mint_API_Getter, Mint_Processor
 
 
 class Test_Data_Getter_System:
     @staticmethod
-    def test_marvin_conn(user_config):
+    def test_marvin_conn(cache_dir, replay_dir, replay_user_config):
 
-        server_db = Marvin_Processor.get_couch_server_db(user_config)
+        with Source_Replay.install(replay_dir, replay_user_config):
+            server_db = Marvin_Processor.get_couch_server_db(replay_user_config)
 
-        assert server_db is not None
+            assert server_db is not None
+            assert len(list(server_db.find({"selector": {"db": "Tasks"}}))) == 1
+
+    @staticmethod
+    def test_exist_replay_server(cache_dir, replay_dir, replay_user_config):
+
+        with Source_Replay.install(replay_dir, replay_user_config):
+            login_dict = Exist_Processor.get_login_credentials(replay_user_config)
+
+            exist_df = Exist_Processor.get_attributes_df(
+                pd.DatetimeIndex(["2023-01-31"]), login_dict
+            )
+
+        # Second page followed through the rewritten next link
+        assert list(exist_df["attribute"]) == ["Mood", "Steps"]
+        assert Exist_Processor.exist_server_url == "https://exist.io/api/2/"
 
 
 class Test_Data_Getter_Processors:
     @staticmethod
-    def test_mint_transactions_processing():
+    def test_mint_transactions_processing(cache_dir, replay_dir, replay_user_config):
+
+        user_config = replay_user_config
 
-        # TODO put this into test config in repo
-        user_config = Data_Getter_Utils.get_user_config("jjm")
+        with Source_Replay.install(replay_dir, user_config):
+            Mint_API_Getter.ingest_users(user_config["mint_login"])
 
-        transactions_df = Mint_Processor.clean_transactions(user_config)
+        transactions_df = Mint_Processor.clean_transactions(user_config, "jjm")
 
         assert len(transactions_df) > 100
 
-        expected_cols = ['year', 'month', 'category', 'amount']
+        expected_cols = ["year", "month", "category", "total"]
         assert set(expected_cols) <= set(transactions_df.columns)
 
-        assert not math.isnan(transactions_df['amount'].sum())
+        assert not math.isnan(transactions_df["total"].sum())
+
+    @staticmethod
+    def test_recordings_sanitized(cache_dir, replay_dir):
+
+        recording = Source_Replay.load(replay_dir, Source_Replay.mint_file("jjm"))
+        exist_recording = Source_Replay.load(replay_dir, "exist.json")
+
+        assert recording["accounts"][0]["accountNumber"] == "replay"
+        assert exist_recording["responses"]["POST auth/simple-token/"] == {
+            "token": "replay"
+        }
+
+    @staticmethod
+    def test_marvin_replay_pipeline(cache_dir, replay_dir, replay_user_config):
+
+        with Source_Replay.install(replay_dir, replay_user_config):
+            Marvin_Processor.get_marvin_task_data(replay_user_config)
+            Marvin_Processor.get_marvin_habit_data(replay_user_config)
+
+        task_df = Data_Getter_Utils().get_latest_file("marvin_tasks")
+        habit_df = Data_Getter_Utils().get_latest_file("marvin_habits")
+
+        assert list(task_df["parent"]) == ["Project/Work"]
+        assert list(habit_df["count"]) == [1, 1]
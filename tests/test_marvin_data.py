@@ -0,0 +1,327 @@
+import pytest
+import datetime
+import pandas as pd
+
+from data_getters import get_marvin_data
+from data_getters.utils import Data_Getter_Utils
+from data_getters.sync_state import Sync_State
+from data_getters.source_replay import Replay_Couch_DB
+from data_getters.get_marvin_data import (
+    Broken_Category_Warning,
+    Category_Tree,
+    Marvin_Processor,
+)
+
+
+@pytest.fixture
+def marvin_categories():
+    return [
+        {"_id": "work", "title": "Work", "parentId": "root"},
+        {"_id": "project", "title": "Project", "parentId": "work"},
+        {"_id": "sub_project", "title": "Sub Project", "parentId": "project"},
+        {"_id": "home", "title": "Home", "parentId": "root"},
+        {"_id": "orphan", "title": "Orphan", "parentId": "deleted"},
+        {"_id": "orphan_child", "title": "Orphan Child", "parentId": "orphan"},
+        {"_id": "loop_a", "title": "Loop A", "parentId": "loop_b"},
+        {"_id": "loop_b", "title": "Loop B", "parentId": "loop_a"},
+    ]
+
+
+def marvin_task(parent_id: str, title: str = "task") -> dict:
+    return {
+        "title": title,
+        "parentId": parent_id,
+        "day": "2023-01-10",
+        "duration": 3600000,
+        "times": [1673344800000, 1673348400000],
+    }
+
+
+class Test_Category_Tree:
+    @staticmethod
+    def test_paths_resolved(marvin_categories):
+
+        category_tree = Category_Tree(marvin_categories)
+
+        assert category_tree.resolve(marvin_task("sub_project")) == (
+            "Sub Project/Project/Work",
+            "Work",
+        )
+        assert category_tree.resolve(marvin_task("home")) == ("Home", "Home")
+
+        # Ancestors were memoized on the way down
+        assert category_tree.paths["project"] == ("Project/Work", "Work")
+
+        # Tasks outside any category are dropped, same as before
+        assert category_tree.resolve(marvin_task("root")) is None
+        assert category_tree.resolve(marvin_task("unknown")) is None
+        assert category_tree.broken == {}
+
+    @staticmethod
+    def test_broken_chains_reported(marvin_categories):
+
+        category_tree = Category_Tree(marvin_categories)
+
+        assert category_tree.resolve(marvin_task("orphan_child")) is None
+        assert category_tree.resolve(marvin_task("loop_a")) is None
+        assert category_tree.resolve(marvin_task("work")) == ("Work", "Work")
+
+        assert category_tree.broken["orphan_child"] == "missing parent deleted"
+        assert category_tree.broken["loop_a"] == "cycle through loop_a"
+
+        with pytest.warns(Broken_Category_Warning, match="orphan_child"):
+            category_tree.report("marvin_tasks")
+
+    @staticmethod
+    def test_parse_tasks(marvin_categories):
+
+        category_tree = Category_Tree(marvin_categories)
+        untracked_task = marvin_task("home", "untracked")
+        del untracked_task["times"]
+        untimed_task = dict(
+            marvin_task("work", "untimed"), times=[], timeEstimate=1800000
+        )
+
+        task_df = Marvin_Processor.parse_tasks(
+            [
+                marvin_task("sub_project", "report"),
+                marvin_task("orphan"),
+                untracked_task,
+                untimed_task,
+            ],
+            category_tree,
+        )
+
+        assert list(task_df["name"]) == ["report", "untracked", "untimed"]
+        assert list(task_df["parent"]) == ["Sub Project/Project/Work", "Home", "Work"]
+        assert list(task_df["category"]) == ["Work", "Home", "Work"]
+        assert task_df["duration"].tolist()[0::2] == [1.0, 1.0]
+        assert pd.isna(task_df["duration"][1])
+        assert task_df["time_estimate"].tolist()[2] == 0.5
+
+        # Same local day as datetime.date.fromtimestamp
+        assert task_df["start_time"][0] == pd.Timestamp(
+            datetime.date.fromtimestamp(1673344800)
+        )
+        assert task_df["end_time"].isna().tolist() == [False, True, True]
+
+    @staticmethod
+    def test_parse_tasks_empty(marvin_categories):
+
+        task_df = Marvin_Processor.parse_tasks([], Category_Tree(marvin_categories))
+
+        assert task_df.empty
+        assert "start_time" in task_df.columns
+
+
+@pytest.fixture
+def marvin_db(marvin_categories, monkeypatch):
+    docs = [dict(x, db="Categories") for x in marvin_categories[:4]]
+    docs += [
+        dict(marvin_task(parent_id, f"task {i}"), _id=f"task_{i}", db="Tasks")
+        for i, parent_id in enumerate(["sub_project", "project", "home", "work"])
+    ]
+    docs += [
+        {
+            "_id": f"habit_{i}",
+            "db": "Habits",
+            "id": f"habit_{i}",
+            "title": f"habit {i}",
+            "isPositive": True,
+            "target": 3,
+            "period": "week",
+            "history": [1673344800000 + i * 86400000, 1],
+        }
+        for i in range(2)
+    ]
+
+    server_db = Replay_Couch_DB(docs)
+    monkeypatch.setattr(
+        Marvin_Processor, "get_couch_server_db", lambda user_config: server_db
+    )
+
+    return server_db
+
+
+def marvin_tables(incremental: bool) -> tuple:
+    task_df = Marvin_Processor.get_marvin_task_data({}, incremental=incremental)
+    habits_df = Marvin_Processor.get_marvin_habit_data({}, incremental=incremental)
+
+    return (
+        task_df.sort_values("doc_id", ignore_index=True),
+        habits_df.sort_values(["doc_id", "timestamp"], ignore_index=True),
+    )
+
+
+class Test_Marvin_Incremental_Sync:
+    @staticmethod
+    def test_changes_applied_in_place(cache_dir, marvin_db, monkeypatch):
+
+        marvin_tables(incremental=True)
+
+        marvin_db.save(
+            dict(marvin_task("home", "task 2 renamed"), _id="task_2", db="Tasks")
+        )
+        marvin_db.save(dict(marvin_task("project", "task 9"), _id="task_9", db="Tasks"))
+        marvin_db.delete("task_3")
+        marvin_db.save(
+            {"_id": "project", "db": "Categories", "title": "Big", "parentId": "work"}
+        )
+        marvin_db.save(
+            {
+                "_id": "habit_1",
+                "db": "Habits",
+                "id": "habit_1",
+                "title": "habit 1",
+                "isPositive": True,
+                "target": 4,
+                "period": "week",
+                "history": [1673344800000, 2, 1673431200000, 1],
+            }
+        )
+
+        # Only the changes feed is read
+        full_find = marvin_db.find
+        monkeypatch.setattr(marvin_db, "find", None)
+        task_df, habits_df = marvin_tables(incremental=True)
+        monkeypatch.setattr(marvin_db, "find", full_find)
+
+        assert list(task_df["doc_id"]) == ["task_0", "task_1", "task_2", "task_9"]
+        assert list(task_df["parent"]) == [
+            "Sub Project/Big/Work",
+            "Big/Work",
+            "Home",
+            "Big/Work",
+        ]
+        assert list(habits_df["count"]) == [1, 2, 1]
+
+        stored_df = Data_Getter_Utils().get_latest_file("marvin_tasks")
+        assert sorted(stored_df["name"]) == sorted(task_df["name"])
+
+        # Same tables as reading every doc again
+        Sync_State.clear(Data_Getter_Utils.cache_dir, "marvin_tasks")
+        Sync_State.clear(Data_Getter_Utils.cache_dir, "marvin_habits")
+        full_task_df, full_habits_df = marvin_tables(incremental=False)
+
+        pd.testing.assert_frame_equal(
+            task_df.astype(str), full_task_df.astype(str), check_dtype=False
+        )
+        pd.testing.assert_frame_equal(
+            habits_df.astype(str), full_habits_df.astype(str), check_dtype=False
+        )
+
+    @staticmethod
+    def test_changes_read_in_batches(cache_dir, marvin_db, monkeypatch):
+
+        monkeypatch.setattr(Marvin_Processor, "changes_batch_size", 3)
+
+        changed_docs, since = Marvin_Processor.read_changes(marvin_db, 0, ["Tasks"])
+
+        assert sorted(changed_docs) == ["task_0", "task_1", "task_2", "task_3"]
+        assert since == len(marvin_db.feed)
+
+
+class Test_Marvin_Couch_Reads:
+    @staticmethod
+    def test_find_docs_paged_and_projected(marvin_db, monkeypatch):
+
+        monkeypatch.setattr(Marvin_Processor, "find_page_size", 3)
+
+        post_json = marvin_db.resource.post_json
+        pages = []
+
+        def count_pages(path, body, **kwargs):
+            pages.append(dict(body))
+            return post_json(path, body, **kwargs)
+
+        monkeypatch.setattr(marvin_db.resource, "post_json", count_pages)
+
+        task_docs = list(
+            Marvin_Processor.find_docs(
+                marvin_db, "Tasks", Marvin_Processor.doc_fields["Tasks"]
+            )
+        )
+
+        # 4 tasks in pages of 3, the second page asked for by bookmark
+        assert [x["_id"] for x in task_docs] == [f"task_{i}" for i in range(4)]
+        assert len(pages) == 2 and pages[1]["bookmark"] == "3"
+        assert "db" not in task_docs[0]
+        assert set(task_docs[0]) <= set(Marvin_Processor.doc_fields["Tasks"])
+
+    @staticmethod
+    def test_connection_shared(monkeypatch):
+
+        servers = []
+
+        class Fake_Server:
+            def __init__(self, url):
+                servers.append(url)
+                self.resource = type("Resource", (), {})()
+
+            def __getitem__(self, database):
+                return (database, len(servers))
+
+        monkeypatch.setattr(get_marvin_data.couchdb, "Server", Fake_Server)
+        monkeypatch.setattr(Marvin_Processor, "couch_server_dbs", {})
+
+        marvin_config = {
+            "sync_server": "https://sync.example.com",
+            "sync_user": "jjm",
+            "sync_password": "x",
+            "sync_database": "marvin",
+        }
+        server_db = Marvin_Processor.get_couch_server_db(
+            {"marvin_config": marvin_config}
+        )
+
+        assert (
+            Marvin_Processor.get_couch_server_db({"marvin_config": dict(marvin_config)})
+            is server_db
+        )
+        assert len(servers) == 1
+
+
+class Test_Marvin_Habits:
+    @staticmethod
+    def test_parse_habits():
+
+        habits = [
+            {
+                "_id": "habit_0",
+                "id": "habit_0",
+                "title": "Exercise",
+                "isPositive": True,
+                "target": 3,
+                "period": "week",
+                # Logged twice on the first time, and a trailing time with no count
+                "history": [1673344800000, 1, 1673431200000, 2, 1673344800000, 4, 1],
+            },
+            {"_id": "habit_1", "title": "Unused", "history": []},
+            {
+                "_id": "habit_2",
+                "title": "Snacks",
+                "isPositive": False,
+                "target": 1,
+                "period": "day",
+                "history": [1673517600000, 1],
+            },
+        ]
+
+        habits_df = Marvin_Processor.parse_habits(habits)
+
+        assert list(habits_df["doc_id"]) == ["habit_0", "habit_0", "habit_2"]
+        assert list(habits_df["name"]) == ["Exercise", "Exercise", "Snacks"]
+        assert sorted(zip(habits_df["marvin_time"], habits_df["count"]))[:2] == [
+            (1673344800000, 4),
+            (1673431200000, 2),
+        ]
+        assert list(habits_df["target"]) == [3, 3, 1]
+
+        # Same local day and ISO week as the per row conversion
+        expected_days = pd.to_datetime(
+            [datetime.date.fromtimestamp(x / 1000) for x in habits_df["marvin_time"]]
+        )
+        assert list(habits_df["timestamp"]) == list(expected_days)
+        assert list(habits_df["week_number"]) == list(expected_days.isocalendar().week)
+
+        assert Marvin_Processor.parse_habits([]).empty
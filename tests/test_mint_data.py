@@ -0,0 +1,501 @@
+import time
+import pytest
+import pandas as pd
+
+from data_getters.utils import Data_Getter_Utils
+from data_getters.sync_state import Sync_State
+from data_getters.balance_history import Balance_History
+from data_getters.finance_cube import Finance_Cube
+from data_getters.get_mint_data import (
+    Finances_Dashboard_Helpers,
+    Mint_API_Getter,
+    Mint_Processor,
+    Unmapped_Category_Warning,
+)
+
+
+@pytest.fixture
+def mint_transactions():
+    return [
+        {
+            "id": "1",
+            "date": "2022-11-03",
+            "description": "Grocer",
+            "amount": -25.5,
+            "category": {"name": "Groceries", "parentName": "Food & Dining"},
+            "isPending": False,
+        },
+        {
+            "id": "2",
+            "date": "2022-12-14",
+            "description": "Employer",
+            "amount": 3000.0,
+            "category": {"name": "Paycheck", "parentName": "Income"},
+        },
+        {
+            "id": "3",
+            "date": "2023-01-02",
+            "amount": -12.25,
+            "category": {"name": "Groceries", "parentName": "Food & Dining"},
+        },
+    ]
+
+
+@pytest.fixture
+def user_config():
+    return {
+        "aggregate_categories": {
+            "food": ["Groceries"],
+            "paycheck": ["Paycheck"],
+        },
+        "meta_categories": {"spending": ["food"], "income": ["paycheck"]},
+    }
+
+
+class Fake_Mint_Conn:
+    def __init__(self, transactions: list, delay_seconds: float = 0):
+        self.transactions = transactions
+        self.delay_seconds = delay_seconds
+        self.calls = []
+
+    def get_transaction_data(self, start_date: str = None, **kwargs):
+        time.sleep(self.delay_seconds)
+        self.calls.append(start_date)
+
+        return [
+            x
+            for x in self.transactions
+            if start_date is None or x["date"] >= start_date
+        ]
+
+    def get_investment_data(self):
+        time.sleep(self.delay_seconds)
+        return [{"description": "Index fund", "currentValue": 100.0}]
+
+    def get_account_data(self):
+        time.sleep(self.delay_seconds)
+        return [
+            {"type": "BankAccount", "systemStatus": "ACTIVE", "currentBalance": 10.0}
+        ]
+
+    def get_budget_data(self):
+        time.sleep(self.delay_seconds)
+        return [
+            {
+                "budgetDate": "2023-01-01",
+                "amount": -30.0,
+                "budgetAmount": 100.0,
+                "category": {"name": "Groceries"},
+            }
+        ]
+
+    def close(self):
+        pass
+
+
+class Test_Mint_Processing:
+    @staticmethod
+    @pytest.mark.parametrize("batch_size", [1, 2, 100])
+    def test_process_mint_df(mint_transactions, batch_size, monkeypatch):
+
+        monkeypatch.setattr(Mint_API_Getter, "batch_size", batch_size)
+        ret_cols = ["date", "description", "amount", "category"]
+
+        ret_df = Mint_API_Getter.process_mint_df(mint_transactions, ret_cols)
+
+        assert list(ret_df.columns) == ret_cols
+        assert list(ret_df.index) == [0, 1, 2]
+        assert list(ret_df["amount"]) == [-25.5, 3000.0, -12.25]
+        assert pd.isnull(ret_df.loc[2, "description"])
+
+    @staticmethod
+    def test_nested_fields_flattened(mint_transactions):
+
+        mint_transactions.append({"date": "2023-01-05", "amount": 1.0})
+
+        ret_df = Mint_API_Getter.process_mint_df(
+            mint_transactions,
+            ["date", "amount", "category"],
+            nested_cols={"category": ["name", "parentName"]},
+        )
+
+        assert list(ret_df.columns) == ["date", "amount", "name", "parentName"]
+        assert isinstance(ret_df["name"].dtype, pd.CategoricalDtype)
+        assert list(ret_df["name"][:3]) == ["Groceries", "Paycheck", "Groceries"]
+        assert list(ret_df["parentName"][:2]) == ["Food & Dining", "Income"]
+        assert pd.isnull(ret_df.loc[3, "name"])
+
+        with pytest.raises(ValueError):
+            Mint_API_Getter.process_mint_df(
+                mint_transactions, ["name", "category"], {"category": ["name"]}
+            )
+
+    @staticmethod
+    def test_record_batches_stream(mint_transactions):
+
+        batches = list(
+            Mint_API_Getter.mint_record_batches(
+                iter(mint_transactions), ["date", "amount"], batch_size=2
+            )
+        )
+
+        assert [len(x) for x in batches] == [2, 1]
+        assert len(Mint_API_Getter.process_mint_df([], ["date"])) == 0
+
+
+class Test_Mint_Incremental_Sync:
+    @staticmethod
+    def test_incremental_matches_full_refresh(
+        cache_dir, mint_transactions, user_config
+    ):
+
+        mint_conn = Fake_Mint_Conn(mint_transactions)
+        Mint_API_Getter.get_transactions_df(mint_conn, "jjm", incremental=True)
+        Mint_Processor.clean_transactions(user_config, "jjm", incremental=True)
+
+        # No watermark yet, so the first sync fetched everything
+        assert mint_conn.calls == [None]
+        watermark = Sync_State.get(str(cache_dir), "mint_transactions_jjm")
+        assert (watermark["date"], watermark["id"]) == ("2023-01-02", "3")
+
+        # An edit inside the resync window, a deletion and a new transaction
+        mint_conn.transactions = mint_transactions[:2] + [
+            {
+                "id": "4",
+                "date": "2023-01-10",
+                "amount": -40.0,
+                "category": {"name": "Groceries", "parentName": "Food & Dining"},
+            },
+        ]
+        mint_conn.transactions[1] = dict(mint_conn.transactions[1], date="2022-12-28")
+
+        Mint_API_Getter.get_transactions_df(mint_conn, "jjm", incremental=True)
+        incremental_df = Mint_Processor.clean_transactions(
+            user_config, "jjm", incremental=True
+        )
+
+        assert mint_conn.calls[-1] == "2022-12-19"
+        raw_df = Data_Getter_Utils().get_latest_file("mint_transactions_raw_jjm")
+        assert list(raw_df["id"]) == ["1", "2", "4"]
+
+        full_df = Mint_Processor.clean_transactions(user_config, "jjm")
+
+        pd.testing.assert_frame_equal(
+            incremental_df.reset_index(drop=True),
+            full_df.reset_index(drop=True),
+            check_dtype=False,
+            check_categorical=False,
+        )
+        assert list(full_df["total"]) == [-25.5, 3000.0, -40.0]
+
+    @staticmethod
+    def test_uncleaned_sync_kept_for_next_clean(
+        cache_dir, mint_transactions, user_config
+    ):
+
+        mint_conn = Fake_Mint_Conn(mint_transactions)
+        Mint_API_Getter.get_transactions_df(mint_conn, "jjm", incremental=True)
+        Mint_Processor.clean_transactions(user_config, "jjm", incremental=True)
+        assert Sync_State.get(str(cache_dir), "mint_unclean_jjm") is None
+
+        # An edit inside the first window and a later transaction, not cleaned
+        mint_conn.transactions = mint_transactions + [
+            {
+                "id": "4",
+                "date": "2023-02-20",
+                "amount": -40.0,
+                "category": {"name": "Groceries", "parentName": "Food & Dining"},
+            },
+        ]
+        mint_conn.transactions[2] = dict(mint_conn.transactions[2], amount=-99.0)
+        Mint_API_Getter.get_transactions_df(mint_conn, "jjm", incremental=True)
+
+        # Nothing changed, its window starts after the edit
+        Mint_API_Getter.get_transactions_df(mint_conn, "jjm", incremental=True)
+        assert mint_conn.calls[1:] == ["2022-12-19", "2023-02-06"]
+        unclean = Sync_State.get(str(cache_dir), "mint_unclean_jjm")
+        assert unclean == {"resync_from": "2022-12-19"}
+
+        incremental_df = Mint_Processor.clean_transactions(
+            user_config, "jjm", incremental=True
+        )
+        assert Sync_State.get(str(cache_dir), "mint_unclean_jjm") is None
+
+        full_df = Mint_Processor.clean_transactions(user_config, "jjm")
+
+        pd.testing.assert_frame_equal(
+            incremental_df.reset_index(drop=True),
+            full_df.reset_index(drop=True),
+            check_dtype=False,
+            check_categorical=False,
+        )
+        assert list(full_df["total"]) == [-25.5, 3000.0, -99.0, -40.0]
+
+    @staticmethod
+    def test_moved_transaction_replaces_older_copy():
+
+        history_df = pd.DataFrame(
+            data={"id": ["1", "2"], "date": ["2022-11-03", "2022-12-20"]}
+        )
+        new_df = pd.DataFrame(data={"id": ["1"], "date": ["2022-12-25"]})
+
+        merged_df, resync_from = Mint_API_Getter.merge_transactions(
+            history_df, new_df, pd.Timestamp("2022-12-15")
+        )
+
+        assert list(merged_df["id"]) == ["1"]
+        assert resync_from == pd.Timestamp("2022-11-03")
+
+
+class Test_Mint_Parallel_Ingest:
+    @staticmethod
+    def test_users_ingested_concurrently(cache_dir, mint_transactions, monkeypatch):
+
+        monkeypatch.setattr(
+            Mint_API_Getter,
+            "get_mint_conn",
+            lambda login_config: Fake_Mint_Conn(mint_transactions, 0.2),
+        )
+
+        start = time.perf_counter()
+        ret = Mint_API_Getter.ingest_users(
+            {"jjm": {}, "dmg": {}}, max_workers=2, incremental=True
+        )
+        elapsed = time.perf_counter() - start
+
+        # Four 0.2s requests per user, serially that would be 1.6s
+        assert elapsed < 1.4
+        assert set(ret) == {"jjm", "dmg"}
+        assert list(ret["dmg"]["budgets"]["name"]) == ["Groceries"]
+
+        for user_name in ["jjm", "dmg"]:
+            raw_df = Data_Getter_Utils().get_latest_file(
+                f"mint_transactions_raw_{user_name}"
+            )
+            assert list(raw_df["id"]) == ["1", "2", "3"]
+            assert Sync_State.get(str(cache_dir), f"mint_transactions_{user_name}")
+
+
+class Test_Category_Mapper:
+    @staticmethod
+    def test_mapper_compiled_once_per_config(user_config):
+
+        category_mapper = Mint_Processor.get_category_mapper(user_config)
+        assert Mint_Processor.get_category_mapper(dict(user_config)) is category_mapper
+
+        user_config["aggregate_categories"]["food"].append("Restaurants")
+        assert Mint_Processor.get_category_mapper(user_config) is not category_mapper
+
+    @staticmethod
+    @pytest.mark.parametrize("dtype", ["object", "category"])
+    def test_unmapped_names_reported(user_config, dtype):
+
+        raw_df = pd.DataFrame(
+            data={
+                "name": pd.Series(
+                    ["Groceries", "Gas", "Paycheck", None, "Gas"], dtype=dtype
+                ),
+                "amount": [-1.0, -2.0, 3.0, -4.0, -5.0],
+            }
+        )
+        category_mapper = Mint_Processor.get_category_mapper(user_config)
+
+        with pytest.warns(Unmapped_Category_Warning, match=r"\['Gas'\]"):
+            ret_df = category_mapper.map_rows(raw_df, "mint_transactions_raw_jjm")
+
+        assert list(ret_df["amount"]) == [-1.0, 3.0]
+        assert list(ret_df["category"]) == ["food", "paycheck"]
+        assert list(ret_df["meta_category"]) == ["spending", "income"]
+
+    @staticmethod
+    def test_changed_mapping_forces_full_clean(
+        cache_dir, mint_transactions, user_config
+    ):
+
+        mint_conn = Fake_Mint_Conn(mint_transactions)
+        Mint_API_Getter.get_transactions_df(mint_conn, "jjm", incremental=True)
+        Mint_Processor.clean_transactions(user_config, "jjm", incremental=True)
+
+        # Same sync again, but paychecks are now mapped as bonus
+        Mint_API_Getter.get_transactions_df(mint_conn, "jjm", incremental=True)
+        user_config["aggregate_categories"] = {
+            "food": ["Groceries"],
+            "bonus": ["Paycheck"],
+        }
+        user_config["meta_categories"]["income"] = ["bonus"]
+
+        ret_df = Mint_Processor.clean_transactions(user_config, "jjm", incremental=True)
+
+        assert list(ret_df["category"]) == ["food", "bonus", "food"]
+
+
+class Test_Mint_Chunked_Clean:
+    @staticmethod
+    def test_chunked_matches_in_memory(cache_dir, user_config):
+
+        dates = pd.date_range("2020-01-01", "2022-12-31", freq="D")
+        transactions = [
+            {
+                "id": str(i),
+                "date": date.strftime("%Y-%m-%d"),
+                "amount": round(-0.01 * (i % 997) - 0.1, 2),
+                "category": {
+                    "name": ["Groceries", "Paycheck", "Gas"][i % 3],
+                    "parentName": "Root",
+                },
+            }
+            for i, date in enumerate(dates.repeat(3))
+        ]
+        mint_conn = Fake_Mint_Conn(transactions)
+        Mint_API_Getter.get_transactions_df(mint_conn, "jjm")
+
+        chunks = list(Data_Getter_Utils().iter_latest_file("mint_transactions_raw_jjm"))
+        assert len(chunks) == 36
+        assert max(len(x) for x in chunks) == 93
+
+        with pytest.warns(Unmapped_Category_Warning):
+            in_memory_df = Mint_Processor.clean_transactions(user_config, "jjm")
+        with pytest.warns(Unmapped_Category_Warning):
+            chunked_df = Mint_Processor.clean_transactions(
+                user_config, "jjm", chunked=True
+            )
+
+        pd.testing.assert_frame_equal(in_memory_df, chunked_df)
+
+
+class Test_Balance_History:
+    @staticmethod
+    def test_as_of_and_net_worth(cache_dir):
+        def accounts(bank: float, investment: float, closed: bool = False):
+            return pd.DataFrame(
+                data={
+                    "id": ["1", "2", "3"],
+                    "name": ["Checking", "Brokerage", "Old card"],
+                    "type": ["BankAccount", "InvestmentAccount", "CreditAccount"],
+                    "systemStatus": [
+                        "ACTIVE",
+                        "ACTIVE",
+                        "CLOSED" if closed else "ACTIVE",
+                    ],
+                    "currentBalance": [bank, investment, -50.0],
+                }
+            )
+
+        Balance_History.record(accounts(100.0, 1000.0), "jjm", "2022-12-30")
+        Balance_History.record(accounts(200.0, 1100.0), "jjm", "2023-01-05")
+        # Re-running an ingest on the same day replaces that day
+        Balance_History.record(accounts(999.0, 999.0), "jjm", "2023-01-20")
+        Balance_History.record(accounts(300.0, 1200.0, True), "jjm", "2023-01-20")
+
+        balance_history = Balance_History.load("jjm")
+
+        assert balance_history.as_of("2022-12-29").empty
+        assert dict(balance_history.as_of("2023-01-10")) == {
+            "bank": 150.0,
+            "investment": 1100.0,
+        }
+        # The closed card no longer counts
+        assert dict(balance_history.as_of("2023-03-01")) == {
+            "bank": 300.0,
+            "investment": 1200.0,
+        }
+        assert list(balance_history.accounts_as_of("2023-01-06")["account"]) == [
+            "1",
+            "2",
+            "3",
+        ]
+
+        net_worth = balance_history.net_worth("2023-01-01", "2023-01-31")
+        assert list(net_worth.index.strftime("%Y-%m-%d")) == [
+            "2023-01-05",
+            "2023-01-20",
+        ]
+        assert list(net_worth) == [1250.0, 1500.0]
+
+
+class Test_Finance_Cube:
+    @staticmethod
+    def test_helpers_match_daily_path():
+
+        dates = pd.date_range("2021-01-01", "2023-06-30", freq="D")
+        categories = ["food", "income", "bonus", "rent", "paycheck"]
+        finance_df = pd.DataFrame(
+            data={
+                "year": dates.year.repeat(len(categories)),
+                "month": dates.month.repeat(len(categories)),
+                "day": dates.day.repeat(len(categories)),
+                "category": categories * len(dates),
+            }
+        )
+        finance_df["total"] = [
+            float((i * 37) % 200 - 120) for i in range(len(finance_df))
+        ]
+        budget_df = pd.DataFrame(
+            data={"category": ["food", "rent"], "budget": [-400.0, -1500.0]}
+        )
+
+        finance_cube = Finance_Cube(finance_df, budget_df)
+
+        for agg_str in ["week", "month", "quarter", "year"]:
+            daily_df = Finances_Dashboard_Helpers.create_spend_budget_df(
+                finance_df, budget_df, 2022, 5, agg_str
+            )
+            cube_df = Finances_Dashboard_Helpers.create_spend_budget_df(
+                None, budget_df, 2022, 5, agg_str, finance_cube=finance_cube
+            )
+            pd.testing.assert_frame_equal(
+                daily_df.reset_index(drop=True),
+                cube_df.reset_index(drop=True),
+                check_dtype=False,
+            )
+
+        pd.testing.assert_frame_equal(
+            Finances_Dashboard_Helpers.get_month_sum_df(finance_df),
+            Finances_Dashboard_Helpers.get_month_sum_df(
+                None, finance_cube=finance_cube
+            ),
+            check_dtype=False,
+        )
+
+        assert Finances_Dashboard_Helpers.get_budget_shortfall(
+            finance_df, 3000, 5, 2022, 2022
+        ) == pytest.approx(
+            Finances_Dashboard_Helpers.get_budget_shortfall(
+                None, 3000, 5, 2022, 2022, finance_cube=finance_cube
+            )
+        )
+
+        # A whole grid of targets and start years in one pass
+        shortfall_df = finance_cube.what_if().shortfall_table(
+            [1000, 3000, 5000], 5, 2022, [2021, 2022, 2023, 2024]
+        )
+        for profit_target in [1000, 3000, 5000]:
+            for start_year in [2021, 2022, 2023]:
+                assert shortfall_df.loc[profit_target, start_year] == pytest.approx(
+                    Finances_Dashboard_Helpers.get_budget_shortfall(
+                        finance_df, profit_target, 5, 2022, start_year
+                    )
+                )
+
+        # No months since the start year to average over
+        assert shortfall_df[2024].isna().all()
+
+    @staticmethod
+    def test_week_cells():
+
+        finance_df = pd.DataFrame(
+            data={
+                "year": [2023, 2023, 2023],
+                "month": [1, 1, 2],
+                "day": [30, 31, 1],
+                "category": ["food", "food", "food"],
+                "total": [-1.0, -2.0, -4.0],
+            }
+        )
+
+        finance_cube = Finance_Cube(finance_df)
+        ret_df = finance_cube.period_totals(2023, 1, "week", week_num=5)
+
+        # Week 5 runs over the end of January into February
+        assert list(ret_df["total"]) == [-7.0]
+        assert len(finance_cube.period_totals(2024, 1, "year")) == 0
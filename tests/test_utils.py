@@ -0,0 +1,630 @@
+import os
+import pytest
+import numpy as np
+import pandas as pd
+
+from data_getters.utils import Data_Getter_Utils
+from data_getters import cache_storage
+from data_getters.cache_lock import Cache_Lock
+from data_getters.cache_manifest import Cache_Manifest
+from data_getters.cache_query import Cache_Query_Engine
+from data_getters.cache_storage import Arrow_Storage, Csv_Storage
+from data_getters.delta_snapshots import Delta_Snapshots
+from data_getters.frame_cache import Frame_Cache
+from data_getters.partitioned_cache import Partitioned_Cache
+
+
+@pytest.fixture
+def finance_df():
+    return pd.DataFrame(
+        data={
+            "year": [2022, 2022, 2023],
+            "month": [11, 12, 1],
+            "day": [3, 14, 2],
+            "category": ["food", "paycheck", "food"],
+            "total": [-25.5, 3000.0, -12.25],
+            "timestamp": pd.to_datetime(["2022-11-03", "2022-12-14", "2023-01-02"]),
+        }
+    )
+
+
+@pytest.fixture
+def transactions_df():
+    return pd.DataFrame(
+        data={
+            "date": ["2022-11-03", "2022-12-14", "2023-01-02"],
+            "description": ["Grocer", "Employer", "Grocer"],
+            "amount": [-25.5, 3000.0, -12.25],
+            "type": ["CashAndCreditTransaction"] * 3,
+            "accountId": ["1", "2", "1"],
+            "name": ["Groceries", "Paycheck", "Groceries"],
+            "parentName": ["Food & Dining", "Income", "Food & Dining"],
+        }
+    )
+
+
+class Test_Cache_Storage:
+    @staticmethod
+    def test_parquet_round_trip_keeps_dtypes(cache_dir, finance_df):
+
+        file_path = Data_Getter_Utils.write_temp_cache(
+            finance_df, "mint_investments_raw_jjm"
+        )
+        assert file_path.endswith(".parquet")
+
+        ret_df = Data_Getter_Utils().get_latest_file("mint_investments_raw_jjm")
+
+        assert pd.api.types.is_datetime64_any_dtype(ret_df["timestamp"])
+        assert ret_df["total"].sum() == finance_df["total"].sum()
+
+    @staticmethod
+    def test_migrate_csv_snapshot(cache_dir, finance_df):
+
+        finance_df.to_csv(cache_dir / "daily_finances_jjm_2023-01-03.csv", index=False)
+
+        migrated = Data_Getter_Utils().migrate_cache()
+
+        assert [x.endswith(".arrow") for x in migrated] == [True]
+        assert list(cache_dir.glob("*.csv")) == []
+
+        ret_df = Data_Getter_Utils().get_latest_file("daily_finances_jjm")
+        assert pd.api.types.is_datetime64_any_dtype(ret_df["timestamp"])
+
+    @staticmethod
+    def test_migration_skips_fallback_csvs(cache_dir, monkeypatch):
+
+        mixed_df = pd.DataFrame(
+            data={"attribute": ["mood", "steps"], "value": [3, "a"]}
+        )
+        mixed_df.to_csv(cache_dir / "mint_investments_raw_2023-01-03.csv", index=False)
+        Data_Getter_Utils.write_temp_cache(mixed_df, "mint_investments_raw_jjm")
+
+        # Only the legacy CSV is migrated, the fallback keeps its mixed values
+        assert len(Data_Getter_Utils().migrate_cache()) == 1
+
+        def fail_read(*args, **kwargs):
+            raise AssertionError("CSV read again")
+
+        monkeypatch.setattr(Csv_Storage, "read", fail_read)
+        assert Data_Getter_Utils().migrate_cache() == []
+        assert len(list(cache_dir.glob("*.csv"))) == 1
+
+    @staticmethod
+    def test_dashboard_datasets_are_memory_mapped(cache_dir, finance_df):
+
+        file_path = Data_Getter_Utils.write_temp_cache(finance_df, "daily_finances_jjm")
+        assert file_path.endswith(".arrow")
+
+        # Through the normal load path, schema and Frame_Cache included
+        ret_df = Data_Getter_Utils().get_latest_file("daily_finances_jjm")
+
+        # Date range filters as the dashboard's startup loads use
+        filtered_df = Data_Getter_Utils().get_latest_file(
+            "daily_finances_jjm", filters=[("year", ">=", 2022)]
+        )
+        sliced_df = Data_Getter_Utils().get_latest_file(
+            "daily_finances_jjm", filters=[("year", ">=", 2023)]
+        )
+        assert list(sliced_df["total"]) == [-12.25]
+
+        assert ret_df["year"].dtype == "int16"
+        assert ret_df["category"].dtype == "category"
+        for col in ["year", "total", "timestamp"]:
+            for loaded_df in [ret_df, filtered_df, sliced_df]:
+                values = loaded_df[col].to_numpy()
+                assert not values.flags.owndata
+
+                # Backed by the mapped arrow buffer, not an array pandas allocated
+                while isinstance(values.base, np.ndarray):
+                    values = values.base
+                assert not isinstance(values.base, np.ndarray)
+                assert values.base is not None
+
+    @staticmethod
+    def test_mixed_object_column_falls_back_to_csv(cache_dir):
+
+        mixed_df = pd.DataFrame(
+            data={"attribute": ["mood", "steps"], "value": [3, "a"]}
+        )
+
+        file_path = Data_Getter_Utils.write_temp_cache(mixed_df, "mint_investments_raw")
+
+        assert file_path.endswith(".csv")
+        assert len(list(cache_dir.glob("*.parquet"))) == 0
+
+
+class Test_Cache_Manifest:
+    @staticmethod
+    def test_prefix_does_not_match_longer_dataset_name(cache_dir, finance_df):
+
+        Data_Getter_Utils.write_temp_cache(finance_df, "mint_investments_raw_jjm")
+
+        with pytest.raises(ValueError):
+            Data_Getter_Utils().get_latest_file("mint_investments_raw_j")
+
+        ret_df = Data_Getter_Utils().get_latest_file("mint_investments_raw")
+        assert len(ret_df) == len(finance_df)
+
+    @staticmethod
+    def test_manifest_tracks_rows_and_schema(cache_dir, finance_df):
+
+        Data_Getter_Utils.write_temp_cache(finance_df, "daily_finances_jjm")
+
+        manifest = Cache_Manifest.load(str(cache_dir))
+        snapshot = manifest["daily_finances_jjm"][-1]
+
+        assert snapshot["rows"] == 3
+        assert snapshot["schema"]["year"] == "int16"
+        assert snapshot["schema"]["category"] == "category"
+
+    @staticmethod
+    def test_rebuild_picks_latest_existing_snapshot(cache_dir, finance_df):
+
+        finance_df.to_csv(cache_dir / "daily_finances_jjm_2023-01-02.csv", index=False)
+        finance_df.head(1).to_csv(
+            cache_dir / "daily_finances_jjm_2023-01-03.csv", index=False
+        )
+
+        ret_df = Data_Getter_Utils().get_latest_file("daily_finances_jjm")
+        assert len(ret_df) == 1
+
+        Data_Getter_Utils().remove_snapshot(
+            str(cache_dir / "daily_finances_jjm_2023-01-03.csv")
+        )
+
+        ret_df = Data_Getter_Utils().get_latest_file("daily_finances_jjm")
+        assert len(ret_df) == 3
+
+
+class Test_Frame_Cache:
+    @staticmethod
+    def test_loaded_frames_are_isolated_from_cache(cache_dir, finance_df):
+
+        Data_Getter_Utils.write_temp_cache(finance_df, "daily_finances_jjm")
+
+        first_df = Data_Getter_Utils().get_latest_file("daily_finances_jjm")
+        first_df["total"] = 0
+        first_df["user"] = "jjm"
+
+        second_df = Data_Getter_Utils().get_latest_file("daily_finances_jjm")
+
+        assert "user" not in second_df.columns
+        assert second_df["total"].sum() == finance_df["total"].sum()
+
+    @staticmethod
+    def test_cache_hit_shares_column_buffers(cache_dir, finance_df):
+
+        Data_Getter_Utils.write_temp_cache(finance_df, "mint_investments_raw_jjm")
+
+        first_df = Data_Getter_Utils().get_latest_file("mint_investments_raw_jjm")
+        second_df = Data_Getter_Utils().get_latest_file("mint_investments_raw_jjm")
+
+        assert first_df is not second_df
+        for col in ["year", "total", "timestamp"]:
+            assert np.shares_memory(first_df[col].to_numpy(), second_df[col].to_numpy())
+
+        # A replaced column belongs to that caller only
+        first_df["total"] = 0.0
+        third_df = Data_Getter_Utils().get_latest_file("mint_investments_raw_jjm")
+        assert third_df["total"].sum() == finance_df["total"].sum()
+
+    @staticmethod
+    def test_rewritten_snapshot_is_reloaded(cache_dir, finance_df):
+
+        Data_Getter_Utils.write_temp_cache(finance_df, "daily_finances_jjm")
+        assert len(Data_Getter_Utils().get_latest_file("daily_finances_jjm")) == 3
+
+        Data_Getter_Utils.write_temp_cache(finance_df.head(1), "daily_finances_jjm")
+        assert len(Data_Getter_Utils().get_latest_file("daily_finances_jjm")) == 1
+
+    @staticmethod
+    def test_memory_budget_evicts_least_recent(cache_dir, finance_df, monkeypatch):
+
+        frame_bytes = int(finance_df.memory_usage(index=True, deep=True).sum())
+        monkeypatch.setattr(Frame_Cache, "max_bytes", frame_bytes + 1)
+
+        Data_Getter_Utils.write_temp_cache(finance_df, "daily_finances_jjm")
+        Data_Getter_Utils.write_temp_cache(finance_df, "daily_finances_dmg")
+
+        Data_Getter_Utils().get_latest_file("daily_finances_jjm")
+        Data_Getter_Utils().get_latest_file("daily_finances_dmg")
+
+        assert len(Frame_Cache._frames) == 1
+        assert Frame_Cache._total_bytes <= Frame_Cache.max_bytes
+
+
+class Test_Partitioned_Cache:
+    @staticmethod
+    def test_only_changed_months_are_rewritten(cache_dir, transactions_df):
+
+        Data_Getter_Utils.write_temp_cache(transactions_df, "mint_transactions_raw_jjm")
+
+        changed_df = transactions_df.copy()
+        changed_df.loc[2, "amount"] = -50.0
+        Data_Getter_Utils.write_temp_cache(changed_df, "mint_transactions_raw_jjm")
+
+        versions = Partitioned_Cache.load_versions(
+            str(cache_dir), "mint_transactions_raw_jjm"
+        )
+        partitions = versions["versions"]["2"]["partitions"]
+
+        assert partitions["2022-11"]["file"].startswith(
+            os.path.join("2022-11", "part-000001")
+        )
+        assert partitions["2023-01"]["file"].startswith(
+            os.path.join("2023-01", "part-000002")
+        )
+
+        ret_df = Data_Getter_Utils().get_latest_file("mint_transactions_raw_jjm")
+        assert ret_df["amount"].sum() == changed_df["amount"].sum()
+
+    @staticmethod
+    def test_partial_write_keeps_other_months(cache_dir, transactions_df):
+
+        Data_Getter_Utils.write_temp_cache(transactions_df, "mint_transactions_raw_jjm")
+        Data_Getter_Utils.write_temp_cache(
+            transactions_df.tail(1), "mint_transactions_raw_jjm", full=False
+        )
+
+        ret_df = Data_Getter_Utils().get_latest_file("mint_transactions_raw_jjm")
+        assert len(ret_df) == 3
+
+    @staticmethod
+    def test_pinned_version_survives_newer_write(cache_dir, transactions_df):
+
+        Data_Getter_Utils.write_temp_cache(transactions_df, "mint_transactions_raw_jjm")
+        Data_Getter_Utils.write_temp_cache(
+            transactions_df.head(1), "mint_transactions_raw_jjm"
+        )
+
+        old_df = Partitioned_Cache.read(str(cache_dir), "mint_transactions_raw_jjm", 1)
+        new_df = Partitioned_Cache.read(str(cache_dir), "mint_transactions_raw_jjm")
+
+        assert (len(old_df), len(new_df)) == (3, 1)
+
+    @staticmethod
+    def test_retention_keeps_latest_snapshot_per_dataset(cache_dir, transactions_df):
+
+        transactions_df.to_csv(
+            cache_dir / "monthly_budget_jjm_2023-01-02.csv", index=False
+        )
+        transactions_df.to_csv(
+            cache_dir / "monthly_budget_jjm_2023-01-03.csv", index=False
+        )
+        transactions_df.to_csv(
+            cache_dir / "account_totals_jjm_2023-01-02.csv", index=False
+        )
+
+        Data_Getter_Utils().apply_retention_policy(keep_snapshots=1, keep_monthly=0)
+
+        assert sorted(x.name for x in cache_dir.glob("*.csv")) == [
+            "account_totals_jjm_2023-01-02.csv",
+            "monthly_budget_jjm_2023-01-03.csv",
+        ]
+
+    @staticmethod
+    def test_retention_keeping_no_snapshots_as_is(cache_dir, transactions_df):
+
+        for date_str in ["2023-01-02", "2023-01-03"]:
+            transactions_df.to_csv(
+                cache_dir / f"monthly_budget_jjm_{date_str}.csv", index=False
+            )
+
+        # Only the month's checkpoint is left
+        Data_Getter_Utils().apply_retention_policy(keep_snapshots=0, keep_monthly=1)
+
+        assert [x.name for x in cache_dir.glob("*.csv")] == [
+            "monthly_budget_jjm_2023-01-03.csv"
+        ]
+
+
+class Test_Cache_Writes:
+    @staticmethod
+    def test_failed_write_leaves_no_snapshot(cache_dir, finance_df, monkeypatch):
+        def crash(df, file_path):
+            with open(file_path, "w") as half_file:
+                half_file.write("half a file")
+            raise OSError("disk full")
+
+        monkeypatch.setattr(Arrow_Storage, "write", crash)
+
+        with pytest.raises(OSError):
+            Data_Getter_Utils.write_temp_cache(finance_df, "daily_finances_jjm")
+
+        assert [x.name for x in cache_dir.iterdir()] == []
+
+    @staticmethod
+    def test_same_day_rewrite_of_mapped_snapshot(cache_dir, finance_df, monkeypatch):
+
+        first_path = Data_Getter_Utils.write_temp_cache(
+            finance_df, "daily_finances_jjm"
+        )
+        Data_Getter_Utils().get_latest_file("daily_finances_jjm")
+
+        # Windows refuses to replace a file that's memory-mapped
+        replace = os.replace
+
+        def mapped_replace(src, dst):
+            if os.path.abspath(dst) == os.path.abspath(first_path):
+                raise PermissionError("file is mapped")
+            return replace(src, dst)
+
+        monkeypatch.setattr(cache_storage.os, "replace", mapped_replace)
+
+        second_path = Data_Getter_Utils.write_temp_cache(
+            finance_df.head(1), "daily_finances_jjm"
+        )
+
+        assert second_path.endswith(".r001.arrow")
+        assert len(Data_Getter_Utils().get_latest_file("daily_finances_jjm")) == 1
+
+        manifest = Cache_Manifest.load(str(cache_dir))
+        assert manifest["daily_finances_jjm"][-1]["superseded"] == [
+            os.path.basename(first_path)
+        ]
+
+        # Removed once the dashboard has let go of it
+        monkeypatch.setattr(cache_storage.os, "replace", replace)
+        assert Data_Getter_Utils().apply_retention_policy() == [first_path]
+        assert [x.name for x in cache_dir.glob("*.arrow")] == [
+            os.path.basename(second_path)
+        ]
+
+    @staticmethod
+    def test_retention_compacts_older_snapshots_to_monthly(cache_dir, finance_df):
+
+        for date_str in ["2022-11-01", "2022-11-20", "2022-12-05", "2022-12-06"]:
+            finance_df.to_csv(
+                cache_dir / f"monthly_budget_jjm_{date_str}.csv", index=False
+            )
+
+        Data_Getter_Utils().apply_retention_policy(keep_snapshots=1, keep_monthly=12)
+
+        assert sorted(x.name for x in cache_dir.glob("*.csv")) == [
+            "monthly_budget_jjm_2022-11-20.csv",
+            "monthly_budget_jjm_2022-12-05.csv",
+            "monthly_budget_jjm_2022-12-06.csv",
+        ]
+
+    @staticmethod
+    def test_lock_blocks_overlapping_refresh(cache_dir, monkeypatch):
+
+        monkeypatch.setattr(Cache_Lock, "timeout_seconds", 0)
+
+        with Cache_Lock.hold(str(cache_dir)):
+            with pytest.raises(TimeoutError):
+                with Cache_Lock.hold(str(cache_dir)):
+                    pass
+
+        with Cache_Lock.hold(str(cache_dir)):
+            pass
+
+
+class Test_Cache_Schemas:
+    @staticmethod
+    def test_registry_applied_on_write_and_load(cache_dir, finance_df):
+
+        Data_Getter_Utils.write_temp_cache(finance_df, "daily_finances_jjm")
+
+        ret_df = Data_Getter_Utils().get_latest_file("daily_finances")
+
+        assert ret_df["category"].dtype == "category"
+        assert (ret_df["year"].dtype, ret_df["month"].dtype) == ("int16", "int8")
+        assert ret_df["total"].dtype == "float64"
+
+    @staticmethod
+    def test_missing_columns_rejected(cache_dir, finance_df):
+
+        with pytest.raises(ValueError):
+            Data_Getter_Utils.write_temp_cache(
+                finance_df.drop(columns=["category"]), "daily_finances_jjm"
+            )
+
+    @staticmethod
+    def test_csv_snapshot_typed_on_load(cache_dir, finance_df):
+
+        finance_df.to_csv(cache_dir / "daily_finances_jjm_2023-01-03.csv", index=False)
+
+        ret_df = Data_Getter_Utils().get_latest_file("daily_finances_jjm")
+
+        assert ret_df["category"].dtype == "category"
+        assert pd.api.types.is_datetime64_any_dtype(ret_df["timestamp"])
+
+
+class Test_Delta_Snapshots:
+    @staticmethod
+    def test_changed_month_stored_as_delta(cache_dir, transactions_df):
+
+        history_df = pd.concat([transactions_df] * 8, ignore_index=True)
+        history_df["description"] = [f"Shop {x}" for x in range(len(history_df))]
+        history_df["id"] = [str(x) for x in range(len(history_df))]
+        Data_Getter_Utils.write_temp_cache(history_df, "mint_transactions_raw_jjm")
+
+        # One January row deleted, one added and one edited
+        new_df = pd.concat([history_df, history_df.tail(1)], ignore_index=True)
+        new_df.loc[len(new_df) - 1, ["description", "id"]] = ["New shop", "new"]
+        new_df.loc[5, "amount"] = -13.0
+        new_df = new_df.drop(index=[2]).reset_index(drop=True)
+        Data_Getter_Utils.write_temp_cache(new_df, "mint_transactions_raw_jjm")
+
+        versions = Partitioned_Cache.load_versions(
+            str(cache_dir), "mint_transactions_raw_jjm"
+        )
+        partition = versions["versions"]["2"]["partitions"]["2023-01"]
+        assert partition["delta"].startswith(os.path.join("2023-01", "delta-000002"))
+        assert partition["file"].startswith(os.path.join("2023-01", "part-000001"))
+        assert partition["key_cols"] == ["id"]
+
+        # Keyed on the Mint id, the edit is a single upsert
+        delta_df = Partitioned_Cache.read_file(
+            Partitioned_Cache.dataset_dir(str(cache_dir), "mint_transactions_raw_jjm"),
+            partition["delta"],
+        )
+        assert sorted(zip(delta_df[Delta_Snapshots.op_col], delta_df["id"])) == [
+            ("delete", "2"),
+            ("upsert", "5"),
+            ("upsert", "new"),
+        ]
+
+        ret_df = Data_Getter_Utils().get_latest_file("mint_transactions_raw_jjm")
+
+        assert sorted(ret_df["description"]) == sorted(new_df["description"])
+        assert ret_df["amount"].sum() == new_df["amount"].sum()
+
+    @staticmethod
+    def test_rows_without_ids_diffed_whole(cache_dir, transactions_df):
+
+        # Months written before Mint ids were kept
+        history_df = pd.concat([transactions_df] * 4, ignore_index=True)
+        history_df["description"] = [f"Shop {x}" for x in range(len(history_df))]
+        Data_Getter_Utils.write_temp_cache(history_df, "mint_transactions_raw_jjm")
+
+        new_df = history_df.drop(index=[2]).reset_index(drop=True)
+        Data_Getter_Utils.write_temp_cache(new_df, "mint_transactions_raw_jjm")
+
+        versions = Partitioned_Cache.load_versions(
+            str(cache_dir), "mint_transactions_raw_jjm"
+        )
+        partition = versions["versions"]["2"]["partitions"]["2023-01"]
+        assert partition["key_cols"] is None
+
+        # A delete-only delta holds just the deleted row
+        delta_df = Partitioned_Cache.read_file(
+            Partitioned_Cache.dataset_dir(str(cache_dir), "mint_transactions_raw_jjm"),
+            partition["delta"],
+        )
+        assert list(delta_df[Delta_Snapshots.op_col]) == ["delete"]
+
+        ret_df = Data_Getter_Utils().get_latest_file("mint_transactions_raw_jjm")
+        assert sorted(ret_df["description"]) == sorted(new_df["description"])
+
+    @staticmethod
+    def test_keyed_update_and_delete_round_trip():
+
+        base_df = pd.DataFrame(
+            data={
+                "date": pd.to_datetime(["2023-01-01", "2023-01-01", "2023-01-02"]),
+                "attribute": ["mood", "steps", "mood"],
+                "value": [3, 100, 4],
+            }
+        )
+        new_df = base_df.drop(index=[1]).reset_index(drop=True)
+        new_df.loc[1, "value"] = 5
+
+        delta_df = Delta_Snapshots.diff(base_df, new_df, ["date", "attribute"])
+
+        assert sorted(delta_df[Delta_Snapshots.op_col]) == ["delete", "upsert"]
+
+        ret_df = Delta_Snapshots.apply(base_df, delta_df, ["date", "attribute"])
+        ret_df = ret_df.sort_values(["date", "attribute"]).reset_index(drop=True)
+
+        assert ret_df.equals(new_df)
+
+    @staticmethod
+    def test_large_change_rebases(cache_dir, transactions_df):
+
+        Data_Getter_Utils.write_temp_cache(transactions_df, "mint_transactions_raw_jjm")
+
+        changed_df = transactions_df.assign(description="Renamed")
+        Data_Getter_Utils.write_temp_cache(changed_df, "mint_transactions_raw_jjm")
+
+        versions = Partitioned_Cache.load_versions(
+            str(cache_dir), "mint_transactions_raw_jjm"
+        )
+        for partition in versions["versions"]["2"]["partitions"].values():
+            assert "delta" not in partition
+
+
+class Test_Cache_Pushdown:
+    @staticmethod
+    @pytest.mark.parametrize("data_name", ["daily_finances_jjm", "finances_csv_jjm"])
+    def test_columns_and_filters(cache_dir, finance_df, data_name, monkeypatch):
+
+        monkeypatch.setattr(Data_Getter_Utils, "cache_format", "csv")
+        Data_Getter_Utils.write_temp_cache(finance_df, data_name)
+
+        ret_df = Data_Getter_Utils().get_latest_file(
+            data_name, columns=["category", "total"], filters=[("year", ">=", 2023)]
+        )
+
+        assert list(ret_df.columns) == ["category", "total"]
+        assert list(ret_df["total"]) == [-12.25]
+
+    @staticmethod
+    def test_parquet_filters_pushed_to_reader(cache_dir, finance_df):
+
+        Data_Getter_Utils.write_temp_cache(finance_df, "finances_parquet_jjm")
+
+        ret_df = Data_Getter_Utils().get_latest_file(
+            "finances_parquet_jjm",
+            columns=["total"],
+            filters=[("category", "in", ["food"]), ("month", "<", 12)],
+        )
+
+        assert sorted(ret_df["total"]) == [-25.5, -12.25]
+
+    @staticmethod
+    def test_filtered_out_partitions_not_read(cache_dir, transactions_df, monkeypatch):
+
+        Data_Getter_Utils.write_temp_cache(transactions_df, "mint_transactions_raw_jjm")
+
+        read_files = []
+        read_file = Partitioned_Cache.read_file
+
+        def tracked_read_file(dataset_dir, file, *args):
+            read_files.append(file)
+            return read_file(dataset_dir, file, *args)
+
+        monkeypatch.setattr(Partitioned_Cache, "read_file", tracked_read_file)
+
+        ret_df = Data_Getter_Utils().get_latest_file(
+            "mint_transactions_raw_jjm",
+            filters=[("date", ">=", pd.Timestamp("2022-12-15"))],
+        )
+
+        assert list(ret_df["amount"]) == [-12.25]
+        assert [x.split(os.sep)[0] for x in read_files] == ["2022-12", "2023-01"]
+
+
+@pytest.mark.skipif(
+    not Cache_Query_Engine.available(), reason="duckdb is not installed"
+)
+class Test_Cache_Query:
+    @staticmethod
+    @pytest.mark.parametrize("data_name", ["daily_finances_jjm", "finances_csv_jjm"])
+    def test_period_aggregate_matches_pandas(
+        cache_dir, finance_df, data_name, monkeypatch
+    ):
+
+        if data_name == "finances_csv_jjm":
+            monkeypatch.setattr(Data_Getter_Utils, "cache_format", "csv")
+
+        Data_Getter_Utils.write_temp_cache(finance_df, data_name)
+        query_engine = Cache_Query_Engine(str(cache_dir))
+
+        ret_df = query_engine.aggregate_period(
+            data_name, ["category"], ["total"], 2022, 12, 0, "quarter"
+        )
+
+        assert list(ret_df["category"]) == ["food", "paycheck"]
+        assert list(ret_df["total"]) == [-25.5, 3000.0]
+
+    @staticmethod
+    def test_partitioned_dataset_and_new_snapshot(cache_dir, transactions_df):
+
+        Data_Getter_Utils.write_temp_cache(transactions_df, "mint_transactions_raw_jjm")
+        query_engine = Cache_Query_Engine(str(cache_dir))
+
+        ret_df = query_engine.aggregate(
+            "mint_transactions_raw_jjm", ["name"], ["amount"]
+        )
+        assert list(ret_df["amount"]) == [-37.75, 3000.0]
+
+        # A later write shows up without a new engine
+        transactions_df.loc[2, "amount"] = -20.0
+        Data_Getter_Utils.write_temp_cache(transactions_df, "mint_transactions_raw_jjm")
+
+        ret_df = query_engine.aggregate(
+            "mint_transactions_raw_jjm", ["name"], ["amount"]
+        )
+        assert list(ret_df["amount"]) == [-45.5, 3000.0]